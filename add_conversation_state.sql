@@ -0,0 +1,18 @@
+-- Состояние диалогов бота (context.user_data) для нескольких реплик
+-- Выполнить этот скрипт в Supabase SQL Editor, если CONVERSATION_STATE_BACKEND=supabase
+--
+-- Например, после нажатия «Change weight» бот ждет вес порции текстом. Раньше это
+-- хранилось только в памяти процесса и терялось при рестарте или на другой реплике.
+-- Строка на пользователя; пустое состояние удаляется, устаревшее (TTL) чистит бот при старте.
+
+CREATE TABLE IF NOT EXISTS conversation_state (
+    user_id BIGINT PRIMARY KEY,  -- telegram id пользователя
+    data JSONB NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_state_updated_at ON conversation_state(updated_at);
+
+ALTER TABLE conversation_state DISABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE conversation_state IS 'context.user_data бота (ожидание ввода веса и т.п.), пишется пачками';
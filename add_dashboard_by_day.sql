@@ -0,0 +1,115 @@
+-- Группировка статистики по локальным дням на стороне БД
+-- Выполнить этот скрипт в Supabase SQL Editor ПОСЛЕ add_water_counter.sql
+-- и add_nutrition_densities.sql
+--
+-- get_dashboard возвращает ровно по строке на каждый день периода (day, КБЖУ, вода),
+-- включая пустые дни, поэтому ответ не растет с количеством записей, а недельный
+-- график строится без пересортировки в Python. Еда относится к дню по времени
+-- в часовом поясе бота (p_tz), а не по UTC-дате created_at.
+
+DROP FUNCTION IF EXISTS get_dashboard(BIGINT, DATE, DATE);
+
+CREATE OR REPLACE FUNCTION get_dashboard(
+    p_user_id BIGINT,
+    p_from DATE,
+    p_to DATE,
+    p_tz TEXT DEFAULT 'UTC'
+)
+RETURNS TABLE (day DATE, calories NUMERIC, protein NUMERIC, fats NUMERIC, carbs NUMERIC, water_ml INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH meals AS (
+        SELECT (nd.created_at AT TIME ZONE p_tz)::date AS day,
+               SUM(nd.calories) AS calories, SUM(nd.protein) AS protein,
+               SUM(nd.fats) AS fats, SUM(nd.carbs) AS carbs
+        FROM nutrition_data nd
+        JOIN food_images fi ON fi.id = nd.food_image_id
+        WHERE fi.user_id = p_user_id
+          AND nd.created_at >= (p_from::timestamp AT TIME ZONE p_tz)
+          AND nd.created_at < ((p_to + 1)::timestamp AT TIME ZONE p_tz)
+        GROUP BY 1
+    )
+    SELECT d.day::date,
+           COALESCE(m.calories, 0), COALESCE(m.protein, 0), COALESCE(m.fats, 0), COALESCE(m.carbs, 0),
+           COALESCE(r.water_ml, 0)
+    FROM generate_series(p_from, p_to, interval '1 day') AS d(day)
+    LEFT JOIN meals m ON m.day = d.day::date
+    LEFT JOIN daily_reports r ON r.user_id = p_user_id AND r.date = d.day::date
+    ORDER BY d.day;
+$$;
+
+-- Правка веса: разница попадает в дневной отчет локального дня записи
+DROP FUNCTION IF EXISTS rescale_nutrition(BIGINT, NUMERIC, BIGINT);
+
+CREATE OR REPLACE FUNCTION rescale_nutrition(
+    p_food_image_id BIGINT,
+    p_new_weight NUMERIC,
+    p_telegram_id BIGINT,
+    p_tz TEXT DEFAULT 'UTC'
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_id BIGINT;
+    v_old nutrition_data;
+    v_new nutrition_data;
+    v_factor NUMERIC;
+BEGIN
+    SELECT fi.user_id INTO v_user_id
+    FROM food_images fi
+    JOIN users u ON u.id = fi.user_id
+    WHERE fi.id = p_food_image_id AND u.telegram_id = p_telegram_id;
+    IF v_user_id IS NULL OR p_new_weight <= 0 THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT * INTO v_old
+    FROM nutrition_data
+    WHERE food_image_id = p_food_image_id
+    ORDER BY created_at DESC
+    LIMIT 1
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    IF v_old.calories_per_100g IS NOT NULL THEN
+        UPDATE nutrition_data SET
+            calories = ROUND(calories_per_100g * p_new_weight / 100, 1),
+            protein = ROUND(protein_per_100g * p_new_weight / 100, 1),
+            fats = ROUND(fats_per_100g * p_new_weight / 100, 1),
+            carbs = ROUND(carbs_per_100g * p_new_weight / 100, 1),
+            weight_grams = p_new_weight
+        WHERE id = v_old.id
+        RETURNING * INTO v_new;
+    ELSE
+        -- Старые записи без веса: прежний пропорциональный пересчет
+        v_factor := CASE WHEN COALESCE(v_old.weight_grams, 0) > 0 THEN p_new_weight / v_old.weight_grams ELSE 1 END;
+        UPDATE nutrition_data SET
+            calories = ROUND(v_old.calories * v_factor, 1),
+            protein = ROUND(v_old.protein * v_factor, 1),
+            fats = ROUND(v_old.fats * v_factor, 1),
+            carbs = ROUND(v_old.carbs * v_factor, 1),
+            weight_grams = p_new_weight,
+            calories_per_100g = v_old.calories * 100 / p_new_weight * v_factor,
+            protein_per_100g = v_old.protein * 100 / p_new_weight * v_factor,
+            fats_per_100g = v_old.fats * 100 / p_new_weight * v_factor,
+            carbs_per_100g = v_old.carbs * 100 / p_new_weight * v_factor
+        WHERE id = v_old.id
+        RETURNING * INTO v_new;
+    END IF;
+
+    UPDATE daily_reports SET
+        total_calories = total_calories + (v_new.calories - v_old.calories),
+        total_protein = total_protein + (v_new.protein - v_old.protein),
+        total_fats = total_fats + (v_new.fats - v_old.fats),
+        total_carbs = total_carbs + (v_new.carbs - v_old.carbs)
+    WHERE user_id = v_user_id AND date = (v_old.created_at AT TIME ZONE p_tz)::date;
+
+    RETURN to_jsonb(v_new);
+END;
+$$;
+
+COMMENT ON FUNCTION get_dashboard(BIGINT, DATE, DATE, TEXT) IS 'КБЖУ и вода по локальным дням периода (строка на каждый день)';
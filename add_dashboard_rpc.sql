@@ -0,0 +1,48 @@
+-- Данные для /stats, /week и экранов меню одним RPC-вызовом
+-- Выполнить этот скрипт в Supabase SQL Editor
+--
+-- Раньше каждый экран делал последовательно: select всех food_images пользователя ->
+-- select nutrition_data по списку id -> select water_intake. Функция возвращает суммы
+-- КБЖУ за период (JOIN по food_images.user_id) и воду по дням за один round trip.
+
+CREATE OR REPLACE FUNCTION get_dashboard(
+    p_user_id BIGINT,
+    p_from DATE,
+    p_to DATE
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'nutrition', (
+            SELECT jsonb_build_object(
+                'calories', COALESCE(SUM(nd.calories), 0),
+                'protein', COALESCE(SUM(nd.protein), 0),
+                'fats', COALESCE(SUM(nd.fats), 0),
+                'carbs', COALESCE(SUM(nd.carbs), 0)
+            )
+            FROM nutrition_data nd
+            JOIN food_images fi ON fi.id = nd.food_image_id
+            WHERE fi.user_id = p_user_id
+              AND nd.created_at >= p_from::timestamptz
+              AND nd.created_at < (p_to + 1)::timestamptz
+        ),
+        'water_by_day', (
+            SELECT COALESCE(jsonb_object_agg(day, amount_ml), '{}'::jsonb)
+            FROM (
+                SELECT created_at::date AS day, SUM(amount_ml) AS amount_ml
+                FROM water_intake
+                WHERE user_id = p_user_id
+                  AND created_at >= p_from::timestamptz
+                  AND created_at < (p_to + 1)::timestamptz
+                GROUP BY created_at::date
+            ) per_day
+        )
+    );
+$$;
+
+-- Выборка КБЖУ за период идет от пользователя через food_images
+CREATE INDEX IF NOT EXISTS idx_water_intake_user_created ON water_intake(user_id, created_at);
+
+COMMENT ON FUNCTION get_dashboard(BIGINT, DATE, DATE) IS 'Суммы КБЖУ и вода по дням за период для экранов статистики';
@@ -0,0 +1,8 @@
+-- Поддержка локального фильтра фото (status = 'rejected')
+-- Выполнить этот скрипт в Supabase SQL Editor
+
+-- Причина отказа: too_dark, blank, blurry, screenshot
+ALTER TABLE food_images
+ADD COLUMN IF NOT EXISTS rejection_reason TEXT;
+
+COMMENT ON COLUMN food_images.rejection_reason IS 'Причина, по которой локальный фильтр отклонил фото без вызова OpenAI';
@@ -0,0 +1,284 @@
+-- КБЖУ на 100 г в nutrition_data: изменение веса порции — чистая функция нового веса
+-- Выполнить этот скрипт в Supabase SQL Editor ПОСЛЕ add_record_analysis_rpc.sql,
+-- add_text_meal_rpc.sql, add_recent_meals.sql и add_rescale_nutrition_rpc.sql
+-- (функции ниже пересоздаются с новыми колонками)
+--
+-- Раньше пересчет брал коэффициент от текущего weight_grams и округлял каждое значение,
+-- поэтому ошибка округления накапливалась при повторных правках, а каждая правка
+-- требовала прочитать текущую строку. Теперь значения = плотность * вес / 100.
+
+ALTER TABLE nutrition_data
+ADD COLUMN IF NOT EXISTS calories_per_100g DECIMAL(10,4),
+ADD COLUMN IF NOT EXISTS protein_per_100g DECIMAL(10,4),
+ADD COLUMN IF NOT EXISTS fats_per_100g DECIMAL(10,4),
+ADD COLUMN IF NOT EXISTS carbs_per_100g DECIMAL(10,4);
+
+ALTER TABLE user_meal_stats
+ADD COLUMN IF NOT EXISTS calories_per_100g DECIMAL(10,4),
+ADD COLUMN IF NOT EXISTS protein_per_100g DECIMAL(10,4),
+ADD COLUMN IF NOT EXISTS fats_per_100g DECIMAL(10,4),
+ADD COLUMN IF NOT EXISTS carbs_per_100g DECIMAL(10,4);
+
+-- Старые записи: выводим плотность из итогов и веса (где вес известен)
+UPDATE nutrition_data SET
+    calories_per_100g = calories * 100 / weight_grams,
+    protein_per_100g = protein * 100 / weight_grams,
+    fats_per_100g = fats * 100 / weight_grams,
+    carbs_per_100g = carbs * 100 / weight_grams
+WHERE calories_per_100g IS NULL AND weight_grams > 0;
+
+UPDATE user_meal_stats SET
+    calories_per_100g = calories * 100 / weight_grams,
+    protein_per_100g = protein * 100 / weight_grams,
+    fats_per_100g = fats * 100 / weight_grams,
+    carbs_per_100g = carbs * 100 / weight_grams
+WHERE calories_per_100g IS NULL AND weight_grams > 0;
+
+-- Запись результата анализа фото (см. add_record_analysis_rpc.sql) — с плотностями
+CREATE OR REPLACE FUNCTION record_analysis(
+    p_user_id BIGINT,
+    p_image_url TEXT,
+    p_nutrition JSONB,
+    p_report_date DATE,
+    p_food_image_id BIGINT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_food_image_id BIGINT := p_food_image_id;
+    v_nutrition nutrition_data;
+BEGIN
+    IF v_food_image_id IS NULL THEN
+        INSERT INTO food_images (user_id, image_url, status)
+        VALUES (p_user_id, p_image_url, 'processed')
+        RETURNING id INTO v_food_image_id;
+    ELSE
+        UPDATE food_images SET status = 'processed' WHERE id = v_food_image_id;
+    END IF;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams,
+                                calories_per_100g, protein_per_100g, fats_per_100g, carbs_per_100g)
+    SELECT v_food_image_id, r.calories, r.protein, r.fats, r.carbs, r.food_name, r.confidence, r.weight_grams,
+           r.calories_per_100g, r.protein_per_100g, r.fats_per_100g, r.carbs_per_100g
+    FROM jsonb_populate_record(NULL::nutrition_data, p_nutrition) AS r
+    RETURNING * INTO v_nutrition;
+
+    UPDATE users
+    SET photos_analyzed = COALESCE(photos_analyzed, 0) + 1,
+        total_photos_sent = COALESCE(total_photos_sent, 0) + CASE WHEN p_food_image_id IS NULL THEN 1 ELSE 0 END
+    WHERE id = p_user_id;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_nutrition.calories, v_nutrition.protein, v_nutrition.fats, v_nutrition.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'nutrition', to_jsonb(v_nutrition)
+    );
+END;
+$$;
+
+-- Запись еды из текста (см. add_text_meal_rpc.sql) — с плотностями из локальной базы продуктов
+CREATE OR REPLACE FUNCTION record_text_meal(
+    p_user_id BIGINT,
+    p_text TEXT,
+    p_items JSONB,
+    p_report_date DATE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_food_image_id BIGINT;
+    v_totals RECORD;
+BEGIN
+    INSERT INTO food_images (user_id, image_url, status)
+    VALUES (p_user_id, 'text:' || p_text, 'processed')
+    RETURNING id INTO v_food_image_id;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams,
+                                calories_per_100g, protein_per_100g, fats_per_100g, carbs_per_100g)
+    SELECT v_food_image_id, r.calories, r.protein, r.fats, r.carbs, r.food_name, r.confidence, r.weight_grams,
+           r.calories_per_100g, r.protein_per_100g, r.fats_per_100g, r.carbs_per_100g
+    FROM jsonb_populate_recordset(NULL::nutrition_data, p_items) AS r;
+
+    SELECT COALESCE(SUM(calories), 0) AS calories, COALESCE(SUM(protein), 0) AS protein,
+           COALESCE(SUM(fats), 0) AS fats, COALESCE(SUM(carbs), 0) AS carbs
+    INTO v_totals
+    FROM nutrition_data
+    WHERE food_image_id = v_food_image_id;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_totals.calories, v_totals.protein, v_totals.fats, v_totals.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'totals', to_jsonb(v_totals)
+    );
+END;
+$$;
+
+-- Частые блюда (см. add_recent_meals.sql): запоминаем и плотности последней записи
+CREATE OR REPLACE FUNCTION track_user_meal_stats()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_id BIGINT;
+BEGIN
+    IF NEW.food_name IS NULL OR NEW.food_name = 'unknown' OR NEW.calories <= 0 THEN
+        RETURN NEW;
+    END IF;
+
+    SELECT user_id INTO v_user_id FROM food_images WHERE id = NEW.food_image_id;
+    IF v_user_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO user_meal_stats (user_id, food_name, times_logged, last_logged_at, calories, protein, fats, carbs, weight_grams,
+                                 calories_per_100g, protein_per_100g, fats_per_100g, carbs_per_100g)
+    VALUES (v_user_id, NEW.food_name, 1, COALESCE(NEW.created_at, NOW()), NEW.calories, NEW.protein, NEW.fats, NEW.carbs, NEW.weight_grams,
+            NEW.calories_per_100g, NEW.protein_per_100g, NEW.fats_per_100g, NEW.carbs_per_100g)
+    ON CONFLICT (user_id, food_name) DO UPDATE SET
+        times_logged = user_meal_stats.times_logged + 1,
+        last_logged_at = EXCLUDED.last_logged_at,
+        calories = EXCLUDED.calories,
+        protein = EXCLUDED.protein,
+        fats = EXCLUDED.fats,
+        carbs = EXCLUDED.carbs,
+        weight_grams = EXCLUDED.weight_grams,
+        calories_per_100g = EXCLUDED.calories_per_100g,
+        protein_per_100g = EXCLUDED.protein_per_100g,
+        fats_per_100g = EXCLUDED.fats_per_100g,
+        carbs_per_100g = EXCLUDED.carbs_per_100g;
+
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION relog_meal(
+    p_user_id BIGINT,
+    p_meal_id BIGINT,
+    p_report_date DATE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_meal user_meal_stats;
+    v_food_image_id BIGINT;
+    v_nutrition nutrition_data;
+BEGIN
+    SELECT * INTO v_meal FROM user_meal_stats WHERE id = p_meal_id AND user_id = p_user_id;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO food_images (user_id, image_url, status)
+    VALUES (p_user_id, 'relog:' || v_meal.food_name, 'processed')
+    RETURNING id INTO v_food_image_id;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams,
+                                calories_per_100g, protein_per_100g, fats_per_100g, carbs_per_100g)
+    VALUES (v_food_image_id, v_meal.calories, v_meal.protein, v_meal.fats, v_meal.carbs, v_meal.food_name, 1, v_meal.weight_grams,
+            v_meal.calories_per_100g, v_meal.protein_per_100g, v_meal.fats_per_100g, v_meal.carbs_per_100g)
+    RETURNING * INTO v_nutrition;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_nutrition.calories, v_nutrition.protein, v_nutrition.fats, v_nutrition.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'nutrition', to_jsonb(v_nutrition)
+    );
+END;
+$$;
+
+-- Изменение веса (см. add_rescale_nutrition_rpc.sql): при известных плотностях
+-- новые значения зависят только от нового веса, а не от текущей строки
+CREATE OR REPLACE FUNCTION rescale_nutrition(
+    p_food_image_id BIGINT,
+    p_new_weight NUMERIC,
+    p_telegram_id BIGINT
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_id BIGINT;
+    v_old nutrition_data;
+    v_new nutrition_data;
+    v_factor NUMERIC;
+BEGIN
+    SELECT fi.user_id INTO v_user_id
+    FROM food_images fi
+    JOIN users u ON u.id = fi.user_id
+    WHERE fi.id = p_food_image_id AND u.telegram_id = p_telegram_id;
+    IF v_user_id IS NULL OR p_new_weight <= 0 THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT * INTO v_old
+    FROM nutrition_data
+    WHERE food_image_id = p_food_image_id
+    ORDER BY created_at DESC
+    LIMIT 1
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    IF v_old.calories_per_100g IS NOT NULL THEN
+        UPDATE nutrition_data SET
+            calories = ROUND(calories_per_100g * p_new_weight / 100, 1),
+            protein = ROUND(protein_per_100g * p_new_weight / 100, 1),
+            fats = ROUND(fats_per_100g * p_new_weight / 100, 1),
+            carbs = ROUND(carbs_per_100g * p_new_weight / 100, 1),
+            weight_grams = p_new_weight
+        WHERE id = v_old.id
+        RETURNING * INTO v_new;
+    ELSE
+        -- Старые записи без веса: прежний пропорциональный пересчет
+        v_factor := CASE WHEN COALESCE(v_old.weight_grams, 0) > 0 THEN p_new_weight / v_old.weight_grams ELSE 1 END;
+        UPDATE nutrition_data SET
+            calories = ROUND(v_old.calories * v_factor, 1),
+            protein = ROUND(v_old.protein * v_factor, 1),
+            fats = ROUND(v_old.fats * v_factor, 1),
+            carbs = ROUND(v_old.carbs * v_factor, 1),
+            weight_grams = p_new_weight,
+            calories_per_100g = v_old.calories * 100 / p_new_weight * v_factor,
+            protein_per_100g = v_old.protein * 100 / p_new_weight * v_factor,
+            fats_per_100g = v_old.fats * 100 / p_new_weight * v_factor,
+            carbs_per_100g = v_old.carbs * 100 / p_new_weight * v_factor
+        WHERE id = v_old.id
+        RETURNING * INTO v_new;
+    END IF;
+
+    UPDATE daily_reports SET
+        total_calories = total_calories + (v_new.calories - v_old.calories),
+        total_protein = total_protein + (v_new.protein - v_old.protein),
+        total_fats = total_fats + (v_new.fats - v_old.fats),
+        total_carbs = total_carbs + (v_new.carbs - v_old.carbs)
+    WHERE user_id = v_user_id AND date = v_old.created_at::date;
+
+    RETURN to_jsonb(v_new);
+END;
+$$;
+
+COMMENT ON COLUMN nutrition_data.calories_per_100g IS 'Калорийность блюда на 100 г (для пересчета под новый вес без накопления ошибки)';
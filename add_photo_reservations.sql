@@ -0,0 +1,114 @@
+-- Резервирование бесплатных анализов фото в момент постановки в очередь
+-- Выполнить этот скрипт в Supabase SQL Editor ПОСЛЕ add_nutrition_densities.sql
+--
+-- photos_analyzed растет только после анализа в воркере, поэтому пачка фото,
+-- отправленная подряд, проходила проверку лимита целиком. Теперь хендлер атомарно
+-- занимает место (photos_pending) условным UPDATE, record_analysis превращает
+-- резерв в photos_analyzed, а отказ или ошибка анализа резерв освобождает.
+
+ALTER TABLE users
+ADD COLUMN IF NOT EXISTS photos_pending INTEGER DEFAULT 0;
+
+-- TRUE — место занято; FALSE — лимит исчерпан с учетом фото в очереди
+CREATE OR REPLACE FUNCTION reserve_photo_analysis(
+    p_user_id BIGINT,
+    p_limit INTEGER
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE users
+    SET photos_pending = COALESCE(photos_pending, 0) + 1
+    WHERE id = p_user_id
+      AND COALESCE(photos_analyzed, 0) + COALESCE(photos_pending, 0) < p_limit;
+    RETURN FOUND;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION release_photo_reservation(p_user_id BIGINT)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE users
+    SET photos_pending = GREATEST(COALESCE(photos_pending, 0) - 1, 0)
+    WHERE id = p_user_id;
+$$;
+
+-- Запись результата анализа (см. add_nutrition_densities.sql): p_reserved — фото
+-- прошло по резерву, он списывается в той же транзакции. Повторная запись уже
+-- обработанного фото (повтор задачи, переанализ) ничего не добавляет и возвращает
+-- сохраненный результат — иначе блюдо попало бы в отчет дважды
+DROP FUNCTION IF EXISTS record_analysis(BIGINT, TEXT, JSONB, DATE, BIGINT);
+
+CREATE OR REPLACE FUNCTION record_analysis(
+    p_user_id BIGINT,
+    p_image_url TEXT,
+    p_nutrition JSONB,
+    p_report_date DATE,
+    p_food_image_id BIGINT DEFAULT NULL,
+    p_reserved BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_food_image_id BIGINT := p_food_image_id;
+    v_nutrition nutrition_data;
+    v_status TEXT;
+BEGIN
+    IF v_food_image_id IS NOT NULL THEN
+        SELECT status INTO v_status FROM food_images WHERE id = v_food_image_id FOR UPDATE;
+        IF v_status = 'processed' THEN
+            SELECT * INTO v_nutrition FROM nutrition_data
+            WHERE food_image_id = v_food_image_id
+            ORDER BY id DESC
+            LIMIT 1;
+            IF p_reserved THEN
+                PERFORM release_photo_reservation(p_user_id);
+            END IF;
+            RETURN jsonb_build_object(
+                'food_image_id', v_food_image_id,
+                'nutrition', to_jsonb(v_nutrition)
+            );
+        END IF;
+    END IF;
+
+    IF v_food_image_id IS NULL THEN
+        INSERT INTO food_images (user_id, image_url, status)
+        VALUES (p_user_id, p_image_url, 'processed')
+        RETURNING id INTO v_food_image_id;
+    ELSE
+        UPDATE food_images SET status = 'processed' WHERE id = v_food_image_id;
+    END IF;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams,
+                                calories_per_100g, protein_per_100g, fats_per_100g, carbs_per_100g)
+    SELECT v_food_image_id, r.calories, r.protein, r.fats, r.carbs, r.food_name, r.confidence, r.weight_grams,
+           r.calories_per_100g, r.protein_per_100g, r.fats_per_100g, r.carbs_per_100g
+    FROM jsonb_populate_record(NULL::nutrition_data, p_nutrition) AS r
+    RETURNING * INTO v_nutrition;
+
+    UPDATE users
+    SET photos_analyzed = COALESCE(photos_analyzed, 0) + 1,
+        photos_pending = CASE WHEN p_reserved THEN GREATEST(COALESCE(photos_pending, 0) - 1, 0)
+                              ELSE COALESCE(photos_pending, 0) END,
+        total_photos_sent = COALESCE(total_photos_sent, 0) + CASE WHEN p_food_image_id IS NULL THEN 1 ELSE 0 END
+    WHERE id = p_user_id;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_nutrition.calories, v_nutrition.protein, v_nutrition.fats, v_nutrition.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'nutrition', to_jsonb(v_nutrition)
+    );
+END;
+$$;
+
+COMMENT ON COLUMN users.photos_pending IS 'Бесплатные анализы фото, зарезервированные в очереди и еще не записанные';
@@ -0,0 +1,121 @@
+-- Быстрая повторная запись частых блюд («Recent meals»)
+-- Выполнить этот скрипт в Supabase SQL Editor
+--
+-- user_meal_stats — индекс «самых частых блюд» пользователя по nutrition_data.food_name.
+-- Поддерживается триггером на вставку в nutrition_data, поэтому меню читает
+-- несколько строк по индексу вместо агрегации по всей истории.
+
+CREATE TABLE IF NOT EXISTS user_meal_stats (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    food_name VARCHAR(255) NOT NULL,
+    times_logged INTEGER NOT NULL DEFAULT 0,
+    last_logged_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    -- КБЖУ последней записи блюда: их и копирует повторная запись
+    calories DECIMAL(10,2) NOT NULL,
+    protein DECIMAL(10,2) NOT NULL,
+    fats DECIMAL(10,2) NOT NULL,
+    carbs DECIMAL(10,2) NOT NULL,
+    weight_grams DECIMAL(10,2),
+    UNIQUE (user_id, food_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_meal_stats_top
+ON user_meal_stats(user_id, times_logged DESC, last_logged_at DESC);
+
+ALTER TABLE user_meal_stats DISABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION track_user_meal_stats()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_id BIGINT;
+BEGIN
+    -- Пустые результаты («не еда») в избранное не попадают
+    IF NEW.food_name IS NULL OR NEW.food_name = 'unknown' OR NEW.calories <= 0 THEN
+        RETURN NEW;
+    END IF;
+
+    SELECT user_id INTO v_user_id FROM food_images WHERE id = NEW.food_image_id;
+    IF v_user_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO user_meal_stats (user_id, food_name, times_logged, last_logged_at, calories, protein, fats, carbs, weight_grams)
+    VALUES (v_user_id, NEW.food_name, 1, COALESCE(NEW.created_at, NOW()), NEW.calories, NEW.protein, NEW.fats, NEW.carbs, NEW.weight_grams)
+    ON CONFLICT (user_id, food_name) DO UPDATE SET
+        times_logged = user_meal_stats.times_logged + 1,
+        last_logged_at = EXCLUDED.last_logged_at,
+        calories = EXCLUDED.calories,
+        protein = EXCLUDED.protein,
+        fats = EXCLUDED.fats,
+        carbs = EXCLUDED.carbs,
+        weight_grams = EXCLUDED.weight_grams;
+
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_track_user_meal_stats ON nutrition_data;
+CREATE TRIGGER trg_track_user_meal_stats
+AFTER INSERT ON nutrition_data
+FOR EACH ROW EXECUTE FUNCTION track_user_meal_stats();
+
+-- Заполняем индекс по уже накопленной истории (последние КБЖУ каждого блюда)
+INSERT INTO user_meal_stats (user_id, food_name, times_logged, last_logged_at, calories, protein, fats, carbs, weight_grams)
+SELECT DISTINCT ON (fi.user_id, nd.food_name)
+       fi.user_id, nd.food_name,
+       COUNT(*) OVER (PARTITION BY fi.user_id, nd.food_name),
+       nd.created_at, nd.calories, nd.protein, nd.fats, nd.carbs, nd.weight_grams
+FROM nutrition_data nd
+JOIN food_images fi ON fi.id = nd.food_image_id
+WHERE nd.food_name <> 'unknown' AND nd.calories > 0
+ORDER BY fi.user_id, nd.food_name, nd.created_at DESC
+ON CONFLICT (user_id, food_name) DO NOTHING;
+
+-- Повторная запись блюда: копирует КБЖУ из user_meal_stats, без скачивания и анализа фото.
+-- Фото-счетчики не меняются; статистика блюда обновится триггером.
+CREATE OR REPLACE FUNCTION relog_meal(
+    p_user_id BIGINT,
+    p_meal_id BIGINT,
+    p_report_date DATE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_meal user_meal_stats;
+    v_food_image_id BIGINT;
+    v_nutrition nutrition_data;
+BEGIN
+    SELECT * INTO v_meal FROM user_meal_stats WHERE id = p_meal_id AND user_id = p_user_id;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO food_images (user_id, image_url, status)
+    VALUES (p_user_id, 'relog:' || v_meal.food_name, 'processed')
+    RETURNING id INTO v_food_image_id;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams)
+    VALUES (v_food_image_id, v_meal.calories, v_meal.protein, v_meal.fats, v_meal.carbs, v_meal.food_name, 1, v_meal.weight_grams)
+    RETURNING * INTO v_nutrition;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_nutrition.calories, v_nutrition.protein, v_nutrition.fats, v_nutrition.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'nutrition', to_jsonb(v_nutrition)
+    );
+END;
+$$;
+
+COMMENT ON TABLE user_meal_stats IS 'Частые блюда пользователя (поддерживается триггером на nutrition_data)';
+COMMENT ON FUNCTION relog_meal(BIGINT, BIGINT, DATE) IS 'Повторная запись блюда из user_meal_stats одним вызовом, без анализа фото';
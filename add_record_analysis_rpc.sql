@@ -0,0 +1,60 @@
+-- Транзакционная запись результата анализа фото одним RPC-вызовом
+-- Выполнить этот скрипт в Supabase SQL Editor
+--
+-- Заменяет цепочку create_food_image -> increment_total_photos_sent ->
+-- create_nutrition_data -> update_food_image_status -> _update_daily_report ->
+-- increment_photos_analyzed (около десяти запросов) одним round trip.
+--
+-- p_food_image_id = NULL  -> запись о фото создаётся сразу в статусе 'processed'
+--                            и увеличивается users.total_photos_sent
+-- p_food_image_id задан   -> существующая запись (например, переанализ зависшего фото)
+--                            переводится в 'processed'
+
+CREATE OR REPLACE FUNCTION record_analysis(
+    p_user_id BIGINT,
+    p_image_url TEXT,
+    p_nutrition JSONB,
+    p_report_date DATE,
+    p_food_image_id BIGINT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_food_image_id BIGINT := p_food_image_id;
+    v_nutrition nutrition_data;
+BEGIN
+    IF v_food_image_id IS NULL THEN
+        INSERT INTO food_images (user_id, image_url, status)
+        VALUES (p_user_id, p_image_url, 'processed')
+        RETURNING id INTO v_food_image_id;
+    ELSE
+        UPDATE food_images SET status = 'processed' WHERE id = v_food_image_id;
+    END IF;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams)
+    SELECT v_food_image_id, r.calories, r.protein, r.fats, r.carbs, r.food_name, r.confidence, r.weight_grams
+    FROM jsonb_populate_record(NULL::nutrition_data, p_nutrition) AS r
+    RETURNING * INTO v_nutrition;
+
+    UPDATE users
+    SET photos_analyzed = COALESCE(photos_analyzed, 0) + 1,
+        total_photos_sent = COALESCE(total_photos_sent, 0) + CASE WHEN p_food_image_id IS NULL THEN 1 ELSE 0 END
+    WHERE id = p_user_id;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_nutrition.calories, v_nutrition.protein, v_nutrition.fats, v_nutrition.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'nutrition', to_jsonb(v_nutrition)
+    );
+END;
+$$;
+
+COMMENT ON FUNCTION record_analysis(BIGINT, TEXT, JSONB, DATE, BIGINT) IS 'Атомарная запись результата анализа фото: фото, КБЖУ, счётчики, дневной отчёт';
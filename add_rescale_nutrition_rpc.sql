@@ -0,0 +1,64 @@
+-- Изменение веса порции одним RPC-вызовом (кнопка «Change weight»)
+-- Выполнить этот скрипт в Supabase SQL Editor
+--
+-- Заменяет цепочку select nutrition_data -> update -> select food_images ->
+-- пересчет дневного отчета -> повторный select для экрана. КБЖУ последней записи
+-- о фото пересчитываются пропорционально новому весу, в дневной отчет того дня,
+-- когда запись была создана, добавляется разница. Возвращается обновленная строка
+-- nutrition_data (или NULL, если фото не найдено / принадлежит другому пользователю).
+
+CREATE OR REPLACE FUNCTION rescale_nutrition(
+    p_food_image_id BIGINT,
+    p_new_weight NUMERIC,
+    p_telegram_id BIGINT
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_id BIGINT;
+    v_old nutrition_data;
+    v_new nutrition_data;
+    v_factor NUMERIC;
+BEGIN
+    SELECT fi.user_id INTO v_user_id
+    FROM food_images fi
+    JOIN users u ON u.id = fi.user_id
+    WHERE fi.id = p_food_image_id AND u.telegram_id = p_telegram_id;
+    IF v_user_id IS NULL OR p_new_weight <= 0 THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT * INTO v_old
+    FROM nutrition_data
+    WHERE food_image_id = p_food_image_id
+    ORDER BY created_at DESC
+    LIMIT 1
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    v_factor := CASE WHEN COALESCE(v_old.weight_grams, 0) > 0 THEN p_new_weight / v_old.weight_grams ELSE 1 END;
+
+    UPDATE nutrition_data SET
+        calories = ROUND(v_old.calories * v_factor, 1),
+        protein = ROUND(v_old.protein * v_factor, 1),
+        fats = ROUND(v_old.fats * v_factor, 1),
+        carbs = ROUND(v_old.carbs * v_factor, 1),
+        weight_grams = p_new_weight
+    WHERE id = v_old.id
+    RETURNING * INTO v_new;
+
+    UPDATE daily_reports SET
+        total_calories = total_calories + (v_new.calories - v_old.calories),
+        total_protein = total_protein + (v_new.protein - v_old.protein),
+        total_fats = total_fats + (v_new.fats - v_old.fats),
+        total_carbs = total_carbs + (v_new.carbs - v_old.carbs)
+    WHERE user_id = v_user_id AND date = v_old.created_at::date;
+
+    RETURN to_jsonb(v_new);
+END;
+$$;
+
+COMMENT ON FUNCTION rescale_nutrition(BIGINT, NUMERIC, BIGINT) IS 'Пропорциональный пересчет КБЖУ под новый вес порции с поправкой дневного отчета';
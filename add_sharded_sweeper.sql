@@ -0,0 +1,39 @@
+-- Переанализ зависших фото в режиме шардирования (run_sharded.py)
+-- Выполнить этот скрипт в Supabase SQL Editor ПОСЛЕ add_stale_images_sweeper.sql
+--
+-- Переанализ работает в каждом воркере и берет только фото пользователей своего
+-- шарда (telegram_id % p_shard_count = p_shard_index, как у фронтенда). Так он
+-- видит их в своей очереди анализа и сбрасывает кэш отчетов того процесса, где
+-- эти пользователи читают /stats. Формат строк — как у запроса без шардирования.
+
+CREATE OR REPLACE FUNCTION get_stale_food_images_shard(
+    p_statuses TEXT[],
+    p_older_than TIMESTAMPTZ,
+    p_max_attempts INTEGER,
+    p_limit INTEGER,
+    p_shard_count INTEGER,
+    p_shard_index INTEGER
+)
+RETURNS TABLE (
+    id BIGINT,
+    user_id BIGINT,
+    image_url TEXT,
+    status TEXT,
+    uploaded_at TIMESTAMPTZ,
+    sweep_attempts INTEGER,
+    users JSONB
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT f.id, f.user_id, f.image_url, f.status::TEXT, f.uploaded_at, f.sweep_attempts,
+           jsonb_build_object('telegram_id', u.telegram_id)
+    FROM food_images f
+    JOIN users u ON u.id = f.user_id
+    WHERE f.status = ANY(p_statuses)
+      AND f.uploaded_at < p_older_than
+      AND f.sweep_attempts < p_max_attempts
+      AND u.telegram_id % p_shard_count = p_shard_index
+    ORDER BY f.uploaded_at
+    LIMIT p_limit;
+$$;
@@ -0,0 +1,13 @@
+-- Поддержка фонового переанализа зависших фото (status = 'processing' / 'error')
+-- Выполнить этот скрипт в Supabase SQL Editor
+
+-- Счётчик попыток повторного анализа, чтобы не крутить одно и то же фото бесконечно
+ALTER TABLE food_images
+ADD COLUMN IF NOT EXISTS sweep_attempts INTEGER NOT NULL DEFAULT 0;
+
+-- Частичный индекс: в нём только "проблемные" строки, поэтому он остаётся маленьким
+CREATE INDEX IF NOT EXISTS idx_food_images_stale
+ON food_images(status, uploaded_at)
+WHERE status IN ('processing', 'error');
+
+COMMENT ON COLUMN food_images.sweep_attempts IS 'Количество попыток фонового переанализа фото';
@@ -0,0 +1,51 @@
+-- Запись приема пищи, введенного текстом («200g rice, 2 eggs»), одним RPC-вызовом
+-- Выполнить этот скрипт в Supabase SQL Editor
+--
+-- КБЖУ считаются локально по таблице продуктов (data/foods.csv), без вызова OpenAI.
+-- Создается одна запись в food_images (image_url = 'text:<исходный текст>', статус 'processed'),
+-- чтобы текстовые записи попадали в те же отчеты, что и фото. Счетчики фото
+-- (photos_analyzed, total_photos_sent) не меняются: текстовый ввод не расходует лимит.
+
+CREATE OR REPLACE FUNCTION record_text_meal(
+    p_user_id BIGINT,
+    p_text TEXT,
+    p_items JSONB,
+    p_report_date DATE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_food_image_id BIGINT;
+    v_totals RECORD;
+BEGIN
+    INSERT INTO food_images (user_id, image_url, status)
+    VALUES (p_user_id, 'text:' || p_text, 'processed')
+    RETURNING id INTO v_food_image_id;
+
+    INSERT INTO nutrition_data (food_image_id, calories, protein, fats, carbs, food_name, confidence, weight_grams)
+    SELECT v_food_image_id, r.calories, r.protein, r.fats, r.carbs, r.food_name, r.confidence, r.weight_grams
+    FROM jsonb_populate_recordset(NULL::nutrition_data, p_items) AS r;
+
+    SELECT COALESCE(SUM(calories), 0) AS calories, COALESCE(SUM(protein), 0) AS protein,
+           COALESCE(SUM(fats), 0) AS fats, COALESCE(SUM(carbs), 0) AS carbs
+    INTO v_totals
+    FROM nutrition_data
+    WHERE food_image_id = v_food_image_id;
+
+    INSERT INTO daily_reports (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (p_user_id, p_report_date, v_totals.calories, v_totals.protein, v_totals.fats, v_totals.carbs)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_calories = daily_reports.total_calories + EXCLUDED.total_calories,
+        total_protein = daily_reports.total_protein + EXCLUDED.total_protein,
+        total_fats = daily_reports.total_fats + EXCLUDED.total_fats,
+        total_carbs = daily_reports.total_carbs + EXCLUDED.total_carbs;
+
+    RETURN jsonb_build_object(
+        'food_image_id', v_food_image_id,
+        'totals', to_jsonb(v_totals)
+    );
+END;
+$$;
+
+COMMENT ON FUNCTION record_text_meal(BIGINT, TEXT, JSONB, DATE) IS 'Атомарная запись приема пищи из текста: позиции КБЖУ и дневной отчет, без счетчиков фото';
@@ -0,0 +1,86 @@
+-- Счетчик воды за день в daily_reports вместо суммирования water_intake на каждое нажатие
+-- Выполнить этот скрипт в Supabase SQL Editor ПОСЛЕ add_dashboard_rpc.sql
+--
+-- Нажатие «Water +250ml» раньше делало insert в water_intake и затем читало и суммировало
+-- все записи за день. Теперь add_water() атомарно увеличивает daily_reports.water_ml
+-- (upsert по (user_id, date)) и сразу возвращает новый итог: один вызов, O(1) работы.
+-- water_intake остается журналом отдельных нажатий.
+
+ALTER TABLE daily_reports
+ADD COLUMN IF NOT EXISTS water_ml INTEGER NOT NULL DEFAULT 0;
+
+-- Переносим уже накопленную воду в счетчики. День — локальный, как у add_water и
+-- экранов статистики: ЗАМЕНИТЕ 'UTC' на значение TIMEZONE бота (например, 'Europe/Moscow'),
+-- иначе записи около полуночи попадут не в тот день
+DO $$
+DECLARE
+    v_tz TEXT := 'UTC';
+BEGIN
+    INSERT INTO daily_reports (user_id, date, water_ml)
+    SELECT user_id, (created_at AT TIME ZONE v_tz)::date, SUM(amount_ml)
+    FROM water_intake
+    GROUP BY user_id, (created_at AT TIME ZONE v_tz)::date
+    ON CONFLICT (user_id, date) DO UPDATE SET water_ml = EXCLUDED.water_ml;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION add_water(
+    p_user_id BIGINT,
+    p_amount_ml INTEGER,
+    p_report_date DATE
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_total INTEGER;
+BEGIN
+    INSERT INTO water_intake (user_id, amount_ml)
+    VALUES (p_user_id, p_amount_ml);
+
+    INSERT INTO daily_reports (user_id, date, water_ml)
+    VALUES (p_user_id, p_report_date, p_amount_ml)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        water_ml = daily_reports.water_ml + EXCLUDED.water_ml
+    RETURNING water_ml INTO v_total;
+
+    RETURN v_total;
+END;
+$$;
+
+-- Экраны статистики берут воду по дням из того же счетчика
+CREATE OR REPLACE FUNCTION get_dashboard(
+    p_user_id BIGINT,
+    p_from DATE,
+    p_to DATE
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'nutrition', (
+            SELECT jsonb_build_object(
+                'calories', COALESCE(SUM(nd.calories), 0),
+                'protein', COALESCE(SUM(nd.protein), 0),
+                'fats', COALESCE(SUM(nd.fats), 0),
+                'carbs', COALESCE(SUM(nd.carbs), 0)
+            )
+            FROM nutrition_data nd
+            JOIN food_images fi ON fi.id = nd.food_image_id
+            WHERE fi.user_id = p_user_id
+              AND nd.created_at >= p_from::timestamptz
+              AND nd.created_at < (p_to + 1)::timestamptz
+        ),
+        'water_by_day', (
+            SELECT COALESCE(jsonb_object_agg(date, water_ml), '{}'::jsonb)
+            FROM daily_reports
+            WHERE user_id = p_user_id
+              AND date BETWEEN p_from AND p_to
+              AND water_ml > 0
+        )
+    );
+$$;
+
+COMMENT ON COLUMN daily_reports.water_ml IS 'Выпито воды за день, мл (поддерживается add_water)';
+COMMENT ON FUNCTION add_water(BIGINT, INTEGER, DATE) IS 'Запись воды с атомарным увеличением дневного счетчика; возвращает итог за день';
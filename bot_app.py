@@ -0,0 +1,172 @@
+"""
+Сборка Telegram-приложения: обработчики, фоновые задачи и прием обновлений
+(long polling или веб-хук FastAPI) — общая для всех точек входа
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import (
+    Application,
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    PreCheckoutQueryHandler,
+    TypeHandler,
+    filters,
+)
+
+from config.settings import settings
+from handlers.command_handler import CommandHandler as BotCommandHandler
+from handlers.message_handler import MessageHandler as BotMessageHandler
+from handlers.update_processor import PerChatUpdateProcessor
+from services.container import ServiceContainer
+from services.conversation_state import create_conversation_persistence
+from services.image_sweeper import StaleImageSweeper
+from services.update_dedupe import UpdateDeduplicator
+from utils.rate_limiter import TelegramRateLimiter
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH_PREFIX = "/telegram"
+
+
+class BotApp:
+    """Application PTB вместе с обработчиками бота и фоновыми задачами.
+
+    Источник обновлений (`intake`):
+    - "polling" — long polling через Updater;
+    - "webhook" — Updater не создается, обновления кладет в `application.update_queue`
+      эндпоинт `/telegram/<secret>` из webhook_server в том же event loop;
+    - "forwarded" — воркер шарда: обновления пересылает фронтенд (см. sharding.py)
+      на `/internal/update`, веб-хук в Telegram регистрирует фронтенд.
+    """
+
+    def __init__(self, services: Optional[ServiceContainer] = None, webhook_url: Optional[str] = None, forwarded: bool = False) -> None:
+        self.services = services or ServiceContainer()
+        self.message_handler = BotMessageHandler(self.services)
+        self.command_handler = BotCommandHandler(self.services, message_handler=self.message_handler)
+        self.image_sweeper = StaleImageSweeper(self.message_handler)
+        self.update_dedupe = UpdateDeduplicator()
+
+        self.webhook_url = (webhook_url or "").rstrip("/") or None
+        self.intake = "forwarded" if forwarded else ("webhook" if self.webhook_url else "polling")
+        # Секрет в пути и в заголовке X-Telegram-Bot-Api-Secret-Token. Только из настроек:
+        # случайный секрет у каждой реплики (или после рестарта без set_webhook) свой,
+        # и Telegram получал бы 403 на каждое обновление
+        self.webhook_secret = settings.TELEGRAM_WEBHOOK_SECRET
+        if self.intake == "webhook" and not self.webhook_secret:
+            raise ValueError("TELEGRAM_WEBHOOK_SECRET обязателен в режиме веб-хука")
+
+        builder = (
+            Application.builder()
+            .token(settings.TELEGRAM_BOT_TOKEN)
+            .job_queue(None)
+            # Разные чаты — параллельно (с общим лимитом), один чат — по порядку
+            .concurrent_updates(PerChatUpdateProcessor(settings.MAX_CONCURRENT_UPDATES))
+            # Все исходящие вызовы бота — через общие лимиты Telegram (429 не доходят до хендлеров)
+            .rate_limiter(TelegramRateLimiter(
+                global_rate=settings.TELEGRAM_GLOBAL_RATE_PER_SECOND,
+                private_chat_rate=settings.TELEGRAM_CHAT_RATE_PER_SECOND,
+                max_retries=settings.TELEGRAM_MAX_RETRIES,
+            ))
+        )
+        if self.intake != "polling":
+            builder = builder.updater(None)
+        # context.user_data (например, ожидание веса) переживает рестарт
+        persistence = create_conversation_persistence()
+        if persistence:
+            builder = builder.persistence(persistence)
+        self.application = builder.build()
+        self._register_handlers()
+
+    @property
+    def webhook_path(self) -> str:
+        return f"{WEBHOOK_PATH_PREFIX}/{self.webhook_secret}"
+
+    def _register_handlers(self) -> None:
+        application = self.application
+        command_handler = self.command_handler
+        message_handler = self.message_handler
+
+        # Повторно доставленные обновления отсекаются до всех обработчиков
+        application.add_handler(TypeHandler(Update, self._skip_duplicate_update), group=-1)
+
+        # Команды
+        application.add_handler(CommandHandler("start", command_handler.start_command))
+        application.add_handler(CommandHandler("help", command_handler.help_command))
+        application.add_handler(CommandHandler("stats", command_handler.stats_command))
+        application.add_handler(CommandHandler("week", command_handler.week_command))
+
+        # Callback-кнопки
+        application.add_handler(CallbackQueryHandler(command_handler.callback_query_handler))
+
+        # Платежи Telegram Stars
+        application.add_handler(PreCheckoutQueryHandler(command_handler.handle_pre_checkout_query))
+        application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, command_handler.handle_successful_payment))
+
+        # Сообщения
+        application.add_handler(MessageHandler(filters.PHOTO, message_handler.handle_photo))
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler.handle_text))
+
+    async def _skip_duplicate_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if self.update_dedupe.check_and_mark(update.update_id):
+            logger.info(f"Пропущено повторно доставленное обновление {update.update_id}")
+            raise ApplicationHandlerStop
+
+    async def start(self) -> None:
+        """Запустить бота, очередь анализа и переанализ фото (прием обновлений — start_intake)"""
+        await self.application.initialize()
+        await self.application.start()
+        # Воркеры очереди анализа фото (и возобновление незавершённых задач)
+        await self.message_handler.analysis_queue.start(self.application.bot)
+        await self.image_sweeper.start(self.application.bot)
+
+    async def start_intake(self) -> None:
+        """Начать прием обновлений. Вызывается, когда веб-сервер уже слушает порт:
+        иначе Telegram доставлял бы веб-хук на еще закрытый сокет"""
+        if self.intake == "forwarded":
+            logger.info("Бот получает обновления от фронтенда шардирования")
+        elif self.intake == "webhook":
+            await self.application.bot.set_webhook(
+                url=f"{self.webhook_url}{self.webhook_path}",
+                secret_token=self.webhook_secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Веб-хук Telegram установлен: {self.webhook_url}{WEBHOOK_PATH_PREFIX}/***")
+        else:
+            # Веб-хук от прошлого запуска не дает работать getUpdates
+            await self.application.bot.delete_webhook()
+            await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            logger.info("Бот получает обновления через long polling")
+
+    async def stop(self) -> None:
+        """Плавная остановка: прекратить прием обновлений, дождаться начатых анализов, остановить бота.
+
+        Application.stop дожидается уже принятых обновлений (фото успевают попасть в
+        очередь), затем воркеры очереди до SHUTDOWN_DRAIN_TIMEOUT_SECONDS доделывают
+        начатые анализы — бот к этому моменту еще может отвечать пользователям. Проход
+        переанализа зависших фото ограничен тем же сроком и прерывается по его истечении.
+        """
+        try:
+            if self.application.updater and self.application.updater.running:
+                await self.application.updater.stop()
+            if self.application.running:
+                await self.application.stop()
+            # Переанализ и очередь дорабатывают параллельно в пределах одного общего срока
+            drain_timeout = settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS
+            await asyncio.gather(
+                self.image_sweeper.stop(timeout=drain_timeout),
+                self.message_handler.analysis_queue.stop(drain_timeout=drain_timeout),
+            )
+            await self.application.shutdown()
+        except Exception as e:
+            logger.warning(f"Ошибка при остановке бота: {e}")
+
+    async def process_webhook_update(self, data: dict) -> None:
+        """Передать обновление из веб-хука в очередь Application (тот же event loop)"""
+        update = Update.de_json(data, self.application.bot)
+        await self.application.update_queue.put(update)
@@ -0,0 +1,187 @@
+"""
+Единая среда выполнения: веб-сервер FastAPI (uvicorn) и Telegram-бот в одном event loop.
+
+Все точки входа (main.py, run_bot.py, main_webhook.py, railway_main.py) вызывают run().
+Фоновые компоненты (бот с очередью анализа, мониторы) запускаются по порядку после
+старта и останавливаются в обратном порядке, когда uvicorn получает SIGINT/SIGTERM.
+Прием обновлений (веб-хук или long polling) включается, только когда uvicorn уже
+слушает порт.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import uvicorn
+
+from bot_app import BotApp
+from config.settings import settings
+from services.container import ServiceContainer
+from services.subscription_monitor import SubscriptionMonitor
+from services.trc20_monitor import Trc20Monitor
+from utils.logging_setup import setup_logging
+from webhook_server import attach_bot, webhook_app
+
+logger = logging.getLogger(__name__)
+
+Hook = Callable[[], Awaitable[None]]
+
+
+def check_settings() -> bool:
+    """Проверить переменные окружения; False — бота запускать нельзя"""
+    logger.info(f"🔑 TELEGRAM_BOT_TOKEN: {'установлен' if settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_BOT_TOKEN != 'your_telegram_bot_token_here' else 'НЕ УСТАНОВЛЕН'}")
+    logger.info(f"🔑 OPENAI_API_KEY: {'установлен' if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != 'your_openai_api_key_here' else 'НЕ УСТАНОВЛЕН'}")
+    logger.info(f"🔗 TELEGRAM_WEBHOOK_URL: {settings.TELEGRAM_WEBHOOK_URL or 'не задан (long polling)'}")
+
+    if not settings.TELEGRAM_BOT_TOKEN or settings.TELEGRAM_BOT_TOKEN == "your_telegram_bot_token_here":
+        logger.error("❌ TELEGRAM_BOT_TOKEN не установлен")
+        logger.info("Создайте файл .env и добавьте TELEGRAM_BOT_TOKEN=your_real_token_here")
+        return False
+
+    if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "your_openai_api_key_here":
+        logger.error("❌ OPENAI_API_KEY не установлен")
+        logger.info("Получите ключ на https://platform.openai.com/api-keys")
+        return False
+
+    if not settings.SUPABASE_URL or settings.SUPABASE_URL == "https://your-project-id.supabase.co" \
+            or not settings.SUPABASE_KEY or settings.SUPABASE_KEY == "your_supabase_anon_key_here":
+        logger.warning("SUPABASE_URL/SUPABASE_KEY не установлены — бот будет работать без базы данных")
+
+    logger.info(f"Включенные провайдеры платежей: {', '.join(settings.ENABLED_PAYMENT_PROVIDERS)}")
+    return True
+
+
+class BotRuntime:
+    """uvicorn и бот в одном event loop плюс фоновые компоненты с хуками start/stop.
+
+    Первый компонент — получатель обновлений: BotApp, а во фронтенде шардирования
+    (SHARD_ROLE=frontend) — ShardRouter. Если он не смог стартовать, остальные
+    компоненты не запускаются, а веб-сервер (и /health) продолжает работать.
+    Его start_intake (set_webhook или long polling) вызывается после того, как
+    uvicorn открыл сокет.
+    """
+
+    def __init__(self, port: int, host: str = "0.0.0.0", services: Optional[ServiceContainer] = None) -> None:
+        self.port = port
+        self.host = host
+        self.services = services
+        self.bot_app = None  # BotApp или ShardRouter — то, что подключается к webhook_server
+        self._components: List[Tuple[str, Hook, Hook]] = []
+        self.server = uvicorn.Server(uvicorn.Config(
+            webhook_app,
+            host=host,
+            port=port,
+            log_level="info",
+            access_log=True,
+            # Без собственной конфигурации логи uvicorn идут через очередь setup_logging
+            log_config=None
+        ))
+
+    def add_component(self, name: str, start: Hook, stop: Hook) -> None:
+        """Зарегистрировать фоновый компонент (запуск — по порядку, остановка — в обратном)"""
+        self._components.append((name, start, stop))
+
+    def _build_bot(self) -> None:
+        if not check_settings():
+            return
+
+        if settings.SHARD_ROLE == "frontend":
+            # Фронтенд только принимает веб-хук и пересылает обновления воркерам
+            from sharding import ShardRouter
+            self.bot_app = ShardRouter(settings.TELEGRAM_WEBHOOK_URL)
+            self.add_component("маршрутизатор шардов", self.bot_app.start, self.bot_app.stop)
+            return
+
+        if settings.SHARD_ROLE == "worker":
+            logger.info(f"Воркер шарда {settings.SHARD_INDEX} из {settings.SHARD_COUNT} (порт {self.port})")
+        self.bot_app = BotApp(
+            self.services,
+            webhook_url=settings.TELEGRAM_WEBHOOK_URL,
+            forwarded=settings.SHARD_ROLE == "worker"
+        )
+        services = self.bot_app.services
+        subscription_monitor = SubscriptionMonitor(services.subscription_service)
+        trc20_monitor = Trc20Monitor(supabase_service=services.supabase_service, crypto_service=services.crypto_service)
+
+        self.add_component("Telegram бот", self.bot_app.start, self.bot_app.stop)
+        self.add_component("мониторинг подписок", subscription_monitor.start, subscription_monitor.stop)
+        self.add_component("TRC20 монитор", trc20_monitor.start, trc20_monitor.stop)
+
+    async def serve(self) -> None:
+        try:
+            self._build_bot()
+        except Exception as e:
+            logger.error(f"Ошибка создания Telegram бота: {e}", exc_info=True)
+
+        started: List[Tuple[str, Hook]] = []
+        serve_task: Optional[asyncio.Task] = None
+        try:
+            for index, (name, start, stop) in enumerate(self._components):
+                try:
+                    await start()
+                    started.append((name, stop))
+                    logger.info(f"Запущен компонент: {name}")
+                except Exception as e:
+                    logger.error(f"Ошибка запуска компонента «{name}»: {e}", exc_info=True)
+                    if index == 0:
+                        logger.info("Веб-сервер продолжит работать без Telegram бота")
+                        break
+
+            bot_started = bool(started) and self.bot_app is not None
+            if bot_started:
+                attach_bot(self.bot_app)
+
+            logger.info(f"🌐 Веб-сервер на порту {self.port}, health check: http://{self.host}:{self.port}/health")
+            # uvicorn сам обрабатывает SIGINT/SIGTERM и возвращается из serve()
+            serve_task = asyncio.create_task(self.server.serve())
+            if bot_started and await self._wait_until_listening(serve_task):
+                try:
+                    await self.bot_app.start_intake()
+                    logger.info("Бот готов к работе! Отправьте /start в Telegram для начала.")
+                except Exception as e:
+                    logger.error(f"Ошибка запуска приема обновлений: {e}", exc_info=True)
+            await serve_task
+        finally:
+            if serve_task is not None and not serve_task.done():
+                serve_task.cancel()
+            attach_bot(None)
+            for name, stop in reversed(started):
+                try:
+                    await stop()
+                    logger.info(f"Остановлен компонент: {name}")
+                except Exception as e:
+                    logger.warning(f"Ошибка остановки компонента «{name}»: {e}")
+
+
+    async def _wait_until_listening(self, serve_task: asyncio.Task) -> bool:
+        """Дождаться, пока uvicorn откроет сокет; False — сервер завершился раньше"""
+        while not self.server.started:
+            if serve_task.done():
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+
+def run(port: Optional[int] = None) -> None:
+    """Запустить среду выполнения (uvloop, если установлен)"""
+    setup_logging()
+    if settings.TELEGRAM_WEBHOOK_URL and not settings.TELEGRAM_WEBHOOK_SECRET:
+        # Без постоянного секрета Telegram получал бы 403 после рестарта или на другой реплике
+        logger.error("❌ TELEGRAM_WEBHOOK_SECRET не задан: он обязателен вместе с TELEGRAM_WEBHOOK_URL")
+        raise SystemExit(1)
+    port = port or int(os.getenv("PORT", 8001))
+    # Воркеры шардов слушают только локальный интерфейс (HOST=127.0.0.1 задает run_sharded.py)
+    runtime = BotRuntime(port, host=os.getenv("HOST", "0.0.0.0"))
+
+    try:
+        import uvloop
+        runner = uvloop.run
+        logger.info("🚀 Запуск TGCal (event loop: uvloop)")
+    except ImportError:
+        runner = asyncio.run
+        logger.info("🚀 Запуск TGCal (event loop: asyncio)")
+
+    try:
+        runner(runtime.serve())
+    except KeyboardInterrupt:
+        logger.info("Остановлено пользователем")
@@ -6,6 +6,10 @@ load_dotenv()
 class Settings:
     # Telegram Bot
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+    # Public base URL for the /telegram/<secret> webhook (empty — long polling)
+    TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL") or None
+    # Secret for the webhook path and X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ and -)
+    TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or None
     
     # OpenAI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -25,7 +29,63 @@ class Settings:
 
     # G4F fallback
     ENABLE_G4F_FALLBACK = os.getenv("ENABLE_G4F_FALLBACK", "false").lower() in ("1", "true", "yes")
-    
+
+    # Local pre-filter for obvious non-food photos (dark/blank/blurry/screenshots)
+    ENABLE_FOOD_PHOTO_GATE = os.getenv("ENABLE_FOOD_PHOTO_GATE", "true").lower() in ("1", "true", "yes")
+
+    # Sharding by telegram user id (run_sharded.py): "frontend" routes webhook updates to "worker" processes
+    SHARD_ROLE = os.getenv("SHARD_ROLE", "")  # "", "frontend" or "worker"
+    SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # 0 — by CPU count (launcher)
+    SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+    SHARD_WORKER_BASE_PORT = int(os.getenv("SHARD_WORKER_BASE_PORT", "9100"))
+    SHARD_INTERNAL_SECRET = os.getenv("SHARD_INTERNAL_SECRET") or None
+
+    # Updates processed concurrently (different chats in parallel, one chat in order)
+    MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
+    # Outbound Bot API rate limits (token buckets; 429 retry_after is waited out and retried)
+    TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", "30"))
+    TELEGRAM_CHAT_RATE_PER_SECOND = float(os.getenv("TELEGRAM_CHAT_RATE_PER_SECOND", "1"))
+    TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "2"))
+
+    # Redelivered updates are skipped by update_id (memory + optional local SQLite; empty path — memory only)
+    UPDATE_DEDUPE_WINDOW_SECONDS = int(os.getenv("UPDATE_DEDUPE_WINDOW_SECONDS", "86400"))
+    UPDATE_DEDUPE_MAX_ENTRIES = int(os.getenv("UPDATE_DEDUPE_MAX_ENTRIES", "100000"))
+    UPDATE_DEDUPE_DB_PATH = os.getenv("UPDATE_DEDUPE_DB_PATH", "processed_updates.sqlite3")
+
+    # Logging (queue + background writer): level, keep 1 of N DEBUG records per route, slow update threshold
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "20"))
+    LOG_SLOW_UPDATE_MS = int(os.getenv("LOG_SLOW_UPDATE_MS", "2000"))
+
+    # Conversation state (context.user_data): "sqlite", "supabase" (shared across replicas) or "" (memory only)
+    CONVERSATION_STATE_BACKEND = os.getenv("CONVERSATION_STATE_BACKEND", "sqlite").lower()
+    CONVERSATION_STATE_DB_PATH = os.getenv("CONVERSATION_STATE_DB_PATH", "conversation_state.sqlite3")
+    CONVERSATION_STATE_TTL_SECONDS = int(os.getenv("CONVERSATION_STATE_TTL_SECONDS", "86400"))
+    CONVERSATION_STATE_FLUSH_SECONDS = float(os.getenv("CONVERSATION_STATE_FLUSH_SECONDS", "5"))
+
+    # Background analysis queue (local SQLite)
+    ANALYSIS_QUEUE_DB_PATH = os.getenv("ANALYSIS_QUEUE_DB_PATH", "analysis_queue.sqlite3")
+    ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "3"))
+    ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "3"))
+    # On shutdown, in-flight analyses get this long to finish before they are left for the next start
+    SHUTDOWN_DRAIN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT_SECONDS", "20"))
+
+    # Stale "processing"/"error" images sweeper
+    ENABLE_IMAGE_SWEEPER = os.getenv("ENABLE_IMAGE_SWEEPER", "true").lower() in ("1", "true", "yes")
+    SWEEPER_INTERVAL_SECONDS = int(os.getenv("SWEEPER_INTERVAL_SECONDS", "300"))
+    SWEEPER_MIN_AGE_MINUTES = int(os.getenv("SWEEPER_MIN_AGE_MINUTES", "5"))
+    SWEEPER_BATCH_SIZE = int(os.getenv("SWEEPER_BATCH_SIZE", "10"))
+    SWEEPER_CONCURRENCY = int(os.getenv("SWEEPER_CONCURRENCY", "1"))
+    SWEEPER_MAX_ATTEMPTS = int(os.getenv("SWEEPER_MAX_ATTEMPTS", "2"))
+    TELEGRAM_FILE_LINK_TTL_MINUTES = 60  # Telegram гарантирует ссылку на файл минимум на час
+
+    # Timezone used to split meals and water into days (IANA name, e.g. "Europe/Moscow")
+    TIMEZONE = os.getenv("TIMEZONE", "UTC")
+
+    # Rendered "Today"/"Week" reports cached in memory (entries across all users)
+    REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "5000"))
+
     # Daily nutrition goals (default values)
     DEFAULT_DAILY_CALORIES = 2000
     DEFAULT_DAILY_PROTEIN = 150  # grams
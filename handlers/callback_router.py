@@ -0,0 +1,67 @@
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# handler(query, context, db_user, *args); db_user = None, если маршрут не требует пользователя
+CallbackHandler = Callable[..., Awaitable[None]]
+
+
+class CallbackRoute:
+    """Маршрут callback-кнопки: обработчик, типы аргументов и нужен ли пользователь из БД"""
+
+    def __init__(self, key: str, handler: CallbackHandler, arg_types: Sequence[type] = (), needs_user: bool = False) -> None:
+        self.key = key
+        self.handler = handler
+        self.arg_types = tuple(arg_types)
+        self.needs_user = needs_user
+
+    def parse_args(self, raw: str) -> Optional[tuple]:
+        """Разобрать хвост callback_data по `_` в аргументы заданных типов.
+
+        Последний аргумент забирает остаток строки целиком (например, провайдер
+        `telegram_stars` в `subscribe_monthly_telegram_stars`). None — данные не подходят.
+        """
+        if not self.arg_types:
+            return () if not raw else None
+        parts = raw.split("_", len(self.arg_types) - 1)
+        if len(parts) != len(self.arg_types):
+            return None
+        try:
+            return tuple(arg_type(part) for arg_type, part in zip(self.arg_types, parts))
+        except ValueError:
+            return None
+
+
+class CallbackRouter:
+    """Таблица маршрутов callback_data: точные значения в словаре и префиксы с аргументами.
+
+    Префиксы проверяются от самого длинного к короткому, поэтому более конкретный
+    маршрут всегда побеждает общий.
+    """
+
+    def __init__(self) -> None:
+        self._exact: Dict[str, CallbackRoute] = {}
+        self._prefixes: List[CallbackRoute] = []
+
+    def exact(self, data: str, handler: CallbackHandler, needs_user: bool = False) -> None:
+        self._exact[data] = CallbackRoute(data, handler, needs_user=needs_user)
+
+    def prefix(self, prefix: str, handler: CallbackHandler, arg_types: Sequence[type], needs_user: bool = False) -> None:
+        self._prefixes.append(CallbackRoute(prefix, handler, arg_types, needs_user))
+        self._prefixes.sort(key=lambda route: len(route.key), reverse=True)
+
+    def resolve(self, data: str) -> Optional[Tuple[CallbackRoute, tuple]]:
+        """Найти маршрут и разобранные аргументы для callback_data"""
+        route = self._exact.get(data)
+        if route:
+            return route, ()
+        for route in self._prefixes:
+            if data.startswith(route.key):
+                args = route.parse_args(data[len(route.key):])
+                if args is not None:
+                    return route, args
+                logger.warning(f"Некорректные аргументы callback: {data}")
+                return None
+        return None
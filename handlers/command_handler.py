@@ -1,24 +1,34 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 import uuid
 from telegram.ext import ContextTypes
-from services.supabase_service import SupabaseService
-from services.subscription_service import SubscriptionService
+from services.container import ServiceContainer
+from handlers.callback_router import CallbackRouter
+from utils.dates import local_today
+from utils.logging_setup import bind_log_context
 from utils.report_generator import ReportGenerator
 from models.data_models import User
 from datetime import datetime
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 class CommandHandler:
-    def __init__(self):
-        self.supabase_service = SupabaseService()
-        self.subscription_service = SubscriptionService()
+    def __init__(self, services: Optional[ServiceContainer] = None, message_handler=None):
+        self.services = services or ServiceContainer()
+        self.supabase_service = self.services.supabase_service
+        self.subscription_service = self.services.subscription_service
+        self.dashboard_service = self.services.dashboard_service
+        self.report_cache = self.services.report_cache
+        # MessageHandler нужен для повторного показа экрана анализа (back_to_analysis_)
+        self.message_handler = message_handler
+        self.callback_router = self._build_callback_router()
     
     async def _show_main_menu(self, query_or_update, use_edit: bool = True):
         keyboard = [
             [InlineKeyboardButton(text="📊 Today: calories/water", callback_data="menu_day")],
             [InlineKeyboardButton(text="📈 Week: graph", callback_data="menu_week")],
+            [InlineKeyboardButton(text="🍽 Recent meals", callback_data="menu_recent_meals")],
             [InlineKeyboardButton(text="⚙️ Water settings", callback_data="menu_settings_water")],
         ]
         text = "📋 *Main menu*\n\nChoose a section:"
@@ -64,246 +74,299 @@ class CommandHandler:
             logger.error(f"Ошибка в команде help: {e}")
             await update.message.reply_text("❌ An error occurred. Please try again later.")
 
+    def _build_callback_router(self) -> CallbackRouter:
+        """Маршруты callback-кнопок; needs_user=True — перед вызовом загружается пользователь из БД"""
+        router = CallbackRouter()
+        # Навигация — без обращений к БД
+        router.exact("open_menu", self._cb_open_menu)
+        router.exact("menu_settings_water", self._cb_water_settings)
+        router.exact("show_subscription_plans", self._cb_subscription_plans)
+        router.prefix("change_weight_", self._cb_change_weight, (int, int))
+        router.prefix("back_to_analysis_", self._cb_back_to_analysis, (int,))
+        # Действия пользователя
+        router.exact("water_add_250", self._cb_water_add, needs_user=True)
+        router.exact("menu_day", self._cb_menu_day, needs_user=True)
+        router.exact("menu_week", self._cb_menu_week, needs_user=True)
+        router.exact("menu_recent_meals", self._cb_recent_meals, needs_user=True)
+        router.prefix("relog_", self._cb_relog_meal, (int,), needs_user=True)
+        router.prefix("set_water_", self._cb_set_water_goal, (int,), needs_user=True)
+        # Подписки
+        router.exact("choose_monthly", self._cb_choose_plan("monthly"), needs_user=True)
+        router.exact("choose_yearly", self._cb_choose_plan("yearly"), needs_user=True)
+        router.prefix("subscribe_", self._cb_subscribe, (str, str), needs_user=True)
+        router.prefix("crypto_paid_", self._cb_crypto_paid, (str,), needs_user=True)
+        router.exact("subscription_stats", self._cb_subscription_stats, needs_user=True)
+        router.exact("cancel_subscription", self._cb_cancel_subscription, needs_user=True)
+        router.exact("confirm_cancel_subscription", self._cb_confirm_cancel_subscription, needs_user=True)
+        return router
+
     async def callback_query_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик callback-кнопок"""
+        query = update.callback_query
         try:
-            logger.info("🔍 Callback-обработчик запущен")
-            query = update.callback_query
-            user = update.effective_user
-            logger.info(f"🔍 Пользователь: {user.id}, callback_data: {query.data}")
-            
             # Сразу отвечаем на callback чтобы убрать "часики" у кнопки
             await query.answer()
-            logger.info("✅ query.answer() выполнен")
             
-            # Получаем пользователя из БД
-            logger.info("🔍 Получаю пользователя из БД...")
-            db_user = await self.supabase_service.get_user_by_telegram_id(user.id)
-            if not db_user:
-                logger.error("❌ Пользователь не найден в БД")
-                await query.edit_message_text("❌ Пользователь не найден. Используйте /start для регистрации.")
-                return
-            logger.info(f"✅ Пользователь найден в БД: {db_user.id}")
-
             data = query.data
-            logger.info(f"🎯 Обрабатываю callback: {data} от пользователя {user.id}")
-            if data == "water_add_250":
-                # Добавляем воду
-                logger.info("💧 Добавляю воду...")
-                await self.supabase_service.add_water_intake(db_user.id, 250)
-                logger.info("✅ Вода добавлена в БД")
-                
-                water_today = await self.supabase_service.get_water_today(db_user.id)
-                logger.info(f"📊 Вода за сегодня: {water_today}мл")
-                
-                text = ReportGenerator.format_water_status(water_today, db_user.daily_water_goal_ml)
-                logger.info("✅ Статус воды сформирован")
-                
-                keyboard = [
-                    [InlineKeyboardButton(text="➕ Вода +250мл", callback_data="water_add_250")],
-                    [InlineKeyboardButton(text="📋 Меню", callback_data="open_menu")]
-                ]
-                logger.info("🔘 Клавиатура создана")
-                
-                await query.edit_message_text(
-                    text=f"💧 Вода добавлена!\n\n{text}", 
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-                logger.info("✅ Сообщение обновлено")
-                return
-
-            if data == "open_menu":
-                # Главное меню
-                logger.info("📋 Opening main menu...")
+            resolved = self.callback_router.resolve(data)
+            if not resolved:
+                # Fallback: если пришло неизвестное действие — показываем главное меню
+                bind_log_context(route="callback:unknown")
+                logger.debug("Неизвестный callback %s, показываем меню", data)
                 await self._show_main_menu(query)
-                logger.info("✅ Меню отображено")
-                return
-
-            # Change weight flow
-            if data.startswith("change_weight_"):
-                try:
-                    _, image_id, current = data.split("_")
-                    image_id = int(image_id)
-                    current = int(current)
-                except Exception:
-                    image_id = None
-                    current = 200
-                keyboard = [[InlineKeyboardButton("🔙 Back", callback_data=f"back_to_analysis_{image_id}")]]
-                await query.edit_message_text(
-                    text=(
-                        "✏️ Enter new weight in grams (just send a number).\n\n"
-                        f"Current: {current} g"
-                    ),
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-                # Store context for next text message
-                context.user_data["awaiting_weight_for_image"] = image_id
-                return
-
-            # Back to analysis screen
-            if data.startswith("back_to_analysis_"):
-                try:
-                    _, image_id = data.split("_")
-                    image_id = int(image_id)
-                    # Импортируем MessageHandler для доступа к функции показа экрана анализа
-                    from handlers.message_handler import MessageHandler
-                    message_handler = MessageHandler()
-                    await message_handler._show_nutrition_analysis_screen(query, image_id)
-                except Exception as e:
-                    logger.error(f"Error showing analysis screen: {e}")
-                    await self._show_main_menu(query)
                 return
-
-            if data == "menu_day":
-                # Day: calories + water
-                nutrition_data = await self.supabase_service.get_user_nutrition_today(db_user.id)
-                user_goals = {
-                    'calories': db_user.daily_calories_goal,
-                    'protein': db_user.daily_protein_goal,
-                    'fats': db_user.daily_fats_goal,
-                    'carbs': db_user.daily_carbs_goal
-                }
-                user_stats = {
-                    'total_photos_sent': db_user.total_photos_sent
-                }
-                report = ReportGenerator.format_daily_report(nutrition_data, user_goals, user_stats)
-                water_today = await self.supabase_service.get_water_today(db_user.id)
-                water_text = ReportGenerator.format_water_status(water_today, db_user.daily_water_goal_ml)
-                keyboard = [[InlineKeyboardButton(text="➕ Water +250ml", callback_data="water_add_250")], [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
-                await query.edit_message_text(text=f"{report}\n\n{water_text}", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-                return
-
-            if data == "menu_week":
-                week_data = await self.supabase_service.get_user_nutrition_week(db_user.id)
-                user_goals = {
-                    'calories': db_user.daily_calories_goal,
-                    'protein': db_user.daily_protein_goal,
-                    'fats': db_user.daily_fats_goal,
-                    'carbs': db_user.daily_carbs_goal
-                }
-                report = ReportGenerator.format_weekly_report(week_data, user_goals)
-                water_week = await self.supabase_service.get_water_week(db_user.id)
-                from datetime import date, timedelta
-                days = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
-                start = date.today() - timedelta(days=6)
-                bars = {}
-                for i in range(7):
-                    d = start + timedelta(days=i)
-                    key = d.isoformat()
-                    bars[days[i]] = water_week.get(key, 0)
-                water_graph = ReportGenerator.format_weekly_water(bars)
-                keyboard = [[InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
-                await query.edit_message_text(text=f"{report}\n\n{water_graph}", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-                return
-
-            if data == "menu_settings_water":
-                keyboard = [
-                    [InlineKeyboardButton(text="1500 ml", callback_data="set_water_1500"), 
-                     InlineKeyboardButton(text="2000 ml", callback_data="set_water_2000")],
-                    [InlineKeyboardButton(text="2500 ml", callback_data="set_water_2500"), 
-                     InlineKeyboardButton(text="3000 ml", callback_data="set_water_3000")],
-                    [InlineKeyboardButton(text="🔙 Back to menu", callback_data="open_menu")]
-                ]
-                await query.edit_message_text(
-                    text="⚙️ *Water settings*\n\nChoose a daily goal:", 
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-                return
-
-            if data.startswith("set_water_"):
-                goal = int(data.split("_")[-1])
-                await self.supabase_service.set_user_water_goal(db_user.id, goal)
-                keyboard = [[InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
-                await query.edit_message_text(
-                    text=f"✅ Daily water goal set: *{goal} ml*", 
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-                return
-
-            # Обработка подписок - новая система с выбором провайдера
-            if data == "choose_monthly":
-                await self._show_provider_selection(query, db_user, "monthly")
-                return
-                
-            if data == "choose_yearly":
-                await self._show_provider_selection(query, db_user, "yearly")
-                return
-                
-            # Обработка подписок через конкретных провайдеров
-            if data.startswith("subscribe_"):
-                # Правильный парсинг для telegram_stars который содержит подчеркивания
-                parts = data.split("_")
-                if len(parts) >= 3:  # subscribe_monthly_provider
-                    plan_type = parts[1]
-                    provider = "_".join(parts[2:])
-                else:
+            route, args = resolved
+            # Маршрут — ключ из таблицы (например, change_weight_), а не callback_data с аргументами
+            bind_log_context(route=f"callback:{route.key}")
+            logger.debug("Callback %s", data)
+            
+            db_user = None
+            if route.needs_user:
+                db_user = await self.supabase_service.get_user_by_telegram_id(update.effective_user.id)
+                if not db_user:
+                    logger.error("Пользователь не найден в БД")
+                    await query.edit_message_text("❌ Пользователь не найден. Используйте /start для регистрации.")
                     return
-                
-                await self._handle_subscription_request(query, context, db_user, plan_type, provider)
-                return
-
-            if data.startswith("crypto_paid_"):
-                plan_type = data.split("_")[-1]
-                await self._handle_crypto_paid(query, db_user, plan_type)
-                return
-                
-            if data == "subscription_stats":
-                await self._show_subscription_stats(query, db_user)
-                return
             
-            if data == "show_subscription_plans":
-                keyboard = [
-                    [InlineKeyboardButton("💳 Monthly plan", callback_data="choose_monthly")],
-                    [InlineKeyboardButton("💰 Yearly plan", callback_data="choose_yearly")],
-                    [InlineKeyboardButton("🔙 Back", callback_data="subscription_stats")],
-                    [InlineKeyboardButton("📋 Menu", callback_data="open_menu")]
-                ]
-                await query.edit_message_text(
-                    text="Choose a subscription plan:",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-                return
-
-            # Fallback: если пришло неизвестное действие — показываем главное меню
-            await self._show_main_menu(query)
-            return
-                
-            if data == "cancel_subscription":
-                await self._handle_subscription_cancellation(query, db_user)
-                return
-                
-            if data == "confirm_cancel_subscription":
-                # Отменяем подписку
-                success = await self.subscription_service.cancel_subscription(db_user.telegram_id)
-                if success:
-                    message = (
-                        f"✅ *Подписка отменена*\n\n"
-                        f"Автопродление отключено.\n"
-                        f"Подписка останется активной до конца текущего периода."
-                    )
-                else:
-                    message = "❌ Ошибка отмены подписки. Попробуйте позже."
-                    
-                keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="subscription_stats")]]
-                await query.edit_message_text(
-                    text=message,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
-                return
+            await route.handler(query, context, db_user, *args)
 
         except Exception as e:
-            logger.error(f"Ошибка callback_query: {e}")
+            logger.error("Ошибка callback_query: %s", e, exc_info=True)
             try:
                 await self._show_main_menu(query)
             except:
                 pass
 
+    async def _cb_open_menu(self, query, context, db_user):
+        await self._show_main_menu(query)
+
+    async def _cb_water_add(self, query, context, db_user):
+        # Один вызов: запись + атомарный счетчик за день, сразу с новым итогом
+        water_today = await self.supabase_service.add_water(db_user.id, 250, local_today())
+        self.report_cache.bump(db_user.telegram_id)
+        text = ReportGenerator.format_water_status(water_today, db_user.daily_water_goal_ml)
+        keyboard = [
+            [InlineKeyboardButton(text="➕ Вода +250мл", callback_data="water_add_250")],
+            [InlineKeyboardButton(text="📋 Меню", callback_data="open_menu")]
+        ]
+        await query.edit_message_text(
+            text=f"💧 Вода добавлена!\n\n{text}", 
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    async def _cb_change_weight(self, query, context, db_user, image_id: int, current: int):
+        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data=f"back_to_analysis_{image_id}")]]
+        await query.edit_message_text(
+            text=(
+                "✏️ Enter new weight in grams (just send a number).\n\n"
+                f"Current: {current} g"
+            ),
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+        # Store context for next text message
+        context.user_data["awaiting_weight_for_image"] = image_id
+
+    async def _cb_back_to_analysis(self, query, context, db_user, image_id: int):
+        context.user_data.pop("awaiting_weight_for_image", None)
+        if self.message_handler is None:
+            # Точка входа не передала MessageHandler — создаем один раз на тех же сервисах
+            from handlers.message_handler import MessageHandler
+            self.message_handler = MessageHandler(self.services)
+        await self.message_handler._show_nutrition_analysis_screen(query, image_id)
+
+    async def _cb_menu_day(self, query, context, db_user):
+        # Day: calories + water
+        try:
+            text = await self._day_report_text(db_user)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки статистики за день: {e}")
+            await self._show_stats_error(query)
+            return
+        keyboard = [[InlineKeyboardButton(text="➕ Water +250ml", callback_data="water_add_250")], [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
+        await query.edit_message_text(text=text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+
+    async def _cb_menu_week(self, query, context, db_user):
+        try:
+            text = await self._week_report_text(db_user, ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"])
+        except Exception as e:
+            logger.error(f"Ошибка загрузки статистики за неделю: {e}")
+            await self._show_stats_error(query)
+            return
+        keyboard = [[InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
+        await query.edit_message_text(text=text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+
+    @staticmethod
+    async def _show_stats_error(query):
+        keyboard = [[InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
+        await query.edit_message_text(
+            text="❌ Failed to load statistics. Please try again later.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+    async def _day_report_text(self, db_user) -> str:
+        """Отчет за сегодня (КБЖУ + вода) для /stats и экрана меню.
+
+        Ошибка загрузки пробрасывается и в кэш ничего не попадает — вызывающий
+        показывает сообщение об ошибке.
+        """
+        period = ("day", local_today())
+        cached = self.report_cache.get(db_user.telegram_id, period)
+        if cached is not None:
+            return cached
+        # Версия до загрузки: запись еды во время запроса не даст закэшировать устаревший отчет
+        version = self.report_cache.version(db_user.telegram_id)
+        summary = await self.dashboard_service.get_day(db_user.id)
+        user_stats = {
+            'total_photos_sent': db_user.total_photos_sent
+        }
+        report = ReportGenerator.format_daily_report(summary.nutrition(), self._user_goals(db_user), user_stats)
+        water_text = ReportGenerator.format_water_status(summary.water_ml, db_user.daily_water_goal_ml)
+        text = f"{report}\n\n{water_text}"
+        self.report_cache.put(db_user.telegram_id, period, text, version)
+        return text
+
+    async def _week_report_text(self, db_user, day_names: list) -> str:
+        """Отчет за неделю (КБЖУ + график воды) для /week и экрана меню; day_names — Пн..Вс.
+
+        Как и _day_report_text, при ошибке загрузки ничего не кэширует.
+        """
+        period = ("week", local_today(), day_names[0])
+        cached = self.report_cache.get(db_user.telegram_id, period)
+        if cached is not None:
+            return cached
+        version = self.report_cache.version(db_user.telegram_id)
+        summary = await self.dashboard_service.get_week(db_user.id)
+        report = ReportGenerator.format_weekly_report(summary.nutrition(), self._user_goals(db_user))
+        water_graph = ReportGenerator.format_weekly_water(summary.water_bars(day_names))
+        text = f"{report}\n\n{water_graph}"
+        self.report_cache.put(db_user.telegram_id, period, text, version)
+        return text
+
+    @staticmethod
+    def _user_goals(db_user) -> dict:
+        return {
+            'calories': db_user.daily_calories_goal,
+            'protein': db_user.daily_protein_goal,
+            'fats': db_user.daily_fats_goal,
+            'carbs': db_user.daily_carbs_goal
+        }
+
+    async def _cb_recent_meals(self, query, context, db_user):
+        await self._show_recent_meals(query, db_user)
+
+    async def _cb_relog_meal(self, query, context, db_user, meal_id: int):
+        recorded = await self.supabase_service.relog_meal(db_user.id, meal_id, local_today())
+        self.report_cache.bump(db_user.telegram_id)
+        if not recorded:
+            await self._show_recent_meals(query, db_user, notice="❌ This meal is no longer available.")
+            return
+        nutrition = recorded["nutrition"]
+        keyboard = [
+            [InlineKeyboardButton(text="🍽 Recent meals", callback_data="menu_recent_meals")],
+            [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
+        ]
+        await query.edit_message_text(
+            text=ReportGenerator.format_nutrition_result(nutrition, title="Logged again!"),
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    async def _cb_water_settings(self, query, context, db_user):
+        keyboard = [
+            [InlineKeyboardButton(text="1500 ml", callback_data="set_water_1500"), 
+             InlineKeyboardButton(text="2000 ml", callback_data="set_water_2000")],
+            [InlineKeyboardButton(text="2500 ml", callback_data="set_water_2500"), 
+             InlineKeyboardButton(text="3000 ml", callback_data="set_water_3000")],
+            [InlineKeyboardButton(text="🔙 Back to menu", callback_data="open_menu")]
+        ]
+        await query.edit_message_text(
+            text="⚙️ *Water settings*\n\nChoose a daily goal:", 
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    async def _cb_set_water_goal(self, query, context, db_user, goal: int):
+        await self.supabase_service.set_user_water_goal(db_user.id, goal)
+        self.report_cache.bump(db_user.telegram_id)
+        keyboard = [[InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]]
+        await query.edit_message_text(
+            text=f"✅ Daily water goal set: *{goal} ml*", 
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    def _cb_choose_plan(self, plan_type: str):
+        # Обработка подписок - новая система с выбором провайдера
+        async def handler(query, context, db_user):
+            await self._show_provider_selection(query, db_user, plan_type)
+        return handler
+
+    async def _cb_subscribe(self, query, context, db_user, plan_type: str, provider: str):
+        # subscribe_<plan>_<provider>; провайдер может содержать подчеркивания (telegram_stars)
+        await self._handle_subscription_request(query, context, db_user, plan_type, provider)
+
+    async def _cb_crypto_paid(self, query, context, db_user, plan_type: str):
+        await self._handle_crypto_paid(query, db_user, plan_type)
+
+    async def _cb_subscription_stats(self, query, context, db_user):
+        await self._show_subscription_stats(query, db_user)
+
+    async def _cb_subscription_plans(self, query, context, db_user):
+        keyboard = [
+            [InlineKeyboardButton("💳 Monthly plan", callback_data="choose_monthly")],
+            [InlineKeyboardButton("💰 Yearly plan", callback_data="choose_yearly")],
+            [InlineKeyboardButton("🔙 Back", callback_data="subscription_stats")],
+            [InlineKeyboardButton("📋 Menu", callback_data="open_menu")]
+        ]
+        await query.edit_message_text(
+            text="Choose a subscription plan:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    async def _cb_cancel_subscription(self, query, context, db_user):
+        await self._handle_subscription_cancellation(query, db_user)
+
+    async def _cb_confirm_cancel_subscription(self, query, context, db_user):
+        # Отменяем подписку
+        success = await self.subscription_service.cancel_subscription(db_user.telegram_id)
+        if success:
+            message = (
+                f"✅ *Подписка отменена*\n\n"
+                f"Автопродление отключено.\n"
+                f"Подписка останется активной до конца текущего периода."
+            )
+        else:
+            message = "❌ Ошибка отмены подписки. Попробуйте позже."
+            
+        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="subscription_stats")]]
+        await query.edit_message_text(
+            text=message,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+    async def _show_recent_meals(self, query, db_user, notice: str = None):
+        """Меню частых блюд: одно нажатие — повторная запись без фото"""
+        meals = await self.supabase_service.get_recent_meals(db_user.id)
+        keyboard = [
+            [InlineKeyboardButton(
+                text=f"🔁 {meal['food_name']} · {float(meal['calories']):.0f} kcal",
+                callback_data=f"relog_{meal['id']}"
+            )]
+            for meal in meals
+        ]
+        keyboard.append([InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")])
+        if meals:
+            text = "🍽 *Recent meals*\n\nTap a meal to log it again — no photo needed."
+        else:
+            text = "🍽 *Recent meals*\n\nNo meals yet. Send a photo or type what you ate, and it will appear here."
+        if notice:
+            text = f"{notice}\n\n{text}"
+        await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    
     async def _show_provider_selection(self, query, db_user, plan_type: str):
         """Показать выбор провайдера для оплаты (только крипто)."""
         try:
@@ -386,15 +449,16 @@ class CommandHandler:
                 # 1) Проверим, нет ли уже pending для этого пользователя/плана за последние 24ч
                 from datetime import timedelta
                 since_iso = (datetime.utcnow() - timedelta(hours=24)).isoformat()
-                existing = self.supabase_service.supabase.table('payments') \
-                    .select('*') \
-                    .eq('user_id', db_user.id) \
-                    .eq('plan_type', plan_type) \
-                    .eq('status', 'pending') \
-                    .gte('created_at', since_iso) \
-                    .order('created_at', desc=True) \
-                    .limit(1) \
-                    .execute()
+                existing = await self.supabase_service.execute(
+                    self.supabase_service.supabase.table('payments')
+                    .select('*')
+                    .eq('user_id', db_user.id)
+                    .eq('plan_type', plan_type)
+                    .eq('status', 'pending')
+                    .gte('created_at', since_iso)
+                    .order('created_at', desc=True)
+                    .limit(1)
+                )
                 existing_pay = (existing.data or [None])[0]
 
                 base_price = float(plan.get('price', 4.99 if plan_type == 'monthly' else 49.99))
@@ -408,7 +472,7 @@ class CommandHandler:
                     provider_payment_id = existing_pay.get('provider_payment_id') or f"pending:{db_user.id}:{int(datetime.utcnow().timestamp())}:{uuid.uuid4().hex[:8]}"
                 else:
                     provider_payment_id = f"pending:{db_user.id}:{int(datetime.utcnow().timestamp())}:{uuid.uuid4().hex[:8]}"
-                    self.supabase_service.supabase.table('payments').insert({
+                    await self.supabase_service.execute(self.supabase_service.supabase.table('payments').insert({
                         'user_id': db_user.id,
                         'amount': expected_amount,
                         'currency': 'USDT',
@@ -418,7 +482,7 @@ class CommandHandler:
                         'provider_payment_id': provider_payment_id,
                         'plan_type': plan_type,
                         'created_at': datetime.utcnow().isoformat()
-                    }).execute()
+                    }))
 
                 # Собираем инструкции с конкретной суммой и адресами из настроек
                 from config.settings import settings
@@ -475,15 +539,16 @@ class CommandHandler:
             # Переиспользуем существующий pending или создаём новый, если нет
             from datetime import timedelta
             since_iso = (datetime.utcnow() - timedelta(hours=24)).isoformat()
-            existing = self.supabase_service.supabase.table('payments') \
-                .select('*') \
-                .eq('user_id', db_user.id) \
-                .eq('plan_type', plan_type) \
-                .eq('status', 'pending') \
-                .gte('created_at', since_iso) \
-                .order('created_at', desc=True) \
-                .limit(1) \
-                .execute()
+            existing = await self.supabase_service.execute(
+                self.supabase_service.supabase.table('payments')
+                .select('*')
+                .eq('user_id', db_user.id)
+                .eq('plan_type', plan_type)
+                .eq('status', 'pending')
+                .gte('created_at', since_iso)
+                .order('created_at', desc=True)
+                .limit(1)
+            )
             existing_pay = (existing.data or [None])[0]
 
             if not existing_pay:
@@ -495,7 +560,7 @@ class CommandHandler:
                 amount = round(base_price + unique_delta, 2)
                 provider_payment_id = f"pending:{db_user.id}:{int(datetime.utcnow().timestamp())}:{uuid.uuid4().hex[:8]}"
 
-                self.supabase_service.supabase.table('payments').insert({
+                await self.supabase_service.execute(self.supabase_service.supabase.table('payments').insert({
                     'user_id': db_user.id,
                     'amount': amount,
                     'currency': 'USDT',
@@ -505,7 +570,7 @@ class CommandHandler:
                     'provider_payment_id': provider_payment_id,
                     'plan_type': plan_type,
                     'created_at': datetime.utcnow().isoformat()
-                }).execute()
+                }))
 
             keyboard = [[InlineKeyboardButton("🔙 Назад к планам", callback_data="subscription_stats")]]
             await query.edit_message_text(
@@ -883,35 +948,15 @@ class CommandHandler:
             # Отправляем сообщение о начале обработки
             processing_msg = await update.message.reply_text("📊 Загружаю статистику за сегодня...")
             
-            # Получаем данные о питании за сегодня
-            nutrition_data = await self.supabase_service.get_user_nutrition_today(db_user.id)
-            
-            # Формируем цели пользователя
-            user_goals = {
-                'calories': db_user.daily_calories_goal,
-                'protein': db_user.daily_protein_goal,
-                'fats': db_user.daily_fats_goal,
-                'carbs': db_user.daily_carbs_goal
-            }
-            
-            # Формируем статистику пользователя
-            user_stats = {
-                'total_photos_sent': db_user.total_photos_sent
-            }
-            
-            # Генерируем отчет
-            report = ReportGenerator.format_daily_report(nutrition_data, user_goals, user_stats)
-            
-            # Вода за сегодня
-            water_today = await self.supabase_service.get_water_today(db_user.id)
-            water_text = ReportGenerator.format_water_status(water_today, db_user.daily_water_goal_ml)
+            # КБЖУ и вода за сегодня — одним запросом
+            text = await self._day_report_text(db_user)
             keyboard = [
                 [InlineKeyboardButton(text="➕ Вода +250мл", callback_data="water_add_250")],
                 [InlineKeyboardButton(text="📋 Меню", callback_data="open_menu")]
             ]
             # Удаляем сообщение о загрузке и отправляем отчет
             await processing_msg.delete()
-            await update.message.reply_text(f"{report}\n\n{water_text}", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+            await update.message.reply_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
             
         except Exception as e:
             logger.error(f"Ошибка в команде stats: {e}")
@@ -931,36 +976,12 @@ class CommandHandler:
             # Отправляем сообщение о начале обработки
             processing_msg = await update.message.reply_text("📈 Загружаю статистику за неделю...")
             
-            # Получаем данные о питании за неделю
-            week_data = await self.supabase_service.get_user_nutrition_week(db_user.id)
-            
-            # Формируем цели пользователя
-            user_goals = {
-                'calories': db_user.daily_calories_goal,
-                'protein': db_user.daily_protein_goal,
-                'fats': db_user.daily_fats_goal,
-                'carbs': db_user.daily_carbs_goal
-            }
-            
-            # Генерируем отчет
-            report = ReportGenerator.format_weekly_report(week_data, user_goals)
-            
-            # Вода по дням недели
-            water_week = await self.supabase_service.get_water_week(db_user.id)
-            # Преобразуем в дни Пн..Вс
-            from datetime import date, timedelta
-            days = ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"]
-            start = date.today() - timedelta(days=6)
-            bars = {}
-            for i in range(7):
-                d = start + timedelta(days=i)
-                key = d.isoformat()
-                bars[days[i]] = water_week.get(key, 0)
-            water_graph = ReportGenerator.format_weekly_water(bars)
+            # КБЖУ за неделю и вода по дням — одним запросом
+            text = await self._week_report_text(db_user, ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"])
             keyboard = [[InlineKeyboardButton(text="📋 Меню", callback_data="open_menu")]]
             # Удаляем сообщение о загрузке и отправляем отчет
             await processing_msg.delete()
-            await update.message.reply_text(f"{report}\n\n{water_graph}", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+            await update.message.reply_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
             
         except Exception as e:
             logger.error(f"Ошибка в команде week: {e}")
@@ -1,40 +1,73 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from services.supabase_service import SupabaseService
-from services.openai_service import OpenAIService, OpenAIQuotaError
-from services.g4f_service import G4FService
-from services.subscription_service import SubscriptionService
+from services.openai_service import OpenAIQuotaError
+from services.analysis_queue import AnalysisQueue
+from services.food_photo_gate import FoodPhotoGate
+from services.container import ServiceContainer
 from config.settings import settings
 from utils.report_generator import ReportGenerator
-from models.data_models import User, FoodImage, NutritionData, DailyReport
+from utils.dates import local_today
+from utils.message_lifecycle import finish_status_message
+from utils.metrics import metrics
+from utils.logging_setup import bind_log_context
+from models.data_models import User, FoodImage, NutritionData, DailyReport, NutritionAnalysis
 from datetime import datetime, date
+from typing import Optional
+import asyncio
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
 class MessageHandler:
-    def __init__(self):
-        self.supabase_service = SupabaseService()
-        self.openai_service = OpenAIService()
-        self.g4f_service = G4FService() if settings.ENABLE_G4F_FALLBACK else None
-        self.subscription_service = SubscriptionService()
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        self.services = services or ServiceContainer()
+        self.supabase_service = self.services.supabase_service
+        self.openai_service = self.services.openai_service
+        self.g4f_service = self.services.g4f_service
+        self.subscription_service = self.services.subscription_service
+        self.food_photo_gate = self.services.food_photo_gate
+        self.food_database = self.services.food_database
+        self.report_cache = self.services.report_cache
+        self.analysis_queue = AnalysisQueue(self.process_analysis_job, on_give_up=self._on_analysis_job_failed)
     
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Photo processor"""
+        prepare_task = None
+        status_task = None
+        reserved_for = None  # db id пользователя, если бесплатное фото зарезервировано, но еще не в очереди
+        bind_log_context(route="photo")
         try:
             user = update.effective_user
             
+            # Получаем фотографию
+            photo = update.message.photo[-1]  # Берем самое большое изображение
+            
+            # Спекулятивно скачиваем и готовим фото, пока идут проверка подписки и отправка
+            # сообщения о загрузке; если анализ не разрешен — эта работа отменяется
+            prepare_task = asyncio.create_task(self._download_and_prepare(context.bot, photo.file_id))
+            
+            # Send processing message (English)
+            status_task = asyncio.create_task(update.message.reply_text("🔍 Analyzing image..."))
+            
             # Получаем пользователя из БД
             db_user = await self.supabase_service.get_user_by_telegram_id(user.id)
             if not db_user:
-                await update.message.reply_text("❌ User not found. Please use /start to register.")
+                self._discard_task(prepare_task)
+                processing_msg = await status_task
+                await processing_msg.edit_text("❌ User not found. Please use /start to register.")
+                self._count_photo_api_calls(3)  # заглушка, getFile спекулятивного скачивания и правка
                 return
             
             # Проверяем подписку перед анализом
-            subscription_check = await self.subscription_service.can_analyze_photo(user.id)
+            # Бесплатное фото резервируется сразу: счетчик анализов вырастет только в воркере
+            subscription_check = await self.subscription_service.can_analyze_photo(user.id, user=db_user, reserve=True)
+            if subscription_check.get("reserved"):
+                reserved_for = db_user.id
+            processing_msg = await status_task
             
             if not subscription_check["can_analyze"]:
+                self._discard_task(prepare_task)
                 if subscription_check["reason"] == "subscription_required":
                     # Показываем планы подписки с выбором провайдера
                     plans = subscription_check["subscription_plans"]
@@ -67,136 +100,289 @@ class MessageHandler:
                     
                     message += f"\nAfter payment you will be able to analyze an unlimited number of photos!"
                     
-                    await update.message.reply_text(message, parse_mode='Markdown', 
-                                                 reply_markup=InlineKeyboardMarkup(keyboard))
+                    # Превращаем сообщение о загрузке в предложение подписки
+                    await processing_msg.edit_text(message, parse_mode='Markdown', 
+                                                   reply_markup=InlineKeyboardMarkup(keyboard))
+                    self._count_photo_api_calls(3)
                     return
                 else:
-                    await update.message.reply_text("❌ Error checking subscription. Try again later.")
+                    await processing_msg.edit_text("❌ Error checking subscription. Try again later.")
+                    self._count_photo_api_calls(3)
                     return
             
-            # Send processing message (English)
-            processing_msg = await update.message.reply_text("🔍 Analyzing image...")
-            
-            # Получаем фотографию
-            photo = update.message.photo[-1]  # Берем самое большое изображение
-            
-            # Скачиваем изображение
-            file = await context.bot.get_file(photo.file_id)
-            image_bytes = await file.download_as_bytearray()
-            
-            # Сохраняем изображение в Supabase Storage (опционально)
-            # Для простоты пока сохраняем URL файла
-            image_url = file.file_path
-            
-            # Создаем запись о фотографии
-            food_image = FoodImage(
-                user_id=db_user.id,
-                image_url=image_url,
-                status="processing"
-            )
-            created_image = await self.supabase_service.create_food_image(food_image)
-            
-            # Увеличиваем счетчик общих отправленных фото
-            await self.supabase_service.increment_total_photos_sent(user.id)
-            
+            # К этому моменту фото обычно уже скачано и сжато
             try:
-                # Анализируем изображение через OpenAI
-                nutrition_analysis = self.openai_service.analyze_food_image(image_bytes)
-                
-                # Создаем запись о питательных веществах
-                nutrition_data = NutritionData(
-                    food_image_id=created_image.id,
-                    calories=nutrition_analysis.calories,
-                    protein=nutrition_analysis.protein,
-                    fats=nutrition_analysis.fats,
-                    carbs=nutrition_analysis.carbs,
-                    food_name=nutrition_analysis.food_name,
-                    confidence=nutrition_analysis.confidence
-                )
-                
-                await self.supabase_service.create_nutrition_data(nutrition_data)
-                
-                # Обновляем статус фотографии
-                await self.supabase_service.update_food_image_status(created_image.id, "processed")
-                
-                # Обновляем дневной отчет
-                await self._update_daily_report(db_user.id)
-                
-                # Форматируем результат
-                result_message = ReportGenerator.format_nutrition_result({
-                    'food_name': nutrition_analysis.food_name,
-                    'calories': nutrition_analysis.calories,
-                    'protein': nutrition_analysis.protein,
-                    'fats': nutrition_analysis.fats,
-                    'carbs': nutrition_analysis.carbs,
-                    'weight_grams': nutrition_analysis.weight_grams
-                })
-                
-                # Buttons after analysis
-                tg_weight = int(nutrition_analysis.weight_grams) if nutrition_analysis.weight_grams else 200
-                keyboard = [
-                    [InlineKeyboardButton(text="➕ Water +250ml", callback_data="water_add_250")],
-                    [InlineKeyboardButton(text=f"⚖️ Change weight ({tg_weight} g)", callback_data=f"change_weight_{created_image.id}_{tg_weight}")],
-                    [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
-                ]
-                # Увеличиваем счетчик проанализированных фото
-                await self.subscription_service.increment_photos_analyzed(user.id)
-                
-                # Удаляем сообщение о загрузке и отправляем результат
-                await processing_msg.delete()
-                await update.message.reply_text(result_message, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-                
-            except OpenAIQuotaError:
-                logger.error("Analysis stopped: OpenAI quota exceeded")
-                # Если включен фолбэк g4f — пробуем анализ по URL
-                if self.g4f_service:
-                    fallback_result = self.g4f_service.analyze_food_image_url(image_url)
-                    if fallback_result:
-                        nutrition_data = NutritionData(
-                            food_image_id=created_image.id,
-                            calories=fallback_result.calories,
-                            protein=fallback_result.protein,
-                            fats=fallback_result.fats,
-                            carbs=fallback_result.carbs,
-                            food_name=fallback_result.food_name,
-                            confidence=fallback_result.confidence
-                        )
-                        await self.supabase_service.create_nutrition_data(nutrition_data)
-                        await self.supabase_service.update_food_image_status(created_image.id, "processed")
-                        await self._update_daily_report(db_user.id)
-                        result_message = ReportGenerator.format_nutrition_result({
-                            'food_name': fallback_result.food_name,
-                            'calories': fallback_result.calories,
-                            'protein': fallback_result.protein,
-                            'fats': fallback_result.fats,
-                            'carbs': fallback_result.carbs,
-                            'confidence': fallback_result.confidence
-                        })
-                        keyboard = [
-                            [InlineKeyboardButton(text="➕ Water +250ml", callback_data="water_add_250")],
-                            [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
-                        ]
-                        await processing_msg.delete()
-                        await update.message.reply_text(result_message, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-                        return
-                await self.supabase_service.update_food_image_status(created_image.id, "error")
-                await processing_msg.delete()
-                await update.message.reply_text("⚠️ OpenAI quota exceeded. Try again later or check API billing.")
+                prepared_image, image_url = await prepare_task
             except Exception as e:
-                logger.error(f"Image analysis error: {e}")
-                await self.supabase_service.update_food_image_status(created_image.id, "error")
-                await processing_msg.delete()
-                await update.message.reply_text("❌ Image analysis error. Please try again.")
+                logger.warning("Предварительное скачивание фото не удалось, воркер скачает сам: %s", e)
+                prepared_image, image_url = None, None
+            
+            # Ставим анализ в очередь: анализ, сохранение и ответ выполнит воркер
+            await self.analysis_queue.enqueue({
+                "chat_id": update.effective_chat.id,
+                "telegram_id": user.id,
+                "user_id": db_user.id,
+                "file_id": photo.file_id,
+                "image_url": image_url,
+                "prepared": prepared_image is not None,
+                "status_message_id": processing_msg.message_id,
+                # Вызовы Bot API на это фото: сообщение о загрузке и getFile
+                "api_calls": 2,
+                "reserved": reserved_for is not None,
+            }, image=prepared_image)
+            reserved_for = None
+            logger.debug("Фото поставлено в очередь анализа: prepared=%s", prepared_image is not None)
                 
         except Exception as e:
-            logger.error(f"Photo handling error: {e}")
+            logger.error("Photo handling error: %s", e, exc_info=True)
+            if reserved_for is not None:
+                await self.supabase_service.release_photo_reservation(reserved_for)
+            if prepare_task:
+                self._discard_task(prepare_task)
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
             ])
-            await update.message.reply_text(
+            # Дожидаемся сообщения о загрузке и превращаем его в ответ об ошибке — иначе
+            # оно пришло бы позже и так и висело бы «Analyzing image...»
+            status_message_id = None
+            if status_task:
+                try:
+                    status_message_id = (await status_task).message_id
+                except Exception:
+                    pass  # Заглушка не отправилась — ответим новым сообщением
+            _, calls = await finish_status_message(
+                context.bot, update.effective_chat.id, status_message_id,
                 "❌ An error occurred. Please try again later.",
                 reply_markup=keyboard
             )
+            self._count_photo_api_calls(2 + calls)
+        finally:
+            # В том числе при отмене хендлера: ни одна задача не остается висеть
+            # и не пишет «Task exception was never retrieved»
+            for task in (prepare_task, status_task):
+                if task:
+                    self._discard_task(task)
+    
+    async def _download_and_prepare(self, bot, file_id: str):
+        """Скачать фото и сразу, как только пришли байты, подготовить его для API"""
+        file = await bot.get_file(file_id)
+        image_bytes = await file.download_as_bytearray()
+        prepared_image = await asyncio.to_thread(self.openai_service.prepare_image, bytes(image_bytes))
+        return prepared_image, file.file_path
+    
+    @staticmethod
+    def _discard_task(task: asyncio.Task):
+        """Отменить спекулятивную задачу, не оставляя неполученных исключений (для завершенной — только прочитать исключение)"""
+        task.cancel()
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    async def process_analysis_job(self, job: dict):
+        """Воркер очереди: анализ, сохранение и ответ пользователю"""
+        bot = self.analysis_queue.bot
+        
+        # Анализ уже сохранен до падения — осталось только ответить
+        if job.get("result"):
+            await self._finish_analysis_job(job, job["result"])
+            return
+        
+        # Фото обычно скачано и подготовлено хендлером; иначе скачиваем сами
+        image_bytes = job.get("image")
+        if image_bytes is None:
+            file = await bot.get_file(job["file_id"])
+            job["api_calls"] = job.get("api_calls", 0) + 1
+            image_bytes = bytes(await file.download_as_bytearray())
+            job["prepared"] = False
+            
+            # Сохраняем изображение в Supabase Storage (опционально)
+            # Для простоты пока сохраняем URL файла
+            job["image_url"] = file.file_path
+        
+        await self.analyze_job_image(job, image_bytes, job["image_url"])
+    
+    async def analyze_job_image(self, job: dict, image_bytes: bytes, image_url: str) -> bool:
+        """Анализ уже скачанного фото, сохранение результата и ответ пользователю.
+        
+        Используется воркерами очереди и фоновым переанализом зависших фото
+        (для него `job["recovered"]` = True: ошибки пользователю не отправляются).
+        """
+        if not await self._analyze_and_record_job(job, image_bytes, image_url):
+            return False
+        
+        # Ответ — вне обработки ошибок анализа: блюдо уже записано, и сбой отправки
+        # (в т.ч. исчерпанный RetryAfter) не должен помечать фото как ошибку. Задача
+        # очереди при повторе только переотправит ответ (job["result"] сохранен)
+        try:
+            await self._finish_analysis_job(job, job["result"])
+        except Exception as e:
+            if not job.get("recovered"):
+                raise
+            logger.warning(f"Не удалось отправить результат переанализа фото {job.get('food_image_id')}: {e}")
+        return True
+    
+    async def _analyze_and_record_job(self, job: dict, image_bytes: bytes, image_url: str) -> bool:
+        """Фильтр, анализ и запись результата в `job["result"]`; False — результата не будет (пользователю уже ответили)"""
+        try:
+            # Очевидно непригодные фото (темные, пустые, размытые, скриншоты) отсекаем до платного вызова
+            if self.food_photo_gate:
+                rejection = await asyncio.to_thread(self.food_photo_gate.check, image_bytes)
+                if rejection:
+                    await self._release_job_reservation(job)
+                    await self._mark_job_image(job, image_url, "rejected", rejection_reason=rejection)
+                    if not job.get("recovered"):
+                        keyboard = InlineKeyboardMarkup([
+                            [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
+                        ])
+                        await self._reply_to_job(
+                            job,
+                            f"🤔 This doesn't look like a food photo: {FoodPhotoGate.REASONS[rejection]}.\n"
+                            f"Please send a clear, well-lit photo of your meal.",
+                            reply_markup=keyboard
+                        )
+                    return False
+            
+            # Анализируем изображение через OpenAI (синхронный клиент — в отдельном потоке)
+            nutrition_analysis = await asyncio.to_thread(
+                self.openai_service.analyze_food_image, image_bytes, prepared=job.get("prepared", False)
+            )
+            
+            # Фото, КБЖУ, статус, счетчики и дневной отчет — одной транзакцией
+            await self._record_job_analysis(job, nutrition_analysis, image_url)
+            
+            job["result"] = {
+                'food_name': nutrition_analysis.food_name,
+                'calories': nutrition_analysis.calories,
+                'protein': nutrition_analysis.protein,
+                'fats': nutrition_analysis.fats,
+                'carbs': nutrition_analysis.carbs,
+                'weight_grams': nutrition_analysis.weight_grams
+            }
+            self._save_job_progress(job)
+            return True
+            
+        except OpenAIQuotaError:
+            logger.error("Analysis stopped: OpenAI quota exceeded")
+            # Если включен фолбэк g4f — пробуем анализ по URL
+            if self.g4f_service:
+                fallback_result = await asyncio.to_thread(self.g4f_service.analyze_food_image_url, image_url)
+                if fallback_result:
+                    await self._record_job_analysis(job, fallback_result, image_url)
+                    job["result"] = {
+                        'food_name': fallback_result.food_name,
+                        'calories': fallback_result.calories,
+                        'protein': fallback_result.protein,
+                        'fats': fallback_result.fats,
+                        'carbs': fallback_result.carbs,
+                        'confidence': fallback_result.confidence
+                    }
+                    self._save_job_progress(job)
+                    return True
+            await self._release_job_reservation(job)
+            await self._mark_job_image(job, image_url)
+            if not job.get("recovered"):
+                await self._reply_to_job(job, "⚠️ OpenAI quota exceeded. Try again later or check API billing.")
+            return False
+        except Exception as e:
+            logger.error(f"Image analysis error: {e}")
+            await self._release_job_reservation(job)
+            await self._mark_job_image(job, image_url)
+            if not job.get("recovered"):
+                await self._reply_to_job(job, "❌ Image analysis error. Please try again.")
+            return False
+    
+    async def _record_job_analysis(self, job: dict, analysis: NutritionAnalysis, image_url: str):
+        """Сохранить результат анализа одним RPC и запомнить id записи о фото"""
+        recorded = await self.supabase_service.record_analysis(
+            user_id=job["user_id"],
+            image_url=image_url,
+            analysis=analysis,
+            report_date=local_today(),
+            food_image_id=job.get("food_image_id"),
+            reserved=job.get("reserved", False)
+        )
+        job["food_image_id"] = recorded["food_image_id"]
+        # Резерв списан той же транзакцией
+        job["reserved"] = False
+        self.report_cache.bump(job["telegram_id"])
+    
+    async def _mark_job_image(self, job: dict, image_url: str, status: str = "error", rejection_reason: str = None):
+        """Сохранить фото без результата анализа.
+        
+        status=error — его подберет фоновый переанализ; status=rejected — отсечено
+        локальным фильтром и не переанализируется.
+        """
+        try:
+            if job.get("food_image_id") is not None:
+                await self.supabase_service.update_food_image_status(
+                    job["food_image_id"], status, rejection_reason=rejection_reason
+                )
+                return
+            created_image = await self.supabase_service.create_food_image(FoodImage(
+                user_id=job["user_id"],
+                image_url=image_url,
+                status=status,
+                rejection_reason=rejection_reason
+            ))
+            # Увеличиваем счетчик общих отправленных фото
+            await self.supabase_service.increment_total_photos_sent(job["telegram_id"])
+            self.report_cache.bump(job["telegram_id"])
+            job["food_image_id"] = created_image.id
+        except Exception as e:
+            logger.error(f"Ошибка сохранения фото без результата анализа: {e}")
+    
+    async def _release_job_reservation(self, job: dict):
+        """Вернуть резерв бесплатного фото, если анализ не будет записан"""
+        if job.get("reserved"):
+            job["reserved"] = False
+            await self.supabase_service.release_photo_reservation(job["user_id"])
+            self._save_job_progress(job)
+
+    def _save_job_progress(self, job: dict):
+        """Сохранить прогресс, если задача пришла из очереди"""
+        if "id" in job:
+            self.analysis_queue.save_progress(job)
+    
+    async def _on_analysis_job_failed(self, job: dict, error: Exception):
+        """Задача не выполнена после всех попыток (например, не удалось скачать фото)"""
+        if job.get("result"):
+            # Блюдо записано, не удалось только ответить — фото не помечаем ошибкой
+            logger.warning(f"Не удалось отправить результат анализа фото {job.get('food_image_id')}: {error}")
+            return
+        await self._release_job_reservation(job)
+        if job.get("food_image_id") is not None:
+            await self.supabase_service.update_food_image_status(job["food_image_id"], "error")
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
+        ])
+        await self._reply_to_job(job, "❌ An error occurred. Please try again later.", reply_markup=keyboard)
+    
+    async def _finish_analysis_job(self, job: dict, result: dict):
+        """Отправить пользователю результат анализа"""
+        # Форматируем результат
+        result_message = ReportGenerator.format_nutrition_result(result)
+        if job.get("recovered"):
+            result_message = f"♻️ *Your earlier photo has been analyzed*\n\n{result_message}"
+        
+        # Buttons after analysis
+        keyboard = [[InlineKeyboardButton(text="➕ Water +250ml", callback_data="water_add_250")]]
+        if 'weight_grams' in result:
+            tg_weight = int(result['weight_grams']) if result['weight_grams'] else 200
+            keyboard.append([InlineKeyboardButton(text=f"⚖️ Change weight ({tg_weight} g)", callback_data=f"change_weight_{job['food_image_id']}_{tg_weight}")])
+        keyboard.append([InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")])
+        
+        await self._reply_to_job(job, result_message, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def _reply_to_job(self, job: dict, text: str, **kwargs):
+        """Превратить сообщение о загрузке в ответ (правкой; новое сообщение — только если править нельзя)"""
+        _, calls = await finish_status_message(
+            self.analysis_queue.bot, job["chat_id"], job.get("status_message_id"), text, **kwargs
+        )
+        self._count_photo_api_calls(job.get("api_calls", 0) + calls)
+    
+    @staticmethod
+    def _count_photo_api_calls(calls: int):
+        """Учесть вызовы Bot API, потраченные на одно фото (среднее = calls_total / answered_total)"""
+        metrics.increment("photo_bot_api_calls_total", calls)
+        metrics.increment("photo_answered_total")
     
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
@@ -214,25 +400,11 @@ class MessageHandler:
                     new_weight = int(''.join(ch for ch in text if ch.isdigit()))
                     if new_weight <= 0:
                         raise ValueError
-                    nd = self.supabase_service.supabase.table("nutrition_data").select("id, calories, protein, fats, carbs, weight_grams").eq("food_image_id", awaiting_image_id).order("created_at", desc=True).limit(1).execute()
-                    if nd.data:
-                        row = nd.data[0]
-                        old_w = row.get("weight_grams") or new_weight
-                        factor = new_weight / old_w if old_w else 1
-                        updated = {
-                            "calories": round(row["calories"] * factor, 1),
-                            "protein": round(row["protein"] * factor, 1),
-                            "fats": round(row["fats"] * factor, 1),
-                            "carbs": round(row["carbs"] * factor, 1),
-                            "weight_grams": new_weight,
-                        }
-                        self.supabase_service.supabase.table("nutrition_data").update(updated).eq("id", row["id"]).execute()
-                        img = self.supabase_service.supabase.table("food_images").select("user_id").eq("id", awaiting_image_id).single().execute()
-                        user_id = img.data["user_id"] if img and img.data else None
-                        if user_id:
-                            await self._update_daily_report(user_id)
-                        # Показываем обновленный экран с результатами анализа
-                        await self._show_nutrition_analysis_screen(update, awaiting_image_id, new_weight)
+                    # Пересчет КБЖУ и поправка дневного отчета — одним RPC, он же возвращает строку для экрана
+                    row = await self.supabase_service.rescale_nutrition(awaiting_image_id, new_weight, update.effective_user.id)
+                    self.report_cache.bump(update.effective_user.id)
+                    if row:
+                        await self._show_nutrition_analysis_screen(update, awaiting_image_id, row=row)
                     else:
                         await update.message.reply_text(
                             "❌ Could not find analysis for this image.",
@@ -245,9 +417,20 @@ class MessageHandler:
                     context.user_data.pop("awaiting_weight_for_image", None)
                 return
             
+            # Текстовая запись еды («200g rice, 2 eggs») по локальной базе продуктов — без вызова API
+            items, unknown, implausible = self.food_database.parse_meal(text)
+            if implausible:
+                # Опечатка в количестве испортила бы дневной отчет — ничего не записываем
+                await self._ask_to_clarify_meal(update, implausible)
+                return
+            if items:
+                await self._log_text_meal(update, text, items, unknown)
+                return
+            
             # If not a command, send a hint (English)
             await update.message.reply_text(
-                "📸 Send a photo of your meal to analyze nutrition!\n\n"
+                "📸 Send a photo of your meal to analyze nutrition!\n"
+                "✍️ Or type what you ate, e.g. \"200g rice, 2 eggs\"\n\n"
                 "Or use commands:\n"
                 "/stats - today stats\n"
                 "/week - weekly stats\n"
@@ -264,39 +447,64 @@ class MessageHandler:
                 reply_markup=keyboard
             )
     
-    async def _update_daily_report(self, user_id: int):
-        """Обновить дневной отчет пользователя"""
-        try:
-            # Получаем данные о питании за сегодня
-            nutrition_data = await self.supabase_service.get_user_nutrition_today(user_id)
-            
-            # Создаем или обновляем дневной отчет
-            daily_report = DailyReport(
-                user_id=user_id,
-                date=date.today(),
-                total_calories=nutrition_data['calories'],
-                total_protein=nutrition_data['protein'],
-                total_fats=nutrition_data['fats'],
-                total_carbs=nutrition_data['carbs']
-            )
-            
-            await self.supabase_service.create_or_update_daily_report(daily_report)
-            
-        except Exception as e:
-            logger.error(f"Ошибка обновления дневного отчета: {e}")
-
-    async def _show_nutrition_analysis_screen(self, update: Update, image_id: int, weight_grams: int = None):
-        """Показывает экран с результатами анализа питания"""
+    async def _ask_to_clarify_meal(self, update: Update, implausible: list):
+        """Попросить уточнить количество, которое похоже на опечатку"""
+        parts = ", ".join(part.translate(str.maketrans("", "", "*_`[]")) for part in implausible)
+        await update.message.reply_text(
+            f"🤔 This amount looks too large: {parts}\n\n"
+            f"Nothing was saved. Please send the meal again with the portion in grams "
+            f"(up to {self.food_database.MAX_ITEM_GRAMS} g) or pieces "
+            f"(up to {self.food_database.MAX_ITEM_PIECES}), e.g. \"150g ice cream\"."
+        )
+    
+    async def _log_text_meal(self, update: Update, text: str, items: list, unknown: list):
+        """Сохранить прием пищи, распознанный из текста, и показать итог"""
+        db_user = await self.supabase_service.get_user_by_telegram_id(update.effective_user.id)
+        if not db_user:
+            await update.message.reply_text("❌ User not found. Please use /start to register.")
+            return
+        
+        await self.supabase_service.record_text_meal(db_user.id, text, items, local_today())
+        self.report_cache.bump(update.effective_user.id)
+        
+        lines = [f"• {item.food_name} — {item.weight_grams:.0f} g: {item.calories:.0f} kcal" for item in items]
+        message = (
+            "✍️ *Meal logged from text*\n\n"
+            + "\n".join(lines)
+            + f"\n\n📊 **Total:** {sum(i.calories for i in items):.0f} kcal · "
+            f"P {sum(i.protein for i in items):.1f} g · "
+            f"F {sum(i.fats for i in items):.1f} g · "
+            f"C {sum(i.carbs for i in items):.1f} g"
+        )
+        if unknown:
+            # Фрагменты пользовательского текста — без символов разметки Markdown
+            skipped = ", ".join(part.translate(str.maketrans("", "", "*_`[]")) for part in unknown)
+            message += f"\n\n⚠️ Not recognized: {skipped}"
+        message += "\n\n✅ Saved to your diary!"
+        
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(text="📋 Menu", callback_data="open_menu")]
+        ])
+        await update.message.reply_text(message, parse_mode='Markdown', reply_markup=keyboard)
+    
+    async def _show_nutrition_analysis_screen(self, update: Update, image_id: int, weight_grams: int = None, row: dict = None):
+        """Показывает экран с результатами анализа питания
+        
+        row — уже известная строка nutrition_data (например, результат rescale_nutrition);
+        если не передана, читается из базы.
+        """
         try:
-            # Получаем данные анализа из базы
-            nd = self.supabase_service.supabase.table("nutrition_data").select("id, calories, protein, fats, carbs, weight_grams, food_name, confidence").eq("food_image_id", image_id).order("created_at", desc=True).limit(1).execute()
-            
-            if not nd.data:
-                await update.message.reply_text("❌ Could not find analysis data.")
-                return
-            
-            row = nd.data[0]
-            current_weight = weight_grams if weight_grams is not None else row.get("weight_grams", 200)
+            if row is None:
+                # Получаем данные анализа из базы
+                nd = await self.supabase_service.execute(self.supabase_service.supabase.table("nutrition_data").select("id, calories, protein, fats, carbs, weight_grams, food_name, confidence").eq("food_image_id", image_id).order("created_at", desc=True).limit(1))
+                
+                if not nd.data:
+                    await update.message.reply_text("❌ Could not find analysis data.")
+                    return
+                
+                row = nd.data[0]
+            current_weight = weight_grams if weight_grams is not None else row.get("weight_grams") or 200
+            current_weight = int(float(current_weight))
             
             # Форматируем результат с актуальным весом
             result_message = ReportGenerator.format_nutrition_result({
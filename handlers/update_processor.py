@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config.settings import settings
+from utils.logging_setup import log_context
+
+
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри одного чата.
+
+    Обновления разных чатов обрабатываются одновременно (не больше
+    `max_concurrent_updates` сразу), а обновления одного чата — строго по очереди:
+    например, введенный вес после нажатия «Change weight» не обгонит само нажатие.
+
+    Очередь чата ждется до захвата общего слота, поэтому пользователь, отправивший
+    пачку фото, занимает не больше одного слота и не тормозит остальных.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """Ключ упорядочивания: чат, а для обновлений без чата — пользователь"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # Application создает задачи в порядке прихода обновлений, а asyncio.Lock
+        # пропускает ожидающих в порядке очереди — этого достаточно для порядка в чате
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Поля update_id/user попадают во все записи обработчиков; route задают сами обработчики
+        if not isinstance(update, Update):
+            await coroutine
+            return
+        user = update.effective_user.id if update.effective_user else None
+        started = time.monotonic()
+        with log_context(update_id=update.update_id, user=user) as fields:
+            try:
+                await coroutine
+            finally:
+                fields["latency_ms"] = round((time.monotonic() - started) * 1000)
+                level = logging.INFO if fields["latency_ms"] >= settings.LOG_SLOW_UPDATE_MS else logging.DEBUG
+                logger.log(level, "Обновление обработано")
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,167 +1,10 @@
 """
-Основной файл для запуска в Railway с веб-хук сервером как основным процессом
-"""
-import asyncio
-import logging
-import threading
-import time
-import os
-from webhook_server import webhook_app
-import uvicorn
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from config.settings import settings
-from handlers.command_handler import CommandHandler as BotCommandHandler
-from handlers.message_handler import MessageHandler as BotMessageHandler
-from services.subscription_monitor import SubscriptionMonitor
-from telegram import Update
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+Основной файл для запуска в Railway с веб-хук сервером как основным процессом.
 
-async def run_telegram_bot():
-    """Запуск Telegram бота в отдельном потоке"""
-    try:
-        # Проверяем наличие необходимых переменных окружения
-        logger.info(f"🔑 TELEGRAM_BOT_TOKEN: {'установлен' if settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_BOT_TOKEN != 'your_telegram_bot_token_here' else 'НЕ УСТАНОВЛЕН'}")
-        logger.info(f"🔑 OPENAI_API_KEY: {'установлен' if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != 'your_openai_api_key_here' else 'НЕ УСТАНОВЛЕН'}")
-        logger.info(f"🔑 SUPABASE_URL: {'установлен' if settings.SUPABASE_URL and settings.SUPABASE_URL != 'https://your-project-id.supabase.co' else 'НЕ УСТАНОВЛЕН'}")
-        
-        if not settings.TELEGRAM_BOT_TOKEN or settings.TELEGRAM_BOT_TOKEN == "your_telegram_bot_token_here":
-            logger.error("❌ TELEGRAM_BOT_TOKEN не установлен")
-            return
-        
-        if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "your_openai_api_key_here":
-            logger.error("❌ OPENAI_API_KEY не установлен")
-            return
-        
-        logger.info("Запуск Telegram бота...")
-        
-        # Создаем экземпляры обработчиков
-        command_handler = BotCommandHandler()
-        message_handler = BotMessageHandler()
-        
-        # Инициализируем мониторинг подписок
-        subscription_monitor = SubscriptionMonitor()
-        
-        # Создаем приложение без JobQueue
-        application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).job_queue(None).build()
-        
-        # Регистрируем обработчики команд
-        application.add_handler(CommandHandler("start", command_handler.start_command))
-        application.add_handler(CommandHandler("help", command_handler.help_command))
-        application.add_handler(CommandHandler("stats", command_handler.stats_command))
-        application.add_handler(CommandHandler("week", command_handler.week_command))
-        
-        # Callback-кнопки
-        from telegram.ext import CallbackQueryHandler, PreCheckoutQueryHandler
-        application.add_handler(CallbackQueryHandler(command_handler.callback_query_handler))
-        
-        # Обработчики платежей Telegram Stars
-        application.add_handler(PreCheckoutQueryHandler(command_handler.handle_pre_checkout_query))
-        application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, command_handler.handle_successful_payment))
-        
-        # Регистрируем обработчики сообщений
-        application.add_handler(MessageHandler(filters.PHOTO, message_handler.handle_photo))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler.handle_text))
-        
-        # Запускаем мониторинг подписок
-        subscription_monitor.start_monitoring()
-        
-        try:
-            # Запускаем бота
-            logger.info("Бот готов к работе!")
-            # Используем start_polling вместо run_polling для работы в существующем event loop
-            await application.initialize()
-            await application.start()
-            await application.updater.start_polling(
-                allowed_updates=Update.ALL_TYPES
-            )
-            
-            # Ждем бесконечно (бот будет работать)
-            try:
-                await asyncio.Event().wait()  # Бесконечное ожидание
-            except asyncio.CancelledError:
-                logger.info("Получен сигнал остановки бота...")
-        finally:
-            # Останавливаем мониторинг при завершении
-            subscription_monitor.stop_monitoring()
-            # Правильно останавливаем бота
-            try:
-                await application.updater.stop()
-                await application.stop()
-                await application.shutdown()
-            except Exception as e:
-                logger.warning(f"Ошибка при остановке бота: {e}")
-            
-    except Exception as e:
-        logger.error(f"Ошибка запуска Telegram бота: {e}")
-        import traceback
-        traceback.print_exc()
-
-def start_telegram_bot():
-    """Запуск Telegram бота в отдельном потоке"""
-    def run_bot():
-        try:
-            logger.info("Инициализация event loop для Telegram бота...")
-            # Создаем новый event loop для потока
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                logger.info("Запуск Telegram бота в потоке...")
-                # Используем run_until_complete для запуска в новом event loop
-                loop.run_until_complete(run_telegram_bot())
-            except Exception as e:
-                logger.error(f"Ошибка в event loop Telegram бота: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                logger.info("Закрытие event loop Telegram бота...")
-                # Правильно закрываем event loop
-                try:
-                    # Отменяем все pending задачи
-                    pending = asyncio.all_tasks(loop)
-                    for task in pending:
-                        task.cancel()
-                    if pending:
-                        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
-                except Exception as e:
-                    logger.warning(f"Ошибка при закрытии задач: {e}")
-                finally:
-                    loop.close()
-        except Exception as e:
-            logger.error(f"Ошибка в потоке Telegram бота: {e}")
-            import traceback
-            traceback.print_exc()
-            logger.info("Веб-хук сервер продолжит работать без Telegram бота")
-    
-    bot_thread = threading.Thread(target=run_bot, daemon=True, name="TelegramBot")
-    bot_thread.start()
-    logger.info("Telegram бот запущен в отдельном потоке")
+FastAPI (uvicorn) и Telegram-бот работают в одном event loop (bot_runtime): при заданном
+TELEGRAM_WEBHOOK_URL обновления приходят на /telegram/<secret>, иначе — long polling.
+"""
+from bot_runtime import run
 
 if __name__ == "__main__":
-    logger.info("🚀 Запуск веб-хук сервера с Telegram ботом...")
-    
-    # Запускаем веб-хук сервер как основной процесс СНАЧАЛА
-    port = int(os.getenv("PORT", 8001))
-    logger.info(f"🌐 Запуск веб-хук сервера на порту {port}")
-    logger.info(f"🔗 Health check будет доступен по адресу: http://0.0.0.0:{port}/health")
-    
-    # Запускаем Telegram бот в отдельном потоке
-    start_telegram_bot()
-    
-    try:
-        uvicorn.run(
-            webhook_app, 
-            host="0.0.0.0", 
-            port=port, 
-            log_level="info",
-            access_log=True
-        )
-    except Exception as e:
-        logger.error(f"❌ Ошибка запуска веб-хук сервера: {e}")
-        import traceback
-        traceback.print_exc()
+    run()
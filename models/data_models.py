@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from datetime import datetime, date
-from typing import Optional, List
+from typing import Optional, List, Dict
 from decimal import Decimal
 
 class User(BaseModel):
@@ -25,11 +25,12 @@ class FoodImage(BaseModel):
     user_id: int
     image_url: str
     uploaded_at: Optional[datetime] = None
-    status: str = "pending"  # pending, processed, error
+    status: str = "pending"  # pending, processed, error, rejected, expired
+    rejection_reason: Optional[str] = None  # причина отказа локального фильтра (status = rejected)
 
 class NutritionData(BaseModel):
     id: Optional[int] = None
-    food_image_id: int
+    food_image_id: Optional[int] = None  # None — строка еще не записана (разбор текстового ввода)
     calories: float
     protein: float
     fats: float
@@ -37,6 +38,11 @@ class NutritionData(BaseModel):
     food_name: str
     confidence: float
     weight_grams: float | None = None
+    # КБЖУ на 100 г: пересчет под новый вес — чистая функция веса, без накопления ошибки округления
+    calories_per_100g: float | None = None
+    protein_per_100g: float | None = None
+    fats_per_100g: float | None = None
+    carbs_per_100g: float | None = None
     created_at: Optional[datetime] = None
 
 class DailyReport(BaseModel):
@@ -64,6 +70,19 @@ class NutritionAnalysis(BaseModel):
     food_name: str
     confidence: float
     weight_grams: float | None = None
+    calories_per_100g: float | None = None
+    protein_per_100g: float | None = None
+    fats_per_100g: float | None = None
+    carbs_per_100g: float | None = None
+
+    @model_validator(mode="after")
+    def _fill_densities(self):
+        """Если модель не вернула значения на 100 г, выводим их из итогов и веса порции"""
+        if self.weight_grams and self.weight_grams > 0:
+            for macro in ("calories", "protein", "fats", "carbs"):
+                if getattr(self, f"{macro}_per_100g") is None:
+                    setattr(self, f"{macro}_per_100g", getattr(self, macro) * 100 / self.weight_grams)
+        return self
 
 class WeeklyReport(BaseModel):
     """Модель для недельного отчета"""
@@ -79,6 +98,38 @@ class WeeklyReport(BaseModel):
     average_fats_per_day: float
     average_carbs_per_day: float
 
+class DaySummary(BaseModel):
+    """КБЖУ и вода за один день (экран «Сегодня», строка недельного графика)"""
+    day: Optional[date] = None
+    calories: float = 0
+    protein: float = 0
+    fats: float = 0
+    carbs: float = 0
+    water_ml: int = 0
+
+    def nutrition(self) -> dict:
+        """Словарь в формате ReportGenerator.format_daily_report"""
+        return {"calories": self.calories, "protein": self.protein, "fats": self.fats, "carbs": self.carbs}
+
+class WeekSummary(BaseModel):
+    """Данные экрана «Неделя»: по строке на каждый из 7 локальных дней (сгруппированы в БД)"""
+    start: date
+    end: date
+    days: List[DaySummary] = []
+
+    def nutrition(self) -> dict:
+        """Словарь в формате ReportGenerator.format_weekly_report (средние — на 7 дней)"""
+        count = (self.end - self.start).days + 1
+        totals = {macro: sum(getattr(day, macro) for day in self.days) for macro in ("calories", "protein", "fats", "carbs")}
+        return {
+            **{f"total_{macro}": value for macro, value in totals.items()},
+            **{f"average_{macro}": value / count for macro, value in totals.items()},
+        }
+
+    def water_bars(self, day_names: List[str]) -> Dict[str, int]:
+        """Вода по дням для ReportGenerator.format_weekly_water; day_names — подписи Пн..Вс"""
+        return {day_names[day.day.weekday()]: day.water_ml for day in self.days}
+
 class Subscription(BaseModel):
     """Модель подписки пользователя"""
     id: Optional[int] = None
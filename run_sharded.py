@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Локальный запуск бота в режиме шардирования на одной машине.
+
+Фронтенд (порт PORT) принимает веб-хук Telegram и по id пользователя пересылает
+обновления одному из SHARD_COUNT воркеров (127.0.0.1:SHARD_WORKER_BASE_PORT+i).
+Каждый воркер — отдельный процесс со своим event loop, своими SQLite-файлами
+очереди анализа, дедупликации и состояния диалогов и своей долей
+TELEGRAM_GLOBAL_RATE_PER_SECOND (лимит Bot API общий на токен). Фоновый переанализ
+фото работает в каждом воркере, но только для пользователей своего шарда
+(add_sharded_sweeper.sql); TRC20 монитор — только в воркере 0, чтобы не
+обрабатывать одни и те же платежи дважды.
+
+Нужен TELEGRAM_WEBHOOK_URL: в режиме long polling шардирование не используется.
+"""
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+from config.settings import settings
+from utils.logging_setup import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+RUNTIME_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main_webhook.py")
+
+
+def shard_path(path: str, index: int) -> str:
+    """Отдельный SQLite-файл для воркера: analysis_queue.sqlite3 -> analysis_queue.shard1.sqlite3"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext}"
+
+
+def worker_env(index: int, count: int, internal_secret: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "SHARD_ROLE": "worker",
+        "SHARD_INDEX": str(index),
+        "SHARD_COUNT": str(count),
+        "SHARD_INTERNAL_SECRET": internal_secret,
+        "HOST": "127.0.0.1",
+        "PORT": str(settings.SHARD_WORKER_BASE_PORT + index),
+        "ANALYSIS_QUEUE_DB_PATH": shard_path(settings.ANALYSIS_QUEUE_DB_PATH, index),
+        "UPDATE_DEDUPE_DB_PATH": shard_path(settings.UPDATE_DEDUPE_DB_PATH, index),
+        "CONVERSATION_STATE_DB_PATH": shard_path(settings.CONVERSATION_STATE_DB_PATH, index),
+        # Лимит Bot API общий на токен бота: воркеры делят его поровну
+        "TELEGRAM_GLOBAL_RATE_PER_SECOND": str(settings.TELEGRAM_GLOBAL_RATE_PER_SECOND / count),
+    })
+    if index > 0:
+        env["ENABLE_TRC20_MONITOR"] = "false"
+    return env
+
+
+def frontend_env(count: int, internal_secret: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "SHARD_ROLE": "frontend",
+        "SHARD_COUNT": str(count),
+        "SHARD_INTERNAL_SECRET": internal_secret,
+    })
+    return env
+
+
+def main() -> int:
+    if not settings.TELEGRAM_WEBHOOK_URL:
+        logger.error("❌ Для шардирования нужен TELEGRAM_WEBHOOK_URL")
+        return 1
+    if not settings.TELEGRAM_WEBHOOK_SECRET:
+        logger.error("❌ Для шардирования нужен TELEGRAM_WEBHOOK_SECRET")
+        return 1
+
+    count = settings.SHARD_COUNT or os.cpu_count() or 1
+    internal_secret = settings.SHARD_INTERNAL_SECRET or secrets.token_urlsafe(32)
+    logger.info(f"🚀 Запуск {count} воркеров и фронтенда веб-хука на порту {os.getenv('PORT', 8001)}")
+
+    processes = [
+        subprocess.Popen([sys.executable, RUNTIME_SCRIPT], env=worker_env(i, count, internal_secret))
+        for i in range(count)
+    ]
+    processes.append(subprocess.Popen([sys.executable, RUNTIME_SCRIPT], env=frontend_env(count, internal_secret)))
+
+    def terminate(*_):
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    # Падение любого процесса останавливает все: внешний супервизор перезапустит launcher целиком
+    exit_code = 0
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        exit_code = next((process.returncode for process in processes if process.poll() is not None), 0)
+    finally:
+        terminate()
+        # Воркерам нужно время на дренаж очереди анализа (SHUTDOWN_DRAIN_TIMEOUT_SECONDS)
+        deadline = time.monotonic() + settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS + 10
+        for process in processes:
+            try:
+                process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+Job = Dict[str, Any]
+
+
+class AnalysisQueue:
+    """Персистентная очередь анализа фото (локальный SQLite) с пулом асинхронных воркеров.
+
+    Хендлер только ставит задачу и сразу отвечает пользователю, а воркеры выполняют
+    скачивание, анализ, запись в БД и ответ. Задачи, оставшиеся в статусе `running`
+    после падения или редеплоя, возвращаются в очередь при следующем старте.
+    """
+
+    def __init__(
+        self,
+        processor: Callable[[Job], Awaitable[None]],
+        on_give_up: Optional[Callable[[Job, Exception], Awaitable[None]]] = None,
+        db_path: Optional[str] = None,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+    ) -> None:
+        self.processor = processor
+        self.on_give_up = on_give_up
+        self.db_path = db_path or settings.ANALYSIS_QUEUE_DB_PATH
+        self.workers = workers or settings.ANALYSIS_WORKERS
+        self.max_attempts = max_attempts or settings.ANALYSIS_MAX_ATTEMPTS
+        self.bot = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._busy: Dict[asyncio.Task, int] = {}  # воркер -> задача, которую он сейчас выполняет
+        self._accepting = False
+
+    # Storage
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs(status, id)")
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(analysis_jobs)")}
+            if "image" not in columns:
+                # Подготовленное (сжатое) фото, скачанное хендлером заранее
+                self._db.execute("ALTER TABLE analysis_jobs ADD COLUMN image BLOB")
+        return self._db
+
+    def _set_status(self, job_id: int, status: str, error: Optional[str] = None) -> None:
+        db = self._connect()
+        if status == "done":
+            db.execute("DELETE FROM analysis_jobs WHERE id = ?", (job_id,))
+            return
+        if status == "failed":
+            db.execute(
+                "UPDATE analysis_jobs SET status = ?, last_error = ?, image = NULL, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+            return
+        db.execute(
+            "UPDATE analysis_jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id),
+        )
+
+    def _claim(self, job_id: int) -> Optional[Job]:
+        """Атомарно (в рамках event loop) переводит задачу queued -> running"""
+        db = self._connect()
+        row = db.execute(
+            "SELECT id, payload, attempts, image FROM analysis_jobs WHERE id = ? AND status = 'queued'",
+            (job_id,),
+        ).fetchone()
+        if not row:
+            return None
+        attempts = row["attempts"] + 1
+        db.execute(
+            "UPDATE analysis_jobs SET status = 'running', attempts = ?, updated_at = ? WHERE id = ?",
+            (attempts, time.time(), job_id),
+        )
+        job = json.loads(row["payload"])
+        job["id"] = row["id"]
+        job["attempts"] = attempts
+        job["image"] = row["image"]
+        return job
+
+    # Public API
+    async def enqueue(self, payload: Job, image: Optional[bytes] = None) -> int:
+        """Поставить задачу в очередь (image — уже скачанное и подготовленное фото)"""
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO analysis_jobs (payload, image, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+            (json.dumps(payload), image, now, now),
+        )
+        job_id = cursor.lastrowid
+        if self._pending is not None:
+            self._pending.put_nowait(job_id)
+        logger.info(f"Задача анализа {job_id} поставлена в очередь")
+        return job_id
+
+    def save_progress(self, job: Job) -> None:
+        """Сохранить промежуточное состояние задачи, чтобы при повторе не дублировать шаги"""
+        payload = {k: v for k, v in job.items() if k not in ("id", "attempts", "image")}
+        self._connect().execute(
+            "UPDATE analysis_jobs SET payload = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(payload), time.time(), job["id"]),
+        )
+
+    def active_food_image_ids(self) -> Set[int]:
+        """ID записей food_images, которые ещё обрабатываются очередью"""
+        rows = self._connect().execute(
+            "SELECT json_extract(payload, '$.food_image_id') AS food_image_id FROM analysis_jobs "
+            "WHERE status IN ('queued', 'running') AND food_image_id IS NOT NULL"
+        )
+        return {row["food_image_id"] for row in rows}
+
+    async def start(self, bot) -> None:
+        if self._tasks:
+            return
+        self.bot = bot
+        db = self._connect()
+        resumed = db.execute(
+            "UPDATE analysis_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (time.time(),),
+        ).rowcount
+        if resumed:
+            logger.info(f"Возобновлено незавершённых задач анализа: {resumed}")
+
+        self._pending = asyncio.Queue()
+        self._accepting = True
+        for row in db.execute("SELECT id FROM analysis_jobs WHERE status = 'queued' ORDER BY id"):
+            self._pending.put_nowait(row["id"])
+
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Очередь анализа запущена (воркеров: %s, в очереди: %s)", self.workers, self._pending.qsize())
+
+    async def stop(self, drain_timeout: float = 0) -> None:
+        """Остановить воркеры, дав выполняющимся задачам до `drain_timeout` секунд завершиться.
+
+        Новые задачи из очереди больше не берутся (они останутся в SQLite до следующего
+        старта). Задачи, не успевшие к сроку, прерываются и остаются в `running` —
+        при следующем старте они будут возобновлены.
+        """
+        self._accepting = False
+        busy = [task for task in self._tasks if task in self._busy]
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+
+        drained, abandoned = 0, 0
+        if busy and drain_timeout > 0:
+            logger.info(f"Ожидаем завершения задач анализа: {len(busy)} (не дольше {drain_timeout} с)")
+            done, pending = await asyncio.wait(busy, timeout=drain_timeout)
+            drained, abandoned = len(done), len(pending)
+        else:
+            abandoned = len(busy)
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        self._tasks = []
+        self._busy = {}
+        self._pending = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if busy:
+            logger.info(f"Очередь анализа остановлена: завершено задач {drained}, прервано {abandoned} (будут возобновлены при следующем старте)")
+        else:
+            logger.info("Очередь анализа остановлена")
+
+    # Workers
+    async def _worker(self, n: int) -> None:
+        current = asyncio.current_task()
+        while self._accepting:
+            job_id = await self._pending.get()
+            self._busy[current] = job_id
+            try:
+                await self._run_job(job_id)
+            finally:
+                self._busy.pop(current, None)
+
+    async def _run_job(self, job_id: int) -> None:
+        job = self._claim(job_id)
+        if job is None:
+            return
+        try:
+            await self.processor(job)
+            self._set_status(job["id"], "done")
+        except asyncio.CancelledError:
+            # Задача останется в running и будет возобновлена при следующем старте
+            raise
+        except Exception as e:
+            if job["attempts"] < self.max_attempts:
+                logger.warning(f"Задача анализа {job['id']} упала (попытка {job['attempts']}): {e}")
+                self._set_status(job["id"], "queued", str(e))
+                # Повтор с экспоненциальной задержкой, не занимая воркер
+                delay = min(2 ** job["attempts"], 60)
+                asyncio.get_running_loop().call_later(delay, self._pending.put_nowait, job["id"])
+                return
+            logger.error(f"Задача анализа {job['id']} провалена окончательно: {e}")
+            self._set_status(job["id"], "failed", str(e))
+            if self.on_give_up:
+                try:
+                    await self.on_give_up(job, e)
+                except Exception as give_up_error:
+                    logger.error(f"Ошибка обработки проваленной задачи {job['id']}: {give_up_error}")
@@ -0,0 +1,66 @@
+import logging
+from functools import cached_property
+from typing import Optional
+
+from config.settings import settings
+from services.supabase_service import SupabaseService
+from services.openai_service import OpenAIService
+from services.g4f_service import G4FService
+from services.crypto_service import CryptoService
+from services.subscription_service import SubscriptionService
+from services.food_photo_gate import FoodPhotoGate
+from services.food_database import FoodDatabase
+from services.dashboard_service import DashboardService
+from utils.report_cache import ReportCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Общие экземпляры сервисов приложения.
+
+    Каждый сервис создается лениво при первом обращении и дальше переиспользуется,
+    поэтому HTTP-клиенты (OpenAI, g4f) и прочие зависимости строятся один раз на
+    процесс, а не на каждый хендлер или нажатие кнопки. Контейнер создается в точке
+    входа и передается в CommandHandler и MessageHandler.
+    """
+
+    @cached_property
+    def supabase_service(self) -> SupabaseService:
+        return SupabaseService()
+
+    @cached_property
+    def openai_service(self) -> OpenAIService:
+        return OpenAIService()
+
+    @cached_property
+    def g4f_service(self) -> Optional[G4FService]:
+        return G4FService() if settings.ENABLE_G4F_FALLBACK else None
+
+    @cached_property
+    def crypto_service(self) -> CryptoService:
+        return CryptoService(supabase_service=self.supabase_service)
+
+    @cached_property
+    def subscription_service(self) -> SubscriptionService:
+        return SubscriptionService(
+            supabase_service=self.supabase_service,
+            crypto_service=self.crypto_service,
+        )
+
+    @cached_property
+    def food_photo_gate(self) -> Optional[FoodPhotoGate]:
+        return FoodPhotoGate() if settings.ENABLE_FOOD_PHOTO_GATE else None
+
+    @cached_property
+    def food_database(self) -> FoodDatabase:
+        return FoodDatabase()
+
+    @cached_property
+    def dashboard_service(self) -> DashboardService:
+        return DashboardService(supabase_service=self.supabase_service)
+
+    @cached_property
+    def report_cache(self) -> ReportCache:
+        return ReportCache(max_entries=settings.REPORT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,276 @@
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config.database import db_manager
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+UserData = Dict[str, Any]
+
+
+class SQLiteConversationStateBackend:
+    """Состояние диалогов в локальном SQLite одного процесса (в run_sharded.py — свой файл у воркера)"""
+
+    # Процесс — единственный писатель файла, загрузки при старте достаточно
+    shared = False
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            # Вызовы идут из asyncio.to_thread, по одному за раз
+            self._db = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_state "
+                "(user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def load(self, newer_than: float) -> Dict[int, UserData]:
+        db = self._connect()
+        db.execute("DELETE FROM conversation_state WHERE updated_at < ?", (newer_than,))
+        return {row[0]: json.loads(row[1]) for row in db.execute("SELECT user_id, data FROM conversation_state")}
+
+    def save(self, batch: Dict[int, Optional[UserData]]) -> None:
+        db = self._connect()
+        now = time.time()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT INTO conversation_state (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(user_id, json.dumps(data), now) for user_id, data in batch.items() if data],
+            )
+            db.executemany(
+                "DELETE FROM conversation_state WHERE user_id = ?",
+                [(user_id,) for user_id, data in batch.items() if not data],
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class SupabaseConversationStateBackend:
+    """Состояние диалогов в таблице conversation_state (add_conversation_state.sql) — общее для реплик"""
+
+    # Пользователь может попасть на любую реплику: состояние перечитывается перед каждым обновлением
+    shared = True
+
+    def __init__(self) -> None:
+        self.supabase = db_manager.get_client()
+
+    def load(self, newer_than: float) -> Dict[int, UserData]:
+        if not self.supabase:
+            return {}
+        deadline = datetime.fromtimestamp(newer_than, timezone.utc).isoformat()
+        self.supabase.table("conversation_state").delete().lt("updated_at", deadline).execute()
+        result = self.supabase.table("conversation_state").select("user_id, data").execute()
+        return {row["user_id"]: row["data"] for row in result.data or []}
+
+    def load_user(self, user_id: int, newer_than: float) -> Optional[UserData]:
+        if not self.supabase:
+            return None
+        deadline = datetime.fromtimestamp(newer_than, timezone.utc).isoformat()
+        result = (
+            self.supabase.table("conversation_state")
+            .select("data")
+            .eq("user_id", user_id)
+            .gte("updated_at", deadline)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0]["data"] if result.data else None
+
+    def save(self, batch: Dict[int, Optional[UserData]]) -> None:
+        if not self.supabase:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [{"user_id": user_id, "data": data, "updated_at": now} for user_id, data in batch.items() if data]
+        dropped = [user_id for user_id, data in batch.items() if not data]
+        if rows:
+            self.supabase.table("conversation_state").upsert(rows).execute()
+        if dropped:
+            self.supabase.table("conversation_state").delete().in_("user_id", dropped).execute()
+
+    def close(self) -> None:
+        pass
+
+
+class ConversationPersistence(BasePersistence):
+    """Персистентность PTB только для `context.user_data` (ожидание веса после «Change weight» и т.п.).
+
+    Состояние переживает рестарт. С локальным SQLite процесс — единственный писатель
+    (в run_sharded.py пользователь всегда попадает в один воркер со своим файлом),
+    поэтому состояние загружается один раз при старте. С общим хранилищем (Supabase)
+    пользователь может попасть на любую реплику, и PTB перед каждым его обновлением
+    вызывает `refresh_user_data` — состояние перечитывается из хранилища, если у
+    процесса нет своих еще не записанных изменений этого пользователя. Изменения,
+    которые PTB еще не передал в `update_user_data` (он делает это раз в
+    `update_interval` секунд), видны по расхождению с последним снимком пользователя.
+    Записи копятся и пишутся в хранилище одной пачкой через `batch_delay` секунд
+    (пустой user_data удаляет строку); состояние старше `ttl_seconds` при загрузке
+    отбрасывается.
+    """
+
+    def __init__(self, backend, ttl_seconds: float, update_interval: float = 5, batch_delay: float = 0.5) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.batch_delay = batch_delay
+        self._dirty: Dict[int, Optional[UserData]] = {}
+        # Пачка, которая пишется прямо сейчас (уже не в _dirty, но еще не в хранилище)
+        self._writing: Dict[int, Optional[UserData]] = {}
+        # Последнее состояние пользователя, известное хранилищу (загружено или передано PTB)
+        self._seen: Dict[int, UserData] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # user_data
+    async def get_user_data(self) -> Dict[int, UserData]:
+        try:
+            data = await asyncio.to_thread(self.backend.load, time.time() - self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки состояния диалогов: {e}")
+            return {}
+        logger.info(f"Загружено состояние диалогов: {len(data)} пользователей")
+        self._seen = copy.deepcopy(data)
+        return data
+
+    async def update_user_data(self, user_id: int, data: UserData) -> None:
+        self._dirty[user_id] = copy.deepcopy(data) or None
+        self._remember(user_id, data)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty[user_id] = None
+        self._remember(user_id, None)
+        self._schedule_flush()
+
+    async def refresh_user_data(self, user_id: int, user_data: UserData) -> None:
+        if not self.backend.shared:
+            return
+        # Свои изменения новее хранилища: еще не записаны или PTB еще не передал их в update_user_data
+        if user_id in self._dirty or user_id in self._writing or user_data != self._seen.get(user_id, {}):
+            return
+        try:
+            data = await asyncio.to_thread(self.backend.load_user, user_id, time.time() - self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Ошибка обновления состояния диалога пользователя {user_id}: {e}")
+            return
+        # PTB передает сам объект context.user_data — меняем на месте
+        user_data.clear()
+        if data:
+            user_data.update(data)
+        self._remember(user_id, data)
+
+    def _remember(self, user_id: int, data: Optional[UserData]) -> None:
+        if data:
+            self._seen[user_id] = copy.deepcopy(data)
+        else:
+            self._seen.pop(user_id, None)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        # Изменения, пришедшие во время записи, уходят следующей пачкой; после ошибки
+        # ждем следующего изменения или flush при остановке
+        while self._dirty:
+            await asyncio.sleep(self.batch_delay)
+            if not await self._write_dirty():
+                return
+
+    async def _write_dirty(self) -> bool:
+        if not self._dirty:
+            return True
+        batch, self._dirty = self._dirty, {}
+        self._writing = batch
+        try:
+            await asyncio.to_thread(self.backend.save, batch)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния диалогов ({len(batch)} пользователей): {e}")
+            # Вернем в очередь, не затирая более новые изменения
+            for user_id, data in batch.items():
+                self._dirty.setdefault(user_id, data)
+            return False
+        finally:
+            self._writing = {}
+
+    async def flush(self) -> None:
+        # Отложенную пачку дожидаемся, а не отменяем: запись в потоке отменить нельзя
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        await self._write_dirty()
+        await asyncio.to_thread(self.backend.close)
+
+    # Остальные данные PTB не сохраняются
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+
+def create_conversation_persistence() -> Optional[ConversationPersistence]:
+    """Персистентность из настроек CONVERSATION_STATE_*; None — состояние только в памяти"""
+    backend_name = settings.CONVERSATION_STATE_BACKEND
+    if backend_name == "sqlite":
+        backend = SQLiteConversationStateBackend(settings.CONVERSATION_STATE_DB_PATH)
+    elif backend_name == "supabase":
+        backend = SupabaseConversationStateBackend()
+    else:
+        return None
+    return ConversationPersistence(
+        backend,
+        ttl_seconds=settings.CONVERSATION_STATE_TTL_SECONDS,
+        update_interval=settings.CONVERSATION_STATE_FLUSH_SECONDS,
+    )
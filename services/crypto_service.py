@@ -18,8 +18,8 @@ class CryptoService:
     - Платёжную запись создаёт/обновляет внешний код (монитор), здесь дубликаты не создаём.
     """
 
-    def __init__(self) -> None:
-        self.supabase_service = SupabaseService()
+    def __init__(self, supabase_service: Optional[SupabaseService] = None) -> None:
+        self.supabase_service = supabase_service or SupabaseService()
 
         # Базовые планы в USD
         self.subscription_plans: Dict[str, Dict[str, Any]] = {
@@ -84,14 +84,14 @@ class CryptoService:
             start_date = datetime.now()
             end_date = start_date + timedelta(days=plan["duration_days"]) 
 
-            self.supabase_service.supabase.table("users").update({
+            await self.supabase_service.execute(self.supabase_service.supabase.table("users").update({
                 "subscription_status": "active",
                 "subscription_plan": plan_type,
                 "subscription_start": start_date.isoformat(),
                 "subscription_end": end_date.isoformat(),
                 "photos_analyzed": 0,
                 "payment_provider": "crypto",
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
 
             return True
         except Exception as e:
@@ -0,0 +1,49 @@
+import logging
+from datetime import date, timedelta
+from typing import List, Optional
+
+from config.settings import settings
+from models.data_models import DaySummary, WeekSummary
+from services.supabase_service import SupabaseService
+from utils.dates import local_today
+
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardService:
+    """Данные экранов статистики (/stats, /week, «Today» и «Week» в меню).
+
+    КБЖУ и вода за период приходят одним RPC вместо последовательных запросов
+    питания и воды — уже сгруппированными по локальным дням (settings.TIMEZONE),
+    по строке на день, — а результат возвращается типизированной моделью.
+    """
+
+    WEEK_DAYS = 7
+
+    def __init__(self, supabase_service: Optional[SupabaseService] = None) -> None:
+        self.supabase_service = supabase_service or SupabaseService()
+
+    async def get_day(self, user_id: int) -> DaySummary:
+        today = local_today()
+        rows = await self._fetch_days(user_id, today, today)
+        return rows[0]
+
+    async def get_week(self, user_id: int) -> WeekSummary:
+        end = local_today()
+        start = end - timedelta(days=self.WEEK_DAYS - 1)
+        return WeekSummary(start=start, end=end, days=await self._fetch_days(user_id, start, end))
+
+    async def _fetch_days(self, user_id: int, start: date, end: date) -> List[DaySummary]:
+        """Строки по дням из БД; дни без записей — нулевые.
+
+        Ошибка RPC пробрасывается: нулевой отчет вместо данных закэшировался бы
+        до следующей записи пользователя.
+        """
+        rows = await self.supabase_service.get_dashboard(user_id, start, end, settings.TIMEZONE)
+        by_day = {row["day"]: row for row in rows}
+        days = []
+        for i in range((end - start).days + 1):
+            day = start + timedelta(days=i)
+            days.append(DaySummary(**by_day.get(day.isoformat(), {"day": day})))
+        return days
@@ -0,0 +1,208 @@
+import csv
+import logging
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from models.data_models import NutritionData
+
+
+logger = logging.getLogger(__name__)
+
+FOODS_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "foods.csv")
+
+
+class FoodDatabase:
+    """Локальная таблица состава продуктов (КБЖУ на 100 г) для записи еды текстом.
+
+    Таблица загружается лениво при первом обращении в компактную структуру:
+    названия в списке, КБЖУ и вес штуки — в массивах `array('f')`. Поиск идет
+    по точному совпадению, затем по префиксу (bisect по отсортированным ключам)
+    и, наконец, по триграммам для опечаток. Ни одного вызова API.
+    """
+
+    DEFAULT_PORTION_GRAMS = 150   # Порция, если вес не указан и у продукта нет веса штуки
+    MIN_PREFIX_LENGTH = 3         # Короче — префиксный поиск дает слишком много ложных совпадений
+    MIN_TRIGRAM_SCORE = 0.5       # Минимальный коэффициент Дайса по триграммам
+    MAX_ITEM_GRAMS = 5000         # Больше — скорее опечатка («ice cream 99999»), чем порция
+    MAX_ITEM_PIECES = 50          # То же для количества штук/порций
+
+    UNIT_GRAMS = {
+        "g": 1, "gr": 1, "gram": 1, "grams": 1, "г": 1, "гр": 1,
+        "kg": 1000, "кг": 1000,
+        "ml": 1, "мл": 1,
+        "l": 1000, "л": 1000,
+    }
+    COUNT_UNITS = {"pc", "pcs", "piece", "pieces", "x", "шт"}
+
+    _SPLIT_RE = re.compile(r"[,;\n+]|\band\b", re.IGNORECASE)
+    _QTY = r"(?P<qty>\d+(?:[.,]\d+)?)\s*(?P<unit>[a-zа-я]+\b)?"
+    _QTY_FIRST_RE = re.compile(rf"^{_QTY}\s*(?:of\s+)?(?P<name>.+)$", re.IGNORECASE)
+    # «apple x2», «eggs ×3» — множитель после названия
+    _QTY_LAST_RE = re.compile(rf"^(?P<name>.+?)\s+(?:[x×]\s*)?{_QTY}$", re.IGNORECASE)
+
+    def __init__(self, path: str = FOODS_CSV_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._names: List[str] = []
+        self._macros = array('f')        # calories, protein, fats, carbs подряд для каждого продукта
+        self._piece_grams = array('f')   # 0 — у продукта нет «штучного» веса
+        self._keys: Dict[str, int] = {}  # название/синоним -> индекс продукта
+        self._sorted_keys: List[str] = []
+        self._trigrams: Dict[str, List[str]] = {}
+
+    # --- Загрузка и индексы ---
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            with open(self.path, encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    index = len(self._names)
+                    self._names.append(row["name"])
+                    self._macros.extend(float(row[k]) for k in ("calories", "protein", "fats", "carbs"))
+                    self._piece_grams.append(float(row["piece_grams"] or 0))
+                    for key in [row["name"], *filter(None, row["aliases"].split("|"))]:
+                        self._keys.setdefault(self._normalize(key), index)
+
+            self._sorted_keys = sorted(self._keys)
+            trigrams = defaultdict(list)
+            for key in self._sorted_keys:
+                for gram in self._key_trigrams(key):
+                    trigrams[gram].append(key)
+            self._trigrams = dict(trigrams)
+            self._loaded = True
+            logger.info(f"Загружена локальная база продуктов: {len(self._names)} продуктов, {len(self._keys)} названий")
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+    @staticmethod
+    def _key_trigrams(key: str) -> set:
+        padded = f"  {key} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    # --- Поиск ---
+
+    def lookup(self, query: str) -> Optional[Tuple[int, float]]:
+        """Найти продукт: (индекс, уверенность совпадения) или None"""
+        self._ensure_loaded()
+        query = self._normalize(query)
+        if not query:
+            return None
+
+        # Точное совпадение, в т.ч. после отбрасывания окончания множественного числа
+        for candidate in (query, query[:-2] if query.endswith("es") else None, query[:-1] if query.endswith("s") else None):
+            if candidate and candidate in self._keys:
+                return self._keys[candidate], 1.0
+
+        if len(query) >= self.MIN_PREFIX_LENGTH:
+            position = bisect_left(self._sorted_keys, query)
+            if position < len(self._sorted_keys) and self._sorted_keys[position].startswith(query):
+                # Ключи отсортированы, поэтому первый подходящий — самый короткий вариант с этим префиксом
+                return self._keys[self._sorted_keys[position]], 0.9
+
+        query_grams = self._key_trigrams(query)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in query_grams:
+            for key in self._trigrams.get(gram, ()):
+                shared[key] += 1
+        best_key, best_score = None, 0.0
+        for key, count in shared.items():
+            score = 2 * count / (len(query_grams) + len(self._key_trigrams(key)))
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key and best_score >= self.MIN_TRIGRAM_SCORE:
+            return self._keys[best_key], round(best_score, 2)
+        return None
+
+    def _portion_grams(self, index: int, qty: Optional[float], unit: Optional[str]) -> float:
+        piece = self._piece_grams[index]
+        if unit in self.UNIT_GRAMS:
+            return qty * self.UNIT_GRAMS[unit]
+        if qty is None:
+            return piece or self.DEFAULT_PORTION_GRAMS
+        if unit in self.COUNT_UNITS or piece:
+            return qty * (piece or self.DEFAULT_PORTION_GRAMS)
+        # Число без единиц у продукта «на развес»: «rice 200» — граммы, «2 rice» — порции
+        return qty if qty >= 10 else qty * self.DEFAULT_PORTION_GRAMS
+
+    # --- Разбор текста ---
+
+    def _is_implausible(self, qty: Optional[float], unit: Optional[str], grams: float) -> bool:
+        if grams > self.MAX_ITEM_GRAMS:
+            return True
+        if qty is None or unit in self.UNIT_GRAMS:
+            return False
+        # Число без единиц — штуки или порции, кроме «rice 200» (граммы продукта на развес)
+        return qty > self.MAX_ITEM_PIECES and grams != qty
+
+    def parse_meal(self, text: str) -> Tuple[List[NutritionData], List[str], List[str]]:
+        """Разобрать текст вида «200g rice, 2 eggs» в строки NutritionData.
+
+        Возвращает распознанные позиции (без food_image_id — его назначит запись в БД),
+        список фрагментов, для которых продукт не найден, и фрагменты с неправдоподобным
+        количеством (больше MAX_ITEM_GRAMS или MAX_ITEM_PIECES) — их нужно уточнить
+        у пользователя, а не записывать.
+        """
+        items: List[NutritionData] = []
+        unknown: List[str] = []
+        implausible: List[str] = []
+        for part in self._SPLIT_RE.split(text):
+            part = part.strip()
+            if not part:
+                continue
+
+            qty, unit, name = None, None, part
+            match = self._QTY_FIRST_RE.match(part) or self._QTY_LAST_RE.match(part)
+            if match:
+                qty = float(match.group("qty").replace(",", "."))
+                unit = (match.group("unit") or "").lower() or None
+                name = match.group("name")
+                # «2 eggs»: слово после числа — название продукта, а не единица измерения
+                if unit and unit not in self.UNIT_GRAMS and unit not in self.COUNT_UNITS:
+                    name = f"{unit} {name}" if match.re is self._QTY_FIRST_RE else name
+                    unit = None
+            elif re.match(r"^(a|an)\s+", part, re.IGNORECASE):
+                qty, name = 1.0, part.split(None, 1)[1]
+
+            found = self.lookup(name)
+            if not found:
+                unknown.append(part)
+                continue
+
+            index, confidence = found
+            grams = self._portion_grams(index, qty, unit)
+            if grams <= 0:
+                unknown.append(part)
+                continue
+            if self._is_implausible(qty, unit, grams):
+                implausible.append(part)
+                continue
+            factor = grams / 100
+            calories, protein, fats, carbs = self._macros[index * 4:index * 4 + 4]
+            items.append(NutritionData(
+                food_image_id=None,
+                calories=round(calories * factor, 1),
+                protein=round(protein * factor, 1),
+                fats=round(fats * factor, 1),
+                carbs=round(carbs * factor, 1),
+                food_name=self._names[index],
+                confidence=confidence,
+                weight_grams=round(grams),
+                # array('f') хранит float32 — округляем, чтобы не писать в БД «2.700000047»
+                calories_per_100g=round(calories, 2),
+                protein_per_100g=round(protein, 2),
+                fats_per_100g=round(fats, 2),
+                carbs_per_100g=round(carbs, 2)
+            ))
+        return items, unknown, implausible
@@ -0,0 +1,108 @@
+import io
+import logging
+from typing import Optional
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class FoodPhotoGate:
+    """Дешевый локальный фильтр перед платным vision-вызовом.
+
+    Отсекает только очевидно непригодные снимки: почти черные, однотонные,
+    сильно размытые и скриншоты интерфейсов. Пороги выбраны консервативно —
+    сомнительное фото лучше отправить в API, чем отказать пользователю с едой.
+    Синхронный (PIL), вызывается воркером через `asyncio.to_thread`.
+    """
+
+    SAMPLE_SIZE = 256               # Статистика считается по уменьшенной копии
+    DARK_MEAN = 22                  # Средняя яркость (0-255) ниже — снимок почти черный
+    BLANK_STDDEV = 6                # Разброс яркости ниже — однотонное изображение
+    BLUR_EDGE_VARIANCE = 12         # Дисперсия контуров ниже — нет деталей, снимок размыт
+    SCREENSHOT_UNIQUE_RATIO = 0.12  # Доля уникальных цветов ниже — плоская графика
+    SCREENSHOT_DOMINANT_SHARE = 0.3 # ...и один цвет (фон интерфейса) занимает больше этой доли
+    SCREENSHOT_SOFT_STEP = 3        # Разница яркости соседей 1-2 — плавный переход (тени, градиенты)
+    SCREENSHOT_SOFT_SHARE = 0.08    # ...и таких переходов меньше этой доли: только заливки и резкие края
+
+    REASONS = {
+        "too_dark": "the photo is too dark",
+        "blank": "the photo looks blank",
+        "blurry": "the photo is too blurry",
+        "screenshot": "it looks like a screenshot",
+    }
+
+    def check(self, image_bytes: bytes) -> Optional[str]:
+        """Вернуть причину отказа (ключ REASONS) или None, если фото можно анализировать"""
+        try:
+            reason = self._classify(image_bytes)
+        except Exception as e:
+            # Не смогли разобрать изображение — решение остается за API
+            logger.warning(f"Фильтр фото не смог обработать изображение: {e}")
+            return None
+
+        if reason:
+            total = metrics.increment("food_gate_rejected_total")
+            metrics.increment(f"food_gate_rejected_{reason}")
+            logger.info(f"Фото отклонено локальным фильтром: {reason} (всего отклонено: {total})")
+        else:
+            metrics.increment("food_gate_passed_total")
+        return reason
+
+    def _classify(self, image_bytes: bytes) -> Optional[str]:
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        gray = image.convert('L')
+        gray.thumbnail((self.SAMPLE_SIZE, self.SAMPLE_SIZE), Image.Resampling.BILINEAR)
+        gray_stat = ImageStat.Stat(gray)
+
+        if gray_stat.mean[0] < self.DARK_MEAN:
+            return "too_dark"
+        if gray_stat.stddev[0] < self.BLANK_STDDEV:
+            return "blank"
+
+        if self._is_screenshot(image):
+            return "screenshot"
+
+        # Дисперсия отклика фильтра контуров — аналог variance of Laplacian. Крайние
+        # пиксели PIL не фильтрует (остается исходная яркость), поэтому рамку обрезаем
+        edges = gray.filter(ImageFilter.FIND_EDGES)
+        edges = edges.crop((1, 1, edges.width - 1, edges.height - 1))
+        if ImageStat.Stat(edges).var[0] < self.BLUR_EDGE_VARIANCE:
+            return "blurry"
+
+        return None
+
+    def _is_screenshot(self, image: Image.Image) -> bool:
+        """Скриншоты: мало уникальных цветов, крупные заливки одним цветом и резкие края.
+
+        Тарелка на однотонном фоне или суп с гладким градиентом тоже дают мало цветов
+        и доминирующий фон, но соседние пиксели в них меняются плавно; в интерфейсе
+        они либо совпадают, либо различаются скачком. Уменьшаем без интерполяции,
+        чтобы не «размазать» плоские цвета интерфейса.
+        """
+        sample = image.copy()
+        sample.thumbnail((self.SAMPLE_SIZE, self.SAMPLE_SIZE), Image.Resampling.NEAREST)
+        total = sample.width * sample.height
+        colors = sample.getcolors(maxcolors=total)
+        if not colors:
+            return False
+        unique_ratio = len(colors) / total
+        dominant_share = max(count for count, _ in colors) / total
+        if unique_ratio >= self.SCREENSHOT_UNIQUE_RATIO or dominant_share <= self.SCREENSHOT_DOMINANT_SHARE:
+            return False
+        return self._soft_step_share(sample.convert('L')) < self.SCREENSHOT_SOFT_SHARE
+
+    def _soft_step_share(self, gray: Image.Image) -> float:
+        """Доля пар соседних пикселей (по горизонтали и вертикали) с плавной разницей яркости"""
+        histogram = [0] * 256
+        for dx, dy in ((1, 0), (0, 1)):
+            shifted = ImageChops.offset(gray, dx, dy)
+            for value, count in enumerate(ImageChops.difference(gray, shifted).histogram()):
+                histogram[value] += count
+        return sum(histogram[1:self.SCREENSHOT_SOFT_STEP]) / sum(histogram)
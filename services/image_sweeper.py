@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+import aiohttp
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class StaleImageSweeper:
+    """Фоновый переанализ фото, зависших в `processing` (падение посреди анализа)
+    или `error` (квота, ошибка парсинга).
+
+    Фото повторно скачивается по сохранённому Telegram `file_path`, пока ссылка ещё
+    действительна, и прогоняется через тот же пайплайн, что и очередь анализа, но с
+    собственным низким лимитом параллельности. Об успешном результате пользователь
+    получает сообщение; если ссылка истекла — просьбу прислать фото заново.
+    """
+
+    STATUSES = ["processing", "error"]
+
+    def __init__(self, message_handler, interval_seconds: int = None) -> None:
+        self.message_handler = message_handler
+        self.supabase_service = message_handler.supabase_service
+        self.interval_seconds = interval_seconds or settings.SWEEPER_INTERVAL_SECONDS
+        self.bot = None
+        self._task = None
+        self._stopped = asyncio.Event()
+        # В run_sharded.py у каждого воркера свой переанализ — только для пользователей
+        # его шарда: их фото в его очереди, их отчеты в его кэше
+        self.shard = (settings.SHARD_INDEX, settings.SHARD_COUNT) if settings.SHARD_ROLE == "worker" else None
+
+    async def start(self, bot) -> None:
+        if not settings.ENABLE_IMAGE_SWEEPER:
+            logger.info("Переанализ зависших фото отключён")
+            return
+        if self._task and not self._task.done():
+            return
+        self.bot = bot
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run_loop())
+        logger.info("Переанализ зависших фото запущен (каждые %s сек)", self.interval_seconds)
+
+    async def stop(self, timeout: float = None) -> None:
+        """Остановить цикл; проход, не успевший за `timeout` секунд, прерывается.
+
+        Прерванные фото остаются в `processing`/`error` и будут подхвачены при следующем старте.
+        """
+        self._stopped.set()
+        if not self._task:
+            return
+        done, pending = await asyncio.wait({self._task}, timeout=timeout)
+        if pending:
+            logger.info("Переанализ зависших фото прерван по таймауту остановки")
+            self._task.cancel()
+        try:
+            await self._task
+        except (Exception, asyncio.CancelledError):
+            pass
+
+    async def _run_loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await self._sweep_once()
+            except Exception as e:
+                logger.error(f"Stale images sweeper loop error: {e}")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sweep_once(self) -> None:
+        now = datetime.now(timezone.utc)
+        rows = await self.supabase_service.get_stale_food_images(
+            self.STATUSES,
+            older_than=now - timedelta(minutes=settings.SWEEPER_MIN_AGE_MINUTES),
+            max_attempts=settings.SWEEPER_MAX_ATTEMPTS,
+            limit=settings.SWEEPER_BATCH_SIZE,
+            shard=self.shard,
+        )
+        # Фото, которые ещё обрабатывает очередь (в т.ч. ждут повтора), не трогаем
+        active = self.message_handler.analysis_queue.active_food_image_ids()
+        rows = [row for row in rows if row["id"] not in active]
+        if not rows:
+            return
+
+        link_deadline = now - timedelta(minutes=settings.TELEGRAM_FILE_LINK_TTL_MINUTES)
+        semaphore = asyncio.Semaphore(settings.SWEEPER_CONCURRENCY)
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(
+                *(self._recover(session, semaphore, row, link_deadline) for row in rows),
+                return_exceptions=True,
+            )
+
+        outcomes = [r if isinstance(r, str) else "failed" for r in results]
+        logger.info(
+            "Переанализ зависших фото: восстановлено %s, ссылка истекла %s, без подписки %s, ошибок %s",
+            outcomes.count("recovered"), outcomes.count("expired"), outcomes.count("rejected"), outcomes.count("failed"),
+        )
+
+    async def _recover(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, row: Dict[str, Any], link_deadline: datetime) -> str:
+        image_id = row["id"]
+        attempts = (row.get("sweep_attempts") or 0) + 1
+        telegram_id = (row.get("users") or {}).get("telegram_id")
+        image_url = row.get("image_url") or ""
+        uploaded_at = datetime.fromisoformat(row["uploaded_at"].replace('Z', '+00:00'))
+
+        if uploaded_at < link_deadline or not image_url.startswith("http") or not telegram_id:
+            await self.supabase_service.mark_food_image_swept(image_id, "expired", attempts)
+            if telegram_id:
+                await self.bot.send_message(
+                    chat_id=telegram_id,
+                    text="⚠️ We couldn't analyze one of your earlier photos. Please send it again."
+                )
+            return "expired"
+
+        async with semaphore:
+            # Помечаем попытку до анализа: при падении фото не будет переанализироваться бесконечно
+            await self.supabase_service.mark_food_image_swept(image_id, "processing", attempts)
+            try:
+                async with session.get(image_url, timeout=30) as resp:
+                    if resp.status != 200:
+                        raise RuntimeError(f"Telegram file status: {resp.status}")
+                    image_bytes = await resp.read()
+            except Exception as e:
+                logger.warning(f"Не удалось скачать фото {image_id} для переанализа: {e}")
+                await self.supabase_service.mark_food_image_swept(image_id, "error", attempts)
+                return "failed"
+
+            # Переанализ — такой же платный вызов: подписка или место в бесплатном лимите
+            # проверяются и резервируются так же, как при отправке фото
+            check = await self.message_handler.subscription_service.can_analyze_photo(telegram_id, reserve=True)
+            if check.get("reason") == "error_fallback":
+                await self.supabase_service.mark_food_image_swept(image_id, "error", attempts)
+                return "failed"
+            if not check.get("can_analyze"):
+                await self.supabase_service.update_food_image_status(
+                    image_id, "rejected", rejection_reason=check.get("reason")
+                )
+                await self.bot.send_message(
+                    chat_id=telegram_id,
+                    text="⚠️ One of your earlier photos wasn't analyzed: your free photo limit is used up "
+                         "or your subscription has ended.",
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton(text="💳 Subscription plans", callback_data="show_subscription_plans")]
+                    ])
+                )
+                return "rejected"
+
+            job = {
+                "chat_id": telegram_id,
+                "telegram_id": telegram_id,
+                "user_id": row["user_id"],
+                "food_image_id": image_id,
+                "recovered": True,
+                "reserved": bool(check.get("reserved")),
+            }
+            ok = await self.message_handler.analyze_job_image(job, image_bytes, image_url)
+            return "recovered" if ok else "failed"
@@ -46,6 +46,10 @@ class OpenAIService:
             logger.error(f"Ошибка сжатия изображения: {e}")
             return image_bytes
     
+    def prepare_image(self, image_bytes: bytes) -> bytes:
+        """Предобработка фото перед отправкой в API (можно выполнить заранее, в отдельном потоке)"""
+        return self._compress_image(image_bytes)
+    
     def _encode_image(self, image_bytes: bytes) -> str:
         """Кодировать изображение в base64"""
         return base64.b64encode(image_bytes).decode('utf-8')
@@ -63,18 +67,34 @@ class OpenAIService:
           "carbs": number (grams),
           "food_name": "dish name in English",
           "weight_grams": number (approximate portion weight in grams),
+          "per_100g": {"calories": number, "protein": number, "fats": number, "carbs": number},
           "confidence": number from 0 to 1
         }
 
+        "per_100g" is the nutrient density of the dish per 100 g; the totals must equal per_100g * weight_grams / 100.
+
         If there is no food, return zeros and food_name = "unknown".
         Be realistic about portion size.
         """
     
-    def analyze_food_image(self, image_bytes: bytes) -> NutritionAnalysis:
+    @staticmethod
+    def _parse_densities(per_100g) -> dict:
+        """Значения на 100 г из ответа модели; при отсутствии NutritionAnalysis выведет их из итогов и веса"""
+        if not isinstance(per_100g, dict):
+            return {}
+        densities = {}
+        for macro in ("calories", "protein", "fats", "carbs"):
+            try:
+                densities[f"{macro}_per_100g"] = float(per_100g[macro])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return densities
+    
+    def analyze_food_image(self, image_bytes: bytes, prepared: bool = False) -> NutritionAnalysis:
         """Анализировать изображение еды через OpenAI Vision API"""
         try:
-            # Сжимаем изображение
-            compressed_image = self._compress_image(image_bytes)
+            # Сжимаем изображение (если оно еще не подготовлено через prepare_image)
+            compressed_image = image_bytes if prepared else self._compress_image(image_bytes)
             
             # Кодируем в base64
             base64_image = self._encode_image(compressed_image)
@@ -128,7 +148,8 @@ class OpenAIService:
                     carbs=float(nutrition_data.get('carbs', 0)),
                     food_name=str(nutrition_data.get('food_name', 'unknown')),
                     confidence=float(nutrition_data.get('confidence', 0)),
-                    weight_grams=float(nutrition_data.get('weight_grams', 0)) if nutrition_data.get('weight_grams') is not None else None
+                    weight_grams=float(nutrition_data.get('weight_grams', 0)) if nutrition_data.get('weight_grams') is not None else None,
+                    **self._parse_densities(nutrition_data.get('per_100g'))
                 )
                 
                 logger.info(f"Successful image analysis: {nutrition_analysis.food_name}")
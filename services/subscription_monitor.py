@@ -1,51 +1,53 @@
 import asyncio
 import logging
-import threading
 from typing import Optional
 from services.subscription_service import SubscriptionService
 
 logger = logging.getLogger(__name__)
 
 class SubscriptionMonitor:
-    """Мониторинг подписок в фоновом режиме"""
-    
-    def __init__(self):
-        self.subscription_service = SubscriptionService()
-        self._monitoring = False
-        self._monitor_thread: Optional[threading.Thread] = None
-    
-    def start_monitoring(self):
+    """Мониторинг подписок в фоновом режиме (задача в event loop бота).
+
+    Раз в `interval_seconds` переводит истекшие подписки в expired, чтобы статус
+    в /subscription и в БД был верным, даже если пользователь не присылает фото
+    (проверка при анализе фото остается).
+    """
+
+    def __init__(self, subscription_service: Optional[SubscriptionService] = None, interval_seconds: int = 3600):
+        self.subscription_service = subscription_service or SubscriptionService()
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+
+    async def start(self) -> None:
         """Запуск мониторинга подписок"""
-        if self._monitoring:
+        if self._task and not self._task.done():
             logger.warning("Мониторинг подписок уже запущен")
             return
-        
-        self._monitoring = True
-        self._monitor_thread = threading.Thread(target=self._run_monitoring, daemon=True)
-        self._monitor_thread.start()
+
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run_loop())
         logger.info("Мониторинг подписок запущен")
-    
-    def stop_monitoring(self):
+
+    async def stop(self) -> None:
         """Остановка мониторинга подписок"""
-        if not self._monitoring:
-            return
-        
-        self._monitoring = False
-        if self._monitor_thread and self._monitor_thread.is_alive():
-            self._monitor_thread.join(timeout=5)
-        logger.info("Мониторинг подписок остановлен")
-    
-    def _run_monitoring(self):
+        self._stopped.set()
+        if self._task:
+            try:
+                await self._task
+            except Exception:
+                pass
+            self._task = None
+            logger.info("Мониторинг подписок остановлен")
+
+    async def _run_loop(self) -> None:
         """Основной цикл мониторинга"""
-        while self._monitoring:
+        while not self._stopped.is_set():
             try:
-                # Здесь можно добавить логику периодической проверки подписок
-                # Например, проверка истекших подписок, уведомления и т.д.
-                logger.debug("Проверка подписок...")
-                
-                # Пока что просто ждем
-                threading.Event().wait(60)  # Проверяем каждую минуту
-                
+                await self.subscription_service.check_and_update_expired_subscriptions()
             except Exception as e:
                 logger.error(f"Ошибка в мониторинге подписок: {e}")
-                threading.Event().wait(30)  # При ошибке ждем 30 секунд
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
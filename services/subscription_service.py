@@ -11,15 +11,15 @@ logger = logging.getLogger(__name__)
 class SubscriptionService:
     """Сервис для управления подписками через разные провайдеры"""
     
-    def __init__(self):
-        self.supabase_service = SupabaseService()
+    def __init__(self, supabase_service: Optional[SupabaseService] = None, crypto_service: Optional[CryptoService] = None):
+        self.supabase_service = supabase_service or SupabaseService()
         
         # Инициализируем доступные провайдеры
         self.payment_providers = {}
         
         # Только крипто-провайдер
         if "crypto" in settings.ENABLED_PAYMENT_PROVIDERS:
-            self.payment_providers["crypto"] = CryptoService()
+            self.payment_providers["crypto"] = crypto_service or CryptoService(self.supabase_service)
         
         # Определяем основной провайдер
         self.primary_provider = settings.PRIMARY_PAYMENT_PROVIDER
@@ -35,24 +35,30 @@ class SubscriptionService:
                 "yearly": {"name": "Yearly", "price": 49.99, "currency": "USD", "duration_days": 365, "photos_limit": -1}
             }
     
-    async def can_analyze_photo(self, user_id: int) -> Dict[str, Any]:
-        """Проверить, может ли пользователь анализировать фото"""
+    async def can_analyze_photo(self, user_id: int, user: Optional[User] = None, reserve: bool = False) -> Dict[str, Any]:
+        """Проверить, может ли пользователь анализировать фото (user — уже загруженный пользователь, если есть).
+
+        reserve=True — бесплатное фото атомарно резервируется (результат с "reserved": True),
+        чтобы пачка фото, отправленная до окончания анализа, не прошла лимит целиком.
+        Резерв списывает record_analysis или освобождает release_photo_reservation.
+        """
         try:
-            logger.info(f"🔍 Проверка подписки для telegram_id: {user_id}")
-            
-            user = await self.supabase_service.get_user_by_telegram_id(user_id)
+            if user is None:
+                user = await self.supabase_service.get_user_by_telegram_id(user_id)
             if not user:
-                logger.warning(f"⚠️ Пользователь {user_id} не найден в БД")
+                logger.warning("Пользователь не найден в БД при проверке подписки", extra={"user": user_id})
                 return {"can_analyze": False, "reason": "user_not_found"}
             
-            logger.info(f"✅ Пользователь найден: db_id={user.id}")
-            
             # Проверяем активную подписку (с fallback для отсутствующих полей)
             subscription_status = getattr(user, 'subscription_status', 'free')
             subscription_end = getattr(user, 'subscription_end', None)
             photos_analyzed = getattr(user, 'photos_analyzed', 0)
             
-            logger.info(f"📊 Статистика: status={subscription_status}, photos_analyzed={photos_analyzed}, limit={settings.FREE_PHOTO_LIMIT}")
+            # Ленивое форматирование: на горячем пути DEBUG обычно выключен или прорежен
+            logger.debug(
+                "Проверка подписки: db_id=%s status=%s photos_analyzed=%s limit=%s",
+                user.id, subscription_status, photos_analyzed, settings.FREE_PHOTO_LIMIT
+            )
             
             if subscription_status == "active":
                 # Дополнительно проверяем, не истекла ли подписка
@@ -79,10 +85,12 @@ class SubscriptionService:
             
             # Проверяем бесплатный лимит (первое фото бесплатно)
             if photos_analyzed < settings.FREE_PHOTO_LIMIT:
-                logger.info(f"✅ Бесплатное фото разрешено: {photos_analyzed}/{settings.FREE_PHOTO_LIMIT}")
+                if reserve:
+                    return await self._reserve_free_photo(user, photos_analyzed)
+                logger.debug("Бесплатное фото разрешено: %s/%s", photos_analyzed, settings.FREE_PHOTO_LIMIT)
                 return {"can_analyze": True, "reason": "free_photo"}
             
-            logger.info(f"⚠️ Лимит бесплатных фото исчерпан: {photos_analyzed}/{settings.FREE_PHOTO_LIMIT}")
+            logger.debug("Лимит бесплатных фото исчерпан: %s/%s", photos_analyzed, settings.FREE_PHOTO_LIMIT)
             return {
                 "can_analyze": False, 
                 "reason": "subscription_required",
@@ -91,18 +99,37 @@ class SubscriptionService:
             }
             
         except Exception as e:
-            logger.error(f"Ошибка проверки возможности анализа: {e}")
+            logger.error("Ошибка проверки возможности анализа: %s", e)
             # В случае ошибки разрешаем бесплатное фото для отладки
             return {
                 "can_analyze": True,
                 "reason": "error_fallback"
             }
     
+    async def _reserve_free_photo(self, user: User, photos_analyzed: int) -> Dict[str, Any]:
+        """Занять место в бесплатном лимите с учетом фото, уже стоящих в очереди"""
+        try:
+            reserved = await self.supabase_service.reserve_photo_analysis(user.id, settings.FREE_PHOTO_LIMIT)
+        except Exception as e:
+            # Без RPC (не выполнен add_photo_reservations.sql) — прежняя проверка без резерва
+            logger.warning("Резерв бесплатного фото недоступен: %s", e)
+            return {"can_analyze": True, "reason": "free_photo"}
+        if reserved:
+            logger.debug("Бесплатное фото зарезервировано: %s/%s", photos_analyzed, settings.FREE_PHOTO_LIMIT)
+            return {"can_analyze": True, "reason": "free_photo", "reserved": True}
+        logger.debug("Лимит бесплатных фото занят фото в очереди: %s/%s", photos_analyzed, settings.FREE_PHOTO_LIMIT)
+        return {
+            "can_analyze": False,
+            "reason": "subscription_required",
+            "photos_analyzed": photos_analyzed,
+            "subscription_plans": self.subscription_plans
+        }
+
     async def increment_photos_analyzed(self, telegram_user_id: int) -> bool:
         """Увеличить счетчик проанализированных фото"""
         try:
             # Получаем текущий счетчик по telegram_id
-            user_result = self.supabase_service.supabase.table("users").select("id, photos_analyzed").eq("telegram_id", telegram_user_id).execute()
+            user_result = await self.supabase_service.execute(self.supabase_service.supabase.table("users").select("id, photos_analyzed").eq("telegram_id", telegram_user_id))
             
             if not user_result.data:
                 logger.error(f"Пользователь {telegram_user_id} не найден")
@@ -112,9 +139,9 @@ class SubscriptionService:
             current_count = user_data.get("photos_analyzed", 0)
             
             # Увеличиваем счетчик
-            result = self.supabase_service.supabase.table("users").update({
+            result = await self.supabase_service.execute(self.supabase_service.supabase.table("users").update({
                 "photos_analyzed": current_count + 1
-            }).eq("id", user_data["id"]).execute()
+            }).eq("id", user_data["id"]))
             
             return True
         except Exception as e:
@@ -190,9 +217,9 @@ class SubscriptionService:
     async def _update_subscription_status(self, user_id: int, status: str) -> bool:
         """Обновить статус подписки в БД"""
         try:
-            result = self.supabase_service.supabase.table("users").update({
+            result = await self.supabase_service.execute(self.supabase_service.supabase.table("users").update({
                 "subscription_status": status
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
             
             return True
         except Exception as e:
@@ -200,27 +227,18 @@ class SubscriptionService:
             return False
     
     async def check_and_update_expired_subscriptions(self) -> int:
-        """Проверить и обновить истекшие подписки"""
+        """Перевести истекшие активные подписки в expired одним UPDATE; вернуть их количество"""
         try:
-            # Получаем всех пользователей с активными подписками
-            active_users = self.supabase_service.supabase.table("users").select("*").eq(
-                "subscription_status", "active"
-            ).execute()
-            
-            expired_count = 0
-            current_time = datetime.now()
-            
-            for user_data in active_users.data:
-                subscription_end = None
-                if user_data.get("subscription_end"):
-                    subscription_end = datetime.fromisoformat(user_data["subscription_end"].replace('Z', '+00:00'))
-                
-                # Проверяем истечение подписки
-                if subscription_end and subscription_end < current_time:
-                    await self._update_subscription_status(user_data["id"], "expired")
-                    expired_count += 1
-                    logger.info(f"Подписка истекла для пользователя {user_data['id']}")
-            
+            # subscription_end хранится без часового пояса, как его пишет _activate_subscription
+            result = await self.supabase_service.execute(
+                self.supabase_service.supabase.table("users")
+                .update({"subscription_status": "expired"})
+                .eq("subscription_status", "active")
+                .lt("subscription_end", datetime.now().isoformat())
+            )
+            expired_count = len(result.data or [])
+            if expired_count:
+                logger.info(f"Истекло подписок: {expired_count}")
             return expired_count
             
         except Exception as e:
@@ -234,9 +252,9 @@ class SubscriptionService:
     async def reset_photos_limit_for_new_billing_period(self, user_id: int) -> bool:
         """Сбросить лимит фото для нового расчетного периода (при продлении подписки)"""
         try:
-            result = self.supabase_service.supabase.table("users").update({
+            result = await self.supabase_service.execute(self.supabase_service.supabase.table("users").update({
                 "photos_analyzed": 0
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
             
             logger.info(f"Сброшен счетчик фото для пользователя {user_id}")
             return True
@@ -275,7 +293,7 @@ class SubscriptionService:
             end_date = start_date + timedelta(days=plan['duration_days'])
             
             # Обновляем пользователя в БД
-            result = self.supabase_service.supabase.table("users").update({
+            result = await self.supabase_service.execute(self.supabase_service.supabase.table("users").update({
                 "subscription_status": "active",
                 "subscription_plan": plan_type,
                 "subscription_start": start_date.isoformat(),
@@ -283,7 +301,7 @@ class SubscriptionService:
                 "payment_provider": provider,
                 "provider_payment_id": provider_payment_id,
                 "photos_analyzed": 0  # Сбрасываем счетчик фото
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
             
             if result.data:
                 logger.info(f"Подписка активирована для пользователя {user_id}: {plan_type} через {provider}")
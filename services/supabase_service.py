@@ -1,7 +1,9 @@
 from config.database import db_manager
-from models.data_models import User, FoodImage, NutritionData, DailyReport, WaterIntake
+from models.data_models import User, FoodImage, NutritionData, DailyReport, NutritionAnalysis
+from config.settings import settings
 from datetime import datetime, date
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,6 +11,12 @@ logger = logging.getLogger(__name__)
 class SupabaseService:
     def __init__(self):
         self.supabase = db_manager.get_client()
+
+    @staticmethod
+    async def execute(query):
+        """Выполнить запрос синхронного клиента в потоке, не блокируя event loop
+        (обновления и воркеры очереди анализа не ждут друг друга на каждом round trip)"""
+        return await asyncio.to_thread(query.execute)
     
     # User operations
     async def create_user(self, user: User) -> User:
@@ -26,7 +34,7 @@ class SupabaseService:
                 "daily_carbs_goal": user.daily_carbs_goal
             }
             
-            result = self.supabase.table("users").insert(data).execute()
+            result = await self.execute(self.supabase.table("users").insert(data))
             user_data = result.data[0]
             return User(**user_data)
         except Exception as e:
@@ -39,7 +47,10 @@ class SupabaseService:
             if not self.supabase:
                 return None
                 
-            result = self.supabase.table("users").select("*").eq("telegram_id", telegram_id).execute()
+            # Синхронный клиент — выполняем в потоке, чтобы не блокировать event loop
+            # (на горячем пути фото параллельно идет скачивание)
+            query = self.supabase.table("users").select("*").eq("telegram_id", telegram_id)
+            result = await self.execute(query)
             if result.data:
                 return User(**result.data[0])
             return None
@@ -54,9 +65,10 @@ class SupabaseService:
                 raise Exception("Supabase client not initialized")
             
             # Увеличиваем счетчик на 1
-            self.supabase.table("users").update({
-                "total_photos_sent": self.supabase.table("users").select("total_photos_sent").eq("telegram_id", telegram_id).execute().data[0]["total_photos_sent"] + 1
-            }).eq("telegram_id", telegram_id).execute()
+            current = await self.execute(self.supabase.table("users").select("total_photos_sent").eq("telegram_id", telegram_id))
+            await self.execute(self.supabase.table("users").update({
+                "total_photos_sent": current.data[0]["total_photos_sent"] + 1
+            }).eq("telegram_id", telegram_id))
             
             logger.info(f"Увеличен счетчик общих фото для пользователя {telegram_id}")
             
@@ -76,25 +88,77 @@ class SupabaseService:
                 "image_url": food_image.image_url,
                 "status": food_image.status
             }
+            if food_image.rejection_reason:
+                data["rejection_reason"] = food_image.rejection_reason
             
-            result = self.supabase.table("food_images").insert(data).execute()
+            result = await self.execute(self.supabase.table("food_images").insert(data))
             image_data = result.data[0]
             return FoodImage(**image_data)
         except Exception as e:
             logger.error(f"Ошибка создания записи о фотографии: {e}")
             raise
     
-    async def update_food_image_status(self, image_id: int, status: str):
+    async def update_food_image_status(self, image_id: int, status: str, rejection_reason: Optional[str] = None):
         """Обновить статус фотографии"""
         try:
             if not self.supabase:
                 raise Exception("Supabase client not initialized")
-                
-            self.supabase.table("food_images").update({"status": status}).eq("id", image_id).execute()
+            
+            data = {"status": status}
+            if rejection_reason:
+                data["rejection_reason"] = rejection_reason
+            await self.execute(self.supabase.table("food_images").update(data).eq("id", image_id))
         except Exception as e:
             logger.error(f"Ошибка обновления статуса фотографии: {e}")
             raise
     
+    async def get_stale_food_images(self, statuses: List[str], older_than: datetime, max_attempts: int, limit: int = 20,
+                                    shard: Optional[Tuple[int, int]] = None) -> List[dict]:
+        """Получить зависшие фото (processing/error) вместе с telegram_id владельца.
+
+        shard — (индекс, число шардов): только пользователи этого воркера (add_sharded_sweeper.sql).
+        """
+        try:
+            if not self.supabase:
+                return []
+
+            if shard:
+                shard_index, shard_count = shard
+                result = await self.execute(self.supabase.rpc("get_stale_food_images_shard", {
+                    "p_statuses": statuses,
+                    "p_older_than": older_than.isoformat(),
+                    "p_max_attempts": max_attempts,
+                    "p_limit": limit,
+                    "p_shard_count": shard_count,
+                    "p_shard_index": shard_index
+                }))
+                return result.data or []
+
+            # Запрос покрывается частичным индексом idx_food_images_stale (status, uploaded_at)
+            result = await self.execute(self.supabase.table("food_images").select(
+                "id, user_id, image_url, status, uploaded_at, sweep_attempts, users(telegram_id)"
+            ).in_("status", statuses).lt("uploaded_at", older_than.isoformat()).lt(
+                "sweep_attempts", max_attempts
+            ).order("uploaded_at").limit(limit))
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Ошибка получения зависших фото: {e}")
+            return []
+
+    async def mark_food_image_swept(self, image_id: int, status: str, sweep_attempts: int):
+        """Отметить попытку повторного анализа фото"""
+        try:
+            if not self.supabase:
+                raise Exception("Supabase client not initialized")
+
+            await self.execute(self.supabase.table("food_images").update({
+                "status": status,
+                "sweep_attempts": sweep_attempts
+            }).eq("id", image_id))
+        except Exception as e:
+            logger.error(f"Ошибка обновления попытки переанализа фото: {e}")
+            raise
+
     # NutritionData operations
     async def create_nutrition_data(self, nutrition_data: NutritionData) -> NutritionData:
         """Создать запись о питательных веществах"""
@@ -113,13 +177,121 @@ class SupabaseService:
                 "weight_grams": nutrition_data.weight_grams
             }
             
-            result = self.supabase.table("nutrition_data").insert(data).execute()
+            result = await self.execute(self.supabase.table("nutrition_data").insert(data))
             nutrition_data_dict = result.data[0]
             return NutritionData(**nutrition_data_dict)
         except Exception as e:
             logger.error(f"Ошибка создания данных о питании: {e}")
             raise
     
+    async def record_analysis(self, user_id: int, image_url: str, analysis: NutritionAnalysis, report_date: date,
+                              food_image_id: Optional[int] = None, reserved: bool = False) -> dict:
+        """Записать результат анализа одним RPC (фото, КБЖУ, статус, счетчики, дневной отчет).
+
+        reserved — фото прошло по резерву бесплатного лимита, RPC его списывает.
+        """
+        try:
+            if not self.supabase:
+                raise Exception("Supabase client not initialized")
+
+            result = await self.execute(self.supabase.rpc("record_analysis", {
+                "p_user_id": user_id,
+                "p_image_url": image_url,
+                "p_nutrition": analysis.model_dump(),
+                "p_report_date": report_date.isoformat(),
+                "p_food_image_id": food_image_id,
+                "p_reserved": reserved
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Ошибка записи результата анализа: {e}")
+            raise
+
+    async def reserve_photo_analysis(self, user_id: int, limit: int) -> bool:
+        """Атомарно занять бесплатный анализ фото (с учетом фото в очереди); False — лимит исчерпан"""
+        if not self.supabase:
+            raise Exception("Supabase client not initialized")
+        query = self.supabase.rpc("reserve_photo_analysis", {"p_user_id": user_id, "p_limit": limit})
+        result = await self.execute(query)
+        return bool(result.data)
+
+    async def release_photo_reservation(self, user_id: int):
+        """Вернуть резерв бесплатного анализа (фото отклонено или анализ не удался)"""
+        try:
+            if not self.supabase:
+                return
+            query = self.supabase.rpc("release_photo_reservation", {"p_user_id": user_id})
+            await self.execute(query)
+        except Exception as e:
+            logger.error(f"Ошибка освобождения резерва анализа фото: {e}")
+
+    async def record_text_meal(self, user_id: int, text: str, items: List[NutritionData], report_date: date) -> dict:
+        """Записать прием пищи, введенный текстом, одним RPC (позиции КБЖУ и дневной отчет)"""
+        try:
+            if not self.supabase:
+                raise Exception("Supabase client not initialized")
+
+            result = await self.execute(self.supabase.rpc("record_text_meal", {
+                "p_user_id": user_id,
+                "p_text": text,
+                "p_items": [item.model_dump(exclude={"id", "food_image_id", "created_at"}) for item in items],
+                "p_report_date": report_date.isoformat()
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Ошибка записи текстового приема пищи: {e}")
+            raise
+
+    async def rescale_nutrition(self, food_image_id: int, new_weight: int, telegram_id: int) -> Optional[dict]:
+        """Пересчитать КБЖУ под новый вес порции одним RPC; вернуть обновленную строку nutrition_data"""
+        try:
+            if not self.supabase:
+                raise Exception("Supabase client not initialized")
+
+            result = await self.execute(self.supabase.rpc("rescale_nutrition", {
+                "p_food_image_id": food_image_id,
+                "p_new_weight": new_weight,
+                "p_telegram_id": telegram_id,
+                "p_tz": settings.TIMEZONE
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Ошибка пересчета веса порции: {e}")
+            raise
+
+    # Recent meals (user_meal_stats)
+    async def get_recent_meals(self, user_id: int, limit: int = 8) -> List[dict]:
+        """Самые частые блюда пользователя (индекс user_meal_stats, поддерживается триггером)"""
+        try:
+            if not self.supabase:
+                return []
+
+            result = await self.execute(self.supabase.table("user_meal_stats").select(
+                "id, food_name, times_logged, calories, protein, fats, carbs, weight_grams"
+            ).eq("user_id", user_id).order("times_logged", desc=True).order(
+                "last_logged_at", desc=True
+            ).limit(limit))
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Ошибка получения частых блюд: {e}")
+            return []
+
+    async def relog_meal(self, user_id: int, meal_id: int, report_date: date) -> Optional[dict]:
+        """Повторно записать блюдо из user_meal_stats одним RPC (без анализа фото)"""
+        try:
+            if not self.supabase:
+                raise Exception("Supabase client not initialized")
+
+            result = await self.execute(self.supabase.rpc("relog_meal", {
+                "p_user_id": user_id,
+                "p_meal_id": meal_id,
+                "p_report_date": report_date.isoformat()
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Ошибка повторной записи блюда: {e}")
+            raise
+
     # DailyReport operations
     async def get_daily_report(self, user_id: int, report_date: date) -> Optional[DailyReport]:
         """Получить дневной отчет"""
@@ -127,7 +299,7 @@ class SupabaseService:
             if not self.supabase:
                 return None
                 
-            result = self.supabase.table("daily_reports").select("*").eq("user_id", user_id).eq("date", report_date.isoformat()).execute()
+            result = await self.execute(self.supabase.table("daily_reports").select("*").eq("user_id", user_id).eq("date", report_date.isoformat()))
             if result.data:
                 return DailyReport(**result.data[0])
             return None
@@ -153,9 +325,9 @@ class SupabaseService:
             }
             
             if existing_report:
-                result = self.supabase.table("daily_reports").update(data).eq("id", existing_report.id).execute()
+                result = await self.execute(self.supabase.table("daily_reports").update(data).eq("id", existing_report.id))
             else:
-                result = self.supabase.table("daily_reports").insert(data).execute()
+                result = await self.execute(self.supabase.table("daily_reports").insert(data))
             
             report_data = result.data[0]
             return DailyReport(**report_data)
@@ -164,145 +336,46 @@ class SupabaseService:
             raise
     
     # Analytics operations
-    async def get_user_nutrition_today(self, user_id: int) -> dict:
-        """Получить питание пользователя за сегодня"""
-        try:
-            if not self.supabase:
-                return {"calories": 0, "protein": 0, "fats": 0, "carbs": 0}
-                
-            today = date.today().isoformat()
-            
-            # Получаем все записи о питании за сегодня
-            # Сначала получаем ID изображений пользователя
-            food_images_result = self.supabase.table("food_images").select("id").eq("user_id", user_id).execute()
-            food_image_ids = [img["id"] for img in food_images_result.data]
-            
-            if not food_image_ids:
-                return {"calories": 0, "protein": 0, "fats": 0, "carbs": 0}
-            
-            # Получаем данные о питании
-            result = self.supabase.table("nutrition_data").select(
-                "calories, protein, fats, carbs"
-            ).in_("food_image_id", food_image_ids).gte("created_at", f"{today}T00:00:00").lte("created_at", f"{today}T23:59:59").execute()
-            
-            total_calories = sum(item["calories"] for item in result.data)
-            total_protein = sum(item["protein"] for item in result.data)
-            total_fats = sum(item["fats"] for item in result.data)
-            total_carbs = sum(item["carbs"] for item in result.data)
-            
-            return {
-                "calories": total_calories,
-                "protein": total_protein,
-                "fats": total_fats,
-                "carbs": total_carbs
-            }
-        except Exception as e:
-            logger.error(f"Ошибка получения питания за сегодня: {e}")
-            return {"calories": 0, "protein": 0, "fats": 0, "carbs": 0}
-    
-    async def get_user_nutrition_week(self, user_id: int) -> dict:
-        """Получить питание пользователя за неделю"""
+    async def get_dashboard(self, user_id: int, start_date: date, end_date: date, timezone: str = "UTC") -> List[dict]:
+        """КБЖУ и вода по локальным дням периода одним RPC (get_dashboard): строка на каждый день"""
         try:
             if not self.supabase:
-                return {
-                    "total_calories": 0, "total_protein": 0, "total_fats": 0, "total_carbs": 0,
-                    "average_calories": 0, "average_protein": 0, "average_fats": 0, "average_carbs": 0
-                }
-                
-            from datetime import timedelta
-            end_date = date.today()
-            start_date = end_date - timedelta(days=7)
-            
-            # Получаем все записи о питании за неделю
-            # Сначала получаем ID изображений пользователя
-            food_images_result = self.supabase.table("food_images").select("id").eq("user_id", user_id).execute()
-            food_image_ids = [img["id"] for img in food_images_result.data]
-            
-            if not food_image_ids:
-                return {
-                    "total_calories": 0, "total_protein": 0, "total_fats": 0, "total_carbs": 0,
-                    "average_calories": 0, "average_protein": 0, "average_fats": 0, "average_carbs": 0
-                }
-            
-            # Получаем данные о питании
-            result = self.supabase.table("nutrition_data").select(
-                "calories, protein, fats, carbs, created_at"
-            ).in_("food_image_id", food_image_ids).gte("created_at", f"{start_date}T00:00:00").lte("created_at", f"{end_date}T23:59:59").execute()
-            
-            total_calories = sum(item["calories"] for item in result.data)
-            total_protein = sum(item["protein"] for item in result.data)
-            total_fats = sum(item["fats"] for item in result.data)
-            total_carbs = sum(item["carbs"] for item in result.data)
-            
-            days_count = 7
-            return {
-                "total_calories": total_calories,
-                "total_protein": total_protein,
-                "total_fats": total_fats,
-                "total_carbs": total_carbs,
-                "average_calories": total_calories / days_count,
-                "average_protein": total_protein / days_count,
-                "average_fats": total_fats / days_count,
-                "average_carbs": total_carbs / days_count
-            }
-        except Exception as e:
-            logger.error(f"Ошибка получения питания за неделю: {e}")
-            return {
-                "total_calories": 0, "total_protein": 0, "total_fats": 0, "total_carbs": 0,
-                "average_calories": 0, "average_protein": 0, "average_fats": 0, "average_carbs": 0
-            }
-
-    async def get_water_week(self, user_id: int) -> dict:
-        """Получить суммарную воду по дням за последнюю неделю (включая сегодня)"""
-        try:
-            if not self.supabase:
-                return {}
-            from datetime import date, timedelta
-            end_date = date.today()
-            start_date = end_date - timedelta(days=6)
-            result = self.supabase.table("water_intake").select(
-                "amount_ml, created_at"
-            ).eq("user_id", user_id).gte("created_at", f"{start_date}T00:00:00").lte("created_at", f"{end_date}T23:59:59").execute()
+                return []
 
-            # Агрегируем по дням (YYYY-MM-DD)
-            per_day = {}
-            for item in result.data:
-                day = item["created_at"][0:10]
-                per_day[day] = per_day.get(day, 0) + item["amount_ml"]
-            return per_day
+            query = self.supabase.rpc("get_dashboard", {
+                "p_user_id": user_id,
+                "p_from": start_date.isoformat(),
+                "p_to": end_date.isoformat(),
+                "p_tz": timezone
+            })
+            result = await self.execute(query)
+            return result.data or []
         except Exception as e:
-            logger.error(f"Ошибка получения воды за неделю: {e}")
-            return {}
+            # Не возвращаем пустой список: нули попали бы в кэш отчетов как настоящие данные
+            logger.error(f"Ошибка получения данных статистики: {e}")
+            raise
 
     # Water operations
-    async def add_water_intake(self, user_id: int, amount_ml: int) -> WaterIntake:
+    async def add_water(self, user_id: int, amount_ml: int, report_date: date) -> int:
+        """Записать воду и вернуть итог за день (RPC add_water: журнал + атомарный счетчик)"""
         try:
             if not self.supabase:
                 raise Exception("Supabase client not initialized")
-            data = {"user_id": user_id, "amount_ml": amount_ml}
-            result = self.supabase.table("water_intake").insert(data).execute()
-            return WaterIntake(**result.data[0])
+            result = await self.execute(self.supabase.rpc("add_water", {
+                "p_user_id": user_id,
+                "p_amount_ml": amount_ml,
+                "p_report_date": report_date.isoformat()
+            }))
+            return int(result.data or 0)
         except Exception as e:
             logger.error(f"Ошибка добавления воды: {e}")
             raise
 
-    async def get_water_today(self, user_id: int) -> int:
-        try:
-            if not self.supabase:
-                return 0
-            from datetime import date
-            today = date.today().isoformat()
-            result = self.supabase.table("water_intake").select("amount_ml,created_at").eq("user_id", user_id).gte("created_at", f"{today}T00:00:00").lte("created_at", f"{today}T23:59:59").execute()
-            return sum(item["amount_ml"] for item in result.data)
-        except Exception as e:
-            logger.error(f"Ошибка получения воды за сегодня: {e}")
-            return 0
-
     async def set_user_water_goal(self, user_id: int, goal_ml: int) -> User:
         try:
             if not self.supabase:
                 raise Exception("Supabase client not initialized")
-            result = self.supabase.table("users").update({"daily_water_goal_ml": goal_ml}).eq("id", user_id).execute()
+            result = await self.execute(self.supabase.table("users").update({"daily_water_goal_ml": goal_ml}).eq("id", user_id))
             return User(**result.data[0])
         except Exception as e:
             logger.error(f"Ошибка установки нормы воды: {e}")
@@ -1,6 +1,6 @@
 import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import aiohttp
 
@@ -21,9 +21,9 @@ class Trc20Monitor:
 
     USDT_TRC20_CONTRACT = 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t'
 
-    def __init__(self, interval_seconds: int = 180) -> None:
-        self.supabase_service = SupabaseService()
-        self.crypto = CryptoService()
+    def __init__(self, interval_seconds: int = 180, supabase_service: Optional[SupabaseService] = None, crypto_service: Optional[CryptoService] = None) -> None:
+        self.supabase_service = supabase_service or SupabaseService()
+        self.crypto = crypto_service or CryptoService(self.supabase_service)
         self.interval_seconds = interval_seconds
         self._task = None
         self._stopped = asyncio.Event()
@@ -62,7 +62,7 @@ class Trc20Monitor:
         # Берём только недавние ожидания, чтобы не матчить очень старые
         from datetime import datetime, timedelta
         since_iso = (datetime.utcnow() - timedelta(days=2)).isoformat()
-        pending = self.supabase_service.supabase.table('payments').select('*').eq('payment_method', 'crypto').eq('status', 'pending').gte('created_at', since_iso).order('created_at', desc=True).limit(50).execute()
+        pending = await self.supabase_service.execute(self.supabase_service.supabase.table('payments').select('*').eq('payment_method', 'crypto').eq('status', 'pending').gte('created_at', since_iso).order('created_at', desc=True).limit(50))
         pending_list: List[Dict[str, Any]] = pending.data or []
         if not pending_list:
             return
@@ -129,7 +129,7 @@ class Trc20Monitor:
                     continue
                 ok = await self.crypto.activate_after_user_confirm(user_id=pay['user_id'], plan_type=(pay.get('plan_type') or 'monthly'), tx_hash=match['tx_hash'])
                 if ok:
-                    self.supabase_service.supabase.table('payments').update({'status': 'completed', 'tx_hash': match['tx_hash']}).eq('id', pay['id']).execute()
+                    await self.supabase_service.execute(self.supabase_service.supabase.table('payments').update({'status': 'completed', 'tx_hash': match['tx_hash']}).eq('id', pay['id']))
                     logger.info(f"TRC20 подтверждён: user={pay['user_id']} tx={match['tx_hash']}")
             except Exception as e:
                 logger.error(f'TRC20 match error: {e}')
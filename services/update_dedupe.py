@@ -0,0 +1,90 @@
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config.settings import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Хранилище уже обработанных update_id за скользящее окно времени.
+
+    Telegram повторяет доставку, если веб-хук не ответил вовремя, а после
+    рестарта long polling может снова получить необработанные обновления.
+    Повтор фото означал бы второй вызов OpenAI и двойной счетчик фото, поэтому
+    update_id отмечается до обработки. Первым проверяется словарь в памяти
+    (ограничен окном и числом записей), затем — локальный SQLite, если задан
+    путь: он переживает рестарт процесса.
+    """
+
+    PRUNE_EVERY = 1000  # Чистить устаревшие строки SQLite раз в столько вставок
+
+    def __init__(
+        self,
+        window_seconds: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        db_path: Optional[str] = None,
+    ) -> None:
+        self.window_seconds = window_seconds or settings.UPDATE_DEDUPE_WINDOW_SECONDS
+        self.max_entries = max_entries or settings.UPDATE_DEDUPE_MAX_ENTRIES
+        self.db_path = settings.UPDATE_DEDUPE_DB_PATH if db_path is None else db_path
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._inserts = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.db_path:
+            try:
+                self._db = sqlite3.connect(self.db_path, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS processed_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_processed_updates_seen_at ON processed_updates(seen_at)")
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка открытия хранилища update_id, работаем только в памяти: {e}")
+                self.db_path = ""
+                self._db = None
+        return self._db
+
+    def _evict(self, now: float) -> None:
+        # Записи добавляются по времени, поэтому устаревшие всегда в начале
+        deadline = now - self.window_seconds
+        while self._seen and (len(self._seen) > self.max_entries or next(iter(self._seen.values())) < deadline):
+            self._seen.popitem(last=False)
+
+    def check_and_mark(self, update_id: int) -> bool:
+        """Отметить update_id; True — обновление уже обрабатывалось (дубликат)"""
+        now = time.time()
+        self._evict(now)
+        seen_at = self._seen.get(update_id)
+        if seen_at is not None:
+            metrics.increment("updates_duplicate_skipped_total")
+            return True
+        self._seen[update_id] = now
+
+        db = self._connect()
+        if db is not None:
+            try:
+                cursor = db.execute(
+                    "INSERT INTO processed_updates (update_id, seen_at) VALUES (?, ?) "
+                    "ON CONFLICT(update_id) DO UPDATE SET seen_at = excluded.seen_at "
+                    "WHERE processed_updates.seen_at < ?",
+                    (update_id, now, now - self.window_seconds),
+                )
+                self._inserts += 1
+                if self._inserts % self.PRUNE_EVERY == 0:
+                    db.execute("DELETE FROM processed_updates WHERE seen_at < ?", (now - self.window_seconds,))
+                if cursor.rowcount == 0:
+                    # Строка свежее окна — обработано до рестарта
+                    metrics.increment("updates_duplicate_skipped_total")
+                    return True
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи update_id {update_id}: {e}")
+
+        metrics.increment("updates_accepted_total")
+        return False
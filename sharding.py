@@ -0,0 +1,103 @@
+"""
+Шардирование бота по telegram_id: фронтенд принимает веб-хук Telegram и пересылает
+каждое обновление одному из N воркеров (отдельных процессов) по id пользователя
+"""
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+from telegram import Bot, Update
+
+from bot_app import WEBHOOK_PATH_PREFIX
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SHARD_SECRET_HEADER = "X-Shard-Secret"
+INTERNAL_UPDATE_PATH = "/internal/update"
+
+
+def shard_key(data: Dict[str, Any]) -> int:
+    """Id пользователя (или чата) из обновления без полного разбора в Update.
+
+    Все обновления одного пользователя попадают в один воркер — порядок внутри
+    пользователя и кэши процесса (отчеты, состояние диалога) остаются согласованными.
+    """
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        # message, callback_query, pre_checkout_query, ... — автор в "from"
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return data.get("update_id", 0)
+
+
+class ShardRouter:
+    """Фронтенд: принимает веб-хук Telegram и пересылает обновления воркерам.
+
+    Подключается к webhook_server так же, как BotApp (attach_bot). Воркер i слушает
+    127.0.0.1:SHARD_WORKER_BASE_PORT+i. Если воркер недоступен, веб-хук отвечает
+    503 и Telegram повторит доставку (повтор отсечет дедупликация update_id).
+    """
+
+    intake = "webhook"
+
+    def __init__(
+        self,
+        webhook_url: str,
+        shard_count: Optional[int] = None,
+        base_port: Optional[int] = None,
+        internal_secret: Optional[str] = None,
+    ) -> None:
+        self.webhook_url = webhook_url.rstrip("/")
+        self.shard_count = shard_count or settings.SHARD_COUNT
+        self.base_port = base_port or settings.SHARD_WORKER_BASE_PORT
+        self.internal_secret = internal_secret or settings.SHARD_INTERNAL_SECRET
+        self.webhook_secret = settings.TELEGRAM_WEBHOOK_SECRET
+        self._client: Optional[httpx.AsyncClient] = None
+
+        if self.shard_count < 1:
+            raise ValueError("SHARD_COUNT должен быть не меньше 1")
+        if not self.internal_secret:
+            raise ValueError("SHARD_INTERNAL_SECRET не задан")
+        if not self.webhook_secret:
+            raise ValueError("TELEGRAM_WEBHOOK_SECRET обязателен в режиме веб-хука")
+
+    @property
+    def webhook_path(self) -> str:
+        return f"{WEBHOOK_PATH_PREFIX}/{self.webhook_secret}"
+
+    def shard_for(self, data: Dict[str, Any]) -> int:
+        return shard_key(data) % self.shard_count
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(timeout=10)
+
+    async def start_intake(self) -> None:
+        """Зарегистрировать веб-хук (когда веб-сервер уже слушает порт)"""
+        async with Bot(settings.TELEGRAM_BOT_TOKEN) as bot:
+            await bot.set_webhook(
+                url=f"{self.webhook_url}{self.webhook_path}",
+                secret_token=self.webhook_secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        logger.info(f"Фронтенд шардирования: веб-хук установлен, воркеров {self.shard_count} (порты с {self.base_port})")
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def process_webhook_update(self, data: Dict[str, Any]) -> None:
+        """Переслать обновление воркеру своего шарда (ошибка — веб-хук ответит 503)"""
+        shard = self.shard_for(data)
+        response = await self._client.post(
+            f"http://127.0.0.1:{self.base_port + shard}{INTERNAL_UPDATE_PATH}",
+            json=data,
+            headers={SHARD_SECRET_HEADER: self.internal_secret},
+        )
+        response.raise_for_status()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Проверка разбора текстовой записи еды (FoodDatabase.parse_meal): граммы и штуки,
+множитель после названия, множественное число и отказ от неправдоподобных количеств
+"""
+from services.food_database import FoodDatabase
+
+db = FoodDatabase()
+
+
+def parse_one(text: str):
+    items, unknown, implausible = db.parse_meal(text)
+    assert not unknown and not implausible, (unknown, implausible)
+    assert len(items) == 1, items
+    return items[0]
+
+
+def test_grams_and_weight_units():
+    assert parse_one("200g rice").weight_grams == 200
+    assert parse_one("1.5 kg rice").weight_grams == 1500
+    assert parse_one("rice 200").weight_grams == 200  # число без единиц у продукта на развес — граммы
+
+
+def test_pieces_use_piece_weight():
+    egg = parse_one("2 eggs")
+    assert egg.food_name == "egg"
+    assert egg.weight_grams == 100
+    assert parse_one("2 pcs apple").weight_grams == 360
+    assert parse_one("an apple").weight_grams == 180
+
+
+def test_trailing_multiplier():
+    assert parse_one("apple x2").weight_grams == 360
+    assert parse_one("apples x 2").weight_grams == 360
+    assert parse_one("2x apple").weight_grams == 360
+    assert parse_one("eggs 2").weight_grams == 100
+
+
+def test_plurals():
+    assert parse_one("3 bananas").food_name == "banana"
+    assert parse_one("apples").food_name == "apple"
+
+
+def test_several_items_and_unknown():
+    items, unknown, implausible = db.parse_meal("200g rice, 2 eggs and qwzx")
+    assert [item.food_name for item in items] == ["rice", "egg"]
+    assert unknown == ["qwzx"]
+    assert implausible == []
+
+
+def test_implausible_amounts_rejected():
+    for text in ("7kg rice", "ice cream 99999", "100 eggs"):
+        items, unknown, implausible = db.parse_meal(text)
+        assert items == [] and implausible == [text], text
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Проверка локального фильтра фото (FoodPhotoGate) на синтетических изображениях:
+по одному примеру на каждую причину отказа и фото еды, которые должны пройти
+"""
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from services.food_photo_gate import FoodPhotoGate
+
+gate = FoodPhotoGate()
+
+
+def encode(image: Image.Image, image_format: str = "JPEG") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def food_photo() -> Image.Image:
+    """Пестрая еда: много цветов и деталей"""
+    rnd = random.Random(1)
+    image = Image.new("RGB", (640, 480), (200, 180, 150))
+    draw = ImageDraw.Draw(image)
+    for _ in range(400):
+        x, y, r = rnd.randint(0, 640), rnd.randint(0, 480), rnd.randint(3, 25)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(rnd.randint(60, 255), rnd.randint(40, 200), rnd.randint(0, 120)))
+    return image.filter(ImageFilter.GaussianBlur(1))
+
+
+def soup_photo() -> Image.Image:
+    """Суп с гладким градиентом в белой тарелке на однотонном фоне"""
+    image = Image.new("RGB", (640, 480), (235, 230, 220))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((120, 60, 520, 420), fill=(250, 250, 250))
+    for r in range(170, 0, -1):
+        c = int(200 - r * 0.6)
+        draw.ellipse((320 - r, 240 - r, 320 + r, 240 + r), fill=(c, int(c * 0.55), 40))
+    return image
+
+
+def screenshot() -> Image.Image:
+    """Экран мессенджера: заливки, панель и текст"""
+    image = Image.new("RGB", (720, 1280), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 720, 120), fill=(36, 129, 204))
+    for i in range(12):
+        y = 160 + i * 90
+        draw.rectangle((40, y, 680, y + 60), fill=(240, 240, 240))
+        draw.text((60, y + 20), f"Message text number {i}", fill=(0, 0, 0))
+    return image
+
+
+def blurry_photo() -> Image.Image:
+    """Сильно размытый кадр: есть перепад яркости, но нет деталей"""
+    image = Image.new("RGB", (640, 480), (70, 60, 50))
+    ImageDraw.Draw(image).rectangle((320, 0, 640, 480), fill=(190, 170, 140))
+    return image.filter(ImageFilter.GaussianBlur(60))
+
+
+def test_food_passes():
+    assert gate.check(encode(food_photo())) is None
+    assert gate.check(encode(food_photo(), "PNG")) is None
+
+
+def test_smooth_soup_is_not_screenshot():
+    assert gate.check(encode(soup_photo())) is None
+    assert gate.check(encode(soup_photo(), "PNG")) is None
+
+
+def test_screenshot_rejected():
+    assert gate.check(encode(screenshot())) == "screenshot"
+    assert gate.check(encode(screenshot(), "PNG")) == "screenshot"
+
+
+def test_dark_rejected():
+    assert gate.check(encode(Image.new("RGB", (400, 300), (8, 8, 10)))) == "too_dark"
+
+
+def test_blank_rejected():
+    assert gate.check(encode(Image.new("RGB", (400, 300), (128, 128, 128)))) == "blank"
+
+
+def test_blurry_rejected():
+    assert gate.check(encode(blurry_photo())) == "blurry"
+
+
+def test_broken_image_passes_to_api():
+    assert gate.check(b"not an image") is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
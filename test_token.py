@@ -7,12 +7,10 @@ import asyncio
 import logging
 from telegram import Bot
 from config.settings import settings
+from utils.logging_setup import setup_logging
 
 # Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 async def test_bot_token():
@@ -0,0 +1,9 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from config.settings import settings
+
+
+def local_today() -> date:
+    """Текущая дата в часовом поясе бота (settings.TIMEZONE), а не сервера или UTC"""
+    return datetime.now(ZoneInfo(settings.TIMEZONE)).date()
@@ -0,0 +1,133 @@
+"""
+Логирование через очередь: обработчики только кладут запись в queue.Queue,
+а форматирование и вывод в stdout выполняет поток QueueListener.
+
+К записям добавляются поля обновления (update_id, user, route, latency_ms) из
+контекста задачи — их задает PerChatUpdateProcessor и сами обработчики через
+bind_log_context(). DEBUG-записи прореживаются по маршруту: из каждых
+LOG_DEBUG_SAMPLE_EVERY проходит одна.
+"""
+import atexit
+import copy
+import itertools
+import logging
+import queue
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator, Optional
+
+from config.settings import settings
+
+LOG_FIELDS = ("update_id", "user", "route", "latency_ms")
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Поля текущего обновления; словарь общий для задачи обновления и ее to_thread-вызовов
+_log_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_context", default=None)
+_listener: Optional[QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[Dict[str, Any]]:
+    """Область одного обновления: поля добавляются ко всем записям внутри нее"""
+    current = dict(_log_context.get() or {}, **fields)
+    token = _log_context.set(current)
+    try:
+        yield current
+    finally:
+        _log_context.reset(token)
+
+
+def bind_log_context(**fields: Any) -> None:
+    """Дополнить поля текущего обновления (например, route после разбора callback_data)"""
+    current = _log_context.get()
+    if current is not None:
+        current.update(fields)
+
+
+class ContextFieldsFilter(logging.Filter):
+    """Переносит поля обновления в запись (extra=... в вызове имеет приоритет)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = _log_context.get()
+        if fields:
+            for key, value in fields.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class RouteSamplingFilter(logging.Filter):
+    """Пропускает каждую `every`-ю DEBUG-запись маршрута; INFO и выше — всегда"""
+
+    def __init__(self, every: int) -> None:
+        super().__init__()
+        self.every = max(every, 1)
+        self._counters: Dict[str, Iterator[int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        route = getattr(record, "route", None) or record.name
+        counter = self._counters.get(route)
+        if counter is None:
+            counter = self._counters.setdefault(route, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class DeferredFormatQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() форматирует запись целиком (включая traceback) прямо в
+    месте вызова логгера. Здесь только подставляются аргументы в сообщение (их объекты
+    могут измениться до записи), а время, поля обновления и traceback оформляет
+    форматтер потока QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """Обычный формат репозитория плюс `| key=value` для полей обновления"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = [f"{key}={getattr(record, key)}" for key in LOG_FIELDS if getattr(record, key, None) is not None]
+        if not fields:
+            return line
+        # Traceback остается последним, поля — в первой строке
+        head, sep, tail = line.partition("\n")
+        return f"{head} | {' '.join(fields)}{sep}{tail}"
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """Настроить корневой логгер (вместо logging.basicConfig в точках входа); повторный вызов ничего не делает"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(LOG_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    handler = DeferredFormatQueueHandler(log_queue)
+    handler.addFilter(ContextFieldsFilter())
+    handler.addFilter(RouteSamplingFilter(settings.LOG_DEBUG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level or settings.LOG_LEVEL)
+    # httpx пишет INFO на каждый вызов Bot API
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Дописать очередь при выходе процесса
+    atexit.register(_listener.stop)
@@ -0,0 +1,29 @@
+import logging
+from typing import Optional, Tuple
+
+from telegram import Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+async def finish_status_message(bot, chat_id: int, message_id: Optional[int], text: str, **kwargs) -> Tuple[Optional[Message], int]:
+    """Превратить сообщение о загрузке («🔍 Analyzing image...») в итоговый ответ.
+
+    Одна правка вместо удаления заглушки и отправки нового сообщения; клавиатура
+    передается в той же правке. Новое сообщение отправляется, только если правка
+    невозможна (заглушку удалили, сообщения нет). Возвращает сообщение и число
+    сделанных вызовов Bot API.
+    """
+    if message_id is not None:
+        try:
+            message = await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
+            return (message if isinstance(message, Message) else None), 1
+        except BadRequest as e:
+            if "message is not modified" in str(e).lower():
+                return None, 1
+            logger.warning(f"Не удалось изменить сообщение о загрузке, отправляем новое: {e}")
+            message = await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            return message, 2
+    message = await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+    return message, 1
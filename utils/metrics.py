@@ -0,0 +1,32 @@
+import threading
+from collections import Counter
+from typing import Dict
+
+
+class Metrics:
+    """Простые счетчики в памяти процесса.
+
+    Потокобезопасны: инкременты приходят и из event loop, и из потоков `asyncio.to_thread`.
+    """
+
+    def __init__(self) -> None:
+        self._counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1) -> int:
+        """Увеличить счетчик и вернуть новое значение"""
+        with self._lock:
+            self._counters[name] += value
+            return self._counters[name]
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+
+    def snapshot(self) -> Dict[str, int]:
+        """Копия всех счетчиков (для логов и health-эндпоинтов)"""
+        with self._lock:
+            return dict(self._counters)
+
+
+metrics = Metrics()
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, Hashable, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Корзина токенов: `rate` запросов в секунду с запасом на всплеск `capacity`"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены `seconds` секунд (ответ 429 с retry_after)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def idle(self) -> bool:
+        """Корзина полна и не на паузе — ее можно выбросить без потери состояния"""
+        now = time.monotonic()
+        self._refill(now)
+        return self._tokens >= self.capacity and now >= self._paused_until
+
+    def reserve(self) -> float:
+        """Списать токен и вернуть, сколько секунд ждать до отправки.
+
+        Токен списывается сразу (баланс может уйти в минус), поэтому конкурентные
+        запросы выстраиваются в очередь по времени без отдельной блокировки.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+        return max(self._paused_until - now, 0.0, -self._tokens / self.rate)
+
+    def refund(self) -> None:
+        """Вернуть токен запроса, который так и не был отправлен"""
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class _EditSlot:
+    """Правки одного сообщения в ожидании: номер последней, future ее результата, число ждущих.
+
+    `queued` — правка, которая сейчас ждет токенов (событие ее вытеснения и списанные
+    корзины): новая правка будит ее и возвращает токены до того, как списать свои.
+    """
+
+    __slots__ = ("generation", "future", "waiters", "queued")
+
+    def __init__(self) -> None:
+        self.generation = 0
+        self.future: Optional[asyncio.Future] = None
+        self.waiters = 0
+        self.queued: Optional[Tuple[asyncio.Event, Tuple[TokenBucket, ...]]] = None
+
+    def supersede_queued(self) -> None:
+        if self.queued is not None:
+            superseded, buckets = self.queued
+            self.queued = None
+            for bucket in buckets:
+                bucket.refund()
+            superseded.set()
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """Ограничитель исходящих запросов Bot API (подключается в ApplicationBuilder.rate_limiter).
+
+    Через него проходят все вызовы бота — ответы хендлеров, очереди анализа и
+    мониторов. Запросы с chat_id ограничиваются общей корзиной и корзиной чата
+    (в группах лимит Telegram ниже, чем в личке). На 429 ждем retry_after и
+    повторяем запрос; пауза ставится на чат, а без chat_id — на всех.
+
+    Быстрые последовательные правки одного сообщения схлопываются: если, пока
+    правка ждет своей очереди, пришла более новая, старая не отправляется,
+    возвращает свои токены (новая правка не ждет за нее) и получает результат новой.
+
+    `rate_limit_args` вызова: {"max_retries": N} переопределяет число повторов.
+    """
+
+    COALESCED_ENDPOINTS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        private_chat_rate: float = 1,
+        group_chat_rate: float = 20 / 60,
+        chat_burst: float = 3,
+        max_retries: int = 2,
+    ) -> None:
+        self.global_rate = global_rate
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        self._edits: Dict[Tuple[Hashable, Any], _EditSlot] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                self._chats = {key: b for key, b in self._chats.items() if not b.idle()}
+            # Отрицательные id — группы и каналы (20 сообщений в минуту)
+            is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            bucket = TokenBucket(self.group_chat_rate if is_group else self.private_chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    @staticmethod
+    def _retry_after_seconds(error: RetryAfter) -> float:
+        retry_after = error.retry_after
+        return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+    async def _wait_edit_turn(self, edit_key: Tuple[Hashable, Any], generation: int) -> None:
+        """Дождаться токенов для правки; раньше срока — если ее вытеснила более новая"""
+        slot = self._edits[edit_key]
+        if slot.generation != generation:
+            return
+        buckets = (self._chat_bucket(edit_key[0]), self._global)
+        delay = max(bucket.reserve() for bucket in buckets)
+        if delay <= 0:
+            return
+        superseded = asyncio.Event()
+        slot.queued = (superseded, buckets)
+        try:
+            await asyncio.wait_for(superseded.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Вызов отменен, пока ждал очереди — токены ему больше не нужны
+            if slot.queued is not None and slot.queued[0] is superseded:
+                slot.supersede_queued()
+            raise
+        finally:
+            if slot.queued is not None and slot.queued[0] is superseded:
+                slot.queued = None
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        max_retries = (rate_limit_args or {}).get("max_retries", self.max_retries)
+
+        edit_key = None
+        generation, result_future = 0, None
+        if endpoint in self.COALESCED_ENDPOINTS and chat_id is not None and data.get("message_id") is not None:
+            edit_key = (chat_id, data["message_id"])
+            slot = self._edits.setdefault(edit_key, _EditSlot())
+            slot.supersede_queued()
+            slot.generation += 1
+            slot.waiters += 1
+            generation = slot.generation
+            result_future = slot.future = asyncio.get_running_loop().create_future()
+            # Исключение и так получает вызывающий — не даем asyncio ругаться на непрочитанное
+            result_future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        try:
+            for attempt in range(max_retries + 1):
+                if edit_key is not None:
+                    await self._wait_edit_turn(edit_key, generation)
+                elif chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire()
+                    await self._global.acquire()
+
+                try:
+                    slot = self._edits.get(edit_key) if edit_key is not None else None
+                    if slot is not None and slot.generation != generation:
+                        # Пока ждали очереди, пришла более новая правка — отправится только она,
+                        # а ее результат получат и все более старые правки по цепочке
+                        metrics.increment("telegram_edits_coalesced_total")
+                        result = await asyncio.shield(slot.future)
+                    else:
+                        result = await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    delay = self._retry_after_seconds(e)
+                    metrics.increment("telegram_retry_after_total")
+                    if attempt >= max_retries:
+                        raise
+                    logger.warning(f"Telegram flood limit на {endpoint} (чат {chat_id}), ждем {delay} с")
+                    (self._chat_bucket(chat_id) if chat_id is not None else self._global).pause(delay)
+                    if chat_id is None:
+                        await asyncio.sleep(delay)
+                    continue
+
+                if result_future is not None and not result_future.done():
+                    result_future.set_result(result)
+                return result
+        except BaseException as e:
+            if result_future is not None and not result_future.done():
+                if isinstance(e, Exception):
+                    result_future.set_exception(e)
+                else:
+                    result_future.cancel()
+            raise
+        finally:
+            if edit_key is not None:
+                slot = self._edits[edit_key]
+                slot.waiters -= 1
+                if not slot.waiters:
+                    del self._edits[edit_key]
@@ -0,0 +1,60 @@
+import itertools
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class ReportCache:
+    """Кэш отрендеренных отчетов (экраны «Today» / «Week») в памяти процесса.
+
+    Запись хранится по ключу (пользователь, период) вместе с версией данных
+    пользователя. Любая запись еды, воды или целей увеличивает версию, и старый
+    текст перестает совпадать — отдельная инвалидация не нужна. Версию нужно
+    взять до загрузки данных и передать в put(): если за время загрузки данные
+    изменились, устаревший отчет не сохраняется.
+
+    И записи, и версии ограничены, самые давние вытесняются первыми (LRU). Версии
+    берутся из общего возрастающего счетчика; у пользователя без сохраненной версии
+    она равна последней вытесненной, поэтому версия пользователя никогда не
+    уменьшается и вытеснение не может «воскресить» старый отчет.
+    """
+
+    def __init__(self, max_entries: int = 5000) -> None:
+        self.max_entries = max_entries
+        self._clock = itertools.count(1)
+        self._floor = 0
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        self._entries: "OrderedDict[Tuple[int, Hashable], Tuple[int, str]]" = OrderedDict()
+
+    def bump(self, telegram_id: int) -> None:
+        """Данные пользователя изменились — все его отчеты устарели"""
+        self._versions[telegram_id] = next(self._clock)
+        self._versions.move_to_end(telegram_id)
+        while len(self._versions) > self.max_entries:
+            _, version = self._versions.popitem(last=False)
+            self._floor = max(self._floor, version)
+
+    def version(self, telegram_id: int) -> int:
+        """Текущая версия данных пользователя (взять до загрузки отчета)"""
+        return self._versions.get(telegram_id, self._floor)
+
+    def get(self, telegram_id: int, period: Hashable) -> Optional[str]:
+        key = (telegram_id, period)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, text = entry
+        if version != self.version(telegram_id):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, telegram_id: int, period: Hashable, text: str, version: int) -> None:
+        """Сохранить отчет, построенный по данным версии `version`, если она еще актуальна"""
+        if version != self.version(telegram_id):
+            return
+        key = (telegram_id, period)
+        self._entries[key] = (version, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
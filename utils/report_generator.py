@@ -128,7 +128,7 @@ class ReportGenerator:
             return "❌ Report generation error"
     
     @staticmethod
-    def format_nutrition_result(nutrition_data: Dict[str, Any]) -> str:
+    def format_nutrition_result(nutrition_data: Dict[str, Any], title: str = "Analysis complete!") -> str:
         """Format single image analysis result"""
         try:
             food_name = nutrition_data.get('food_name', 'unknown')
@@ -144,7 +144,7 @@ class ReportGenerator:
             
             weight_line = f"⚖️ Weight: {weight_grams:.0f} g\n" if weight_grams else ""
             result = f"""
-🍽️ *Analysis complete!* {confidence_emoji}
+🍽️ *{title}* {confidence_emoji}
 
 📝 **Dish:** {food_name}
 
@@ -230,6 +230,7 @@ Send your first photo now! 🍽️
 
 🤖 **Features:**
 • Vision-based nutrition analysis
+• Text logging: "200g rice, 2 eggs"
 • Daily and weekly stats
 • Personal goals
 
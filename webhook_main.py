@@ -5,12 +5,10 @@ import uvicorn
 import logging
 import os
 from webhook_server import webhook_app
+from utils.logging_setup import setup_logging
 
 # Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
@@ -19,5 +17,7 @@ if __name__ == "__main__":
         webhook_app, 
         host="0.0.0.0", 
         port=int(os.getenv("PORT", 8001)),
-        log_level="info"
+        log_level="info",
+        # Логи uvicorn идут через очередь setup_logging
+        log_config=None
     )
@@ -1,11 +1,32 @@
+import hmac
 import uvicorn
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
 # Создаем FastAPI приложение для веб-хуков
 webhook_app = FastAPI()
+# BotApp (или ShardRouter фронтенда шардирования) подключается точкой входа (attach_bot),
+# пока его нет — /telegram и /internal/update отвечают 503
+webhook_app.state.bot_app = None
+
+
+def attach_bot(bot_app) -> None:
+    """Подключить получателя обновлений: BotApp (update_queue бота) или ShardRouter (пересылка воркерам)"""
+    webhook_app.state.bot_app = bot_app
+
+
+async def _deliver(bot_app, data: dict) -> Response:
+    try:
+        await bot_app.process_webhook_update(data)
+    except Exception as e:
+        # Telegram повторит доставку позже
+        logger.error(f"Ошибка передачи обновления {data.get('update_id')}: {e}")
+        raise HTTPException(status_code=503, detail="Update was not accepted")
+    return Response(status_code=200)
+
 
 @webhook_app.get("/health")
 async def health_check():
@@ -17,10 +38,50 @@ async def root():
     """Корневой endpoint"""
     return {"message": "TGCal Webhook Server", "health": "/health"}
 
+@webhook_app.post("/telegram/{secret}")
+async def telegram_webhook(
+    secret: str,
+    request: Request,
+    x_telegram_bot_api_secret_token: str = Header(default=""),
+):
+    """Прием обновлений Telegram: проверяем секрет в пути и в заголовке и ставим в очередь бота"""
+    bot_app = webhook_app.state.bot_app
+    if bot_app is None or bot_app.intake != "webhook":
+        raise HTTPException(status_code=503, detail="Bot is not running in webhook mode")
+
+    expected = bot_app.webhook_secret
+    if not (hmac.compare_digest(secret, expected) and hmac.compare_digest(x_telegram_bot_api_secret_token, expected)):
+        logger.warning("Отклонен запрос на веб-хук Telegram с неверным секретом")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    # Отвечаем сразу после постановки в очередь: обработка идет в Application,
+    # а долгий ответ заставил бы Telegram повторять доставку
+    return await _deliver(bot_app, data)
+
+@webhook_app.post("/internal/update")
+async def internal_update(request: Request, x_shard_secret: str = Header(default="")):
+    """Обновление, пересланное фронтендом шардирования воркеру своего шарда"""
+    bot_app = webhook_app.state.bot_app
+    if bot_app is None or bot_app.intake != "forwarded":
+        raise HTTPException(status_code=503, detail="Bot is not running as a shard worker")
+    if not settings.SHARD_INTERNAL_SECRET or not hmac.compare_digest(x_shard_secret, settings.SHARD_INTERNAL_SECRET):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    return await _deliver(bot_app, data)
+
 def run_webhook_server(host="0.0.0.0", port=8001):
     """Запустить сервер веб-хуков"""
     logger.info(f"Запуск сервера веб-хуков на {host}:{port}")
     uvicorn.run(webhook_app, host=host, port=port)
 
 if __name__ == "__main__":
-    run_webhook_server()
\ No newline at end of file
+    run_webhook_server()